@@ -1,31 +1,61 @@
-from flask import Flask, render_template, request, send_file, jsonify, Response, stream_with_context, send_from_directory
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, send_from_directory
 import os
 import re
 import tempfile
-from pytube import YouTube
-import instaloader
-import requests
 import json
 import time
-import yt_dlp
 import threading
-import queue
 import logging
-import datetime
+import copy
+import random
+import contextlib
+from scheduler import DownloadScheduler, QueueFullError
+from job_registry import JobRegistry
+from job_store import make_job_store
+from caches import MetadataCache, ResultCache, canonical_media_id
+from storage import PARTIAL_FILE_PATTERN, FinalizeStats, StorageManager, publish_file
+from job_journal import JobJournal
+from batch_download import BatchRunner
+from download_history import DownloadHistory
+from file_delivery import (content_disposition, media_mimetype, partial_file_ext, stream_file_response,
+                           tail_growing_file)
+from format_planner import plan_download
+from lazy_imports import LazyModule
+from toolchain import ToolchainRegistry
+from extractor_sessions import ExtractorSessions
+from retry_engine import CircuitOpenError, RetryEngine, classify_error, host_key
+from metrics import MetricsRegistry
+from job_trace import JobTracer
+from sampling_profiler import SamplingProfiler
+from zip_stream import ZipMember, stream_zip, zip_size
+from ranged_download import ConnectionBudget, fetch_ranged, probe_range_support
 
 app = Flask(__name__)
 TEMP_DIR = tempfile.gettempdir()
 
-# Global progress tracking
-download_progress = {}
-progress_queue = queue.Queue()
+# Global progress tracking (finished jobs expire after JOB_TTL seconds).
+# JOB_STORE=sqlite shares job state between gunicorn workers; 'memory' keeps it per process.
+JOB_STORE = os.environ.get('JOB_STORE', 'sqlite')
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', os.path.join('/tmp', 'jobs.sqlite3'))
+download_jobs = JobRegistry(
+    ttl=int(os.environ.get('JOB_TTL', 3600)),
+    max_finished=int(os.environ.get('MAX_FINISHED_JOBS', 1000)),
+    store=make_job_store(JOB_STORE, JOB_STORE_PATH),
+)
 
 # Add this at the top of your file
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
-# Disable yt-dlp debug output more aggressively
-yt_dlp.utils.bug_reports_message = lambda: ''
+def quiet_yt_dlp(module):
+    # Disable yt-dlp debug output more aggressively
+    module.utils.bug_reports_message = lambda: ''
+
+# yt-dlp and its extractors load with the first job or info request, not at startup
+yt_dlp = LazyModule('yt_dlp', on_load=quiet_yt_dlp)
+
+# ffmpeg/ffprobe presence, version, encoders and muxers; probed on first use, then cached
+toolchain = ToolchainRegistry()
 
 # Create a custom logger for yt-dlp
 class QuietLogger:
@@ -39,7 +69,7 @@ class QuietLogger:
         pass
 
 # Create a static downloads directory if it doesn't exist
-DOWNLOADS_DIR = os.path.join('/tmp', 'downloads')
+DOWNLOADS_DIR = os.environ.get('DOWNLOADS_DIR', os.path.join('/tmp', 'downloads'))
 if not os.path.exists(DOWNLOADS_DIR):
     os.makedirs(DOWNLOADS_DIR, exist_ok=True)
 
@@ -48,53 +78,276 @@ LOGS_DIR = os.path.join('/tmp', 'logs')
 if not os.path.exists(LOGS_DIR):
     os.makedirs(LOGS_DIR, exist_ok=True)
 
+# Structured download history behind /logs
+HISTORY_DB_PATH = os.environ.get('HISTORY_DB_PATH', os.path.join(LOGS_DIR, 'history.sqlite3'))
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
 
-# Custom progress hook for yt-dlp
-def progress_hook(d):
-    try:
-        if d['status'] == 'downloading':
-            download_id = d.get('info_dict', {}).get('id', 'video')
-            
-            # If we don't have a proper download_id, try to find it
-            if download_id == 'video' and len(download_progress) > 0:
-                # Use the most recent download_id
-                download_id = list(download_progress.keys())[-1]
-            
-            # Calculate progress percentage
-            percent = 0
-            if 'total_bytes' in d and d['total_bytes'] > 0:
-                percent = int(100 * d['downloaded_bytes'] / d['total_bytes'])
-            elif 'total_bytes_estimate' in d and d['total_bytes_estimate'] > 0:
-                percent = int(100 * d['downloaded_bytes'] / d['total_bytes_estimate'])
-            
-            # Always update progress to ensure UI is responsive
-            if download_id in download_progress:
-                download_progress[download_id].update({
-                    'percent': percent,
-                    'speed': d.get('speed', 0),
-                    'eta': d.get('eta', 0),
-                    'filename': d.get('filename', '')
-                })
-        
-        elif d['status'] == 'finished':
-            download_id = d.get('info_dict', {}).get('id', 'video')
-            
-            # If we don't have a proper download_id, try to find it
-            if download_id == 'video' and len(download_progress) > 0:
-                # Use the most recent download_id
-                download_id = list(download_progress.keys())[-1]
+# Journal of unfinished jobs, resumed from their partial files after a restart.
+# Journaled media info older than JOURNAL_INFO_MAX_AGE is re-extracted (stream URLs expire).
+JOURNAL_DIR = os.environ.get('JOURNAL_DIR', os.path.join('/tmp', 'journal'))
+JOURNAL_INFO_MAX_AGE = int(os.environ.get('JOURNAL_INFO_MAX_AGE', 3 * 3600))
+
+# Disk budget shared by downloads in TEMP_DIR and DOWNLOADS_DIR. Above the high watermark
+# (or below STORAGE_MIN_FREE_BYTES of free disk) least recently served files are evicted
+# down to the low watermark; orphaned partial files are swept after PARTIAL_FILE_MAX_AGE.
+STORAGE_MAX_BYTES = int(os.environ.get('STORAGE_MAX_BYTES', 10 * 1024 ** 3))
+STORAGE_HIGH_WATERMARK = float(os.environ.get('STORAGE_HIGH_WATERMARK', 0.9))
+STORAGE_LOW_WATERMARK = float(os.environ.get('STORAGE_LOW_WATERMARK', 0.75))
+STORAGE_MIN_FREE_BYTES = int(os.environ.get('STORAGE_MIN_FREE_BYTES', 512 * 1024 ** 2))
+STORAGE_CHECK_INTERVAL = float(os.environ.get('STORAGE_CHECK_INTERVAL', 60))
+PARTIAL_FILE_MAX_AGE = int(os.environ.get('PARTIAL_FILE_MAX_AGE', 3600))
+# Job IDs appear in temp file names, which ties files to the jobs writing them
+JOB_ID_IN_FILENAME = re.compile(r'(?:yt|ig)_[0-9a-f]{16}')
+
+# Download worker pool limits (override with environment variables)
+MAX_DOWNLOAD_WORKERS = int(os.environ.get('MAX_DOWNLOAD_WORKERS', 4))
+MAX_QUEUED_DOWNLOADS = int(os.environ.get('MAX_QUEUED_DOWNLOADS', 32))
+PLATFORM_CONCURRENCY = {
+    'youtube': int(os.environ.get('YOUTUBE_CONCURRENCY', 3)),
+    'instagram': int(os.environ.get('INSTAGRAM_CONCURRENCY', 2)),
+}
+
+# Merges, remuxes and transcodes run in their own pool (one worker per core by default)
+# once a job's bytes are on disk, so download workers never sit waiting on ffmpeg
+POSTPROCESS_WORKERS = int(os.environ.get('POSTPROCESS_WORKERS', os.cpu_count() or 2))
+MAX_QUEUED_POSTPROCESSING = int(os.environ.get('MAX_QUEUED_POSTPROCESSING', 32))
+
+# Finished artifacts kept for repeat requests (bytes on disk / number of entries)
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 5 * 1024 ** 3))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 500))
+CACHED_JOB_FIELDS = ('file_path', 'static_path', 'title', 'format', 'platform', 'url', 'duration', 'description')
+
+# Batch downloads: how many items of one batch run at once (clients may ask for up to
+# MAX_BATCH_PARALLELISM) and how many entries a batch or playlist may expand to
+BATCH_PARALLELISM = int(os.environ.get('BATCH_PARALLELISM', 4))
+MAX_BATCH_PARALLELISM = int(os.environ.get('MAX_BATCH_PARALLELISM', 8))
+MAX_BATCH_ITEMS = int(os.environ.get('MAX_BATCH_ITEMS', 500))
+
+# Extracted media info shared between /api/info and /download
+METADATA_CACHE_TTL = int(os.environ.get('METADATA_CACHE_TTL', 600))
+METADATA_CACHE_MAX_ENTRIES = int(os.environ.get('METADATA_CACHE_MAX_ENTRIES', 256))
+
+# File delivery: 'stream' (chunked from Python), 'x-sendfile' (Apache/lighttpd/gunicorn
+# front-ends) or 'x-accel' (nginx internal location aliasing DOWNLOADS_DIR)
+FILE_DELIVERY_MODE = os.environ.get('FILE_DELIVERY_MODE', 'stream')
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/protected-downloads')
+FILE_CHUNK_SIZE = int(os.environ.get('FILE_CHUNK_SIZE', 256 * 1024))
+# How long /stream waits for a queued job to start downloading
+STREAM_START_TIMEOUT = float(os.environ.get('STREAM_START_TIMEOUT', 60))
+
+# Parallel downloading: DASH/HLS fragments and byte ranges of large single files are
+# fetched over several connections; clients may ask for up to MAX_CONNECTIONS_PER_JOB
+DOWNLOAD_CONNECTIONS = int(os.environ.get('DOWNLOAD_CONNECTIONS', 4))
+MAX_CONNECTIONS_PER_JOB = int(os.environ.get('MAX_CONNECTIONS_PER_JOB', 8))
+MAX_TOTAL_CONNECTIONS = int(os.environ.get('MAX_TOTAL_CONNECTIONS', 16))
+RANGED_PIECE_SIZE = int(os.environ.get('RANGED_PIECE_SIZE', 4 * 1024 * 1024))
+# Files smaller than this are not worth splitting
+RANGED_MIN_BYTES = int(os.environ.get('RANGED_MIN_BYTES', 16 * 1024 * 1024))
+
+# Server-Sent Events tuning (seconds)
+SSE_HEARTBEAT_INTERVAL = float(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))
+SSE_MIN_INTERVAL = float(os.environ.get('SSE_MIN_INTERVAL', 0.25))
+SSE_RETRY_MS = 3000
+CLIENT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+# Opt-in sampling profiler: jobs submitted with profile=1, plus this fraction of all
+# jobs, get their stacks sampled every PROFILE_INTERVAL seconds. Profiles are written
+# to PROFILE_DIR as <job id>.folded (collapsed stacks, for flamegraph.pl or speedscope).
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.01))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join('/tmp', 'profiles'))
+
+# Browser whose cookies authenticate extraction and downloads, per platform (others run anonymously)
+EXTRACTION_COOKIES = {'youtube': ('chrome',)}
+
+# Extractor sessions: browser cookies are re-read every COOKIE_REFRESH_INTERVAL seconds,
+# and up to EXTRACTOR_POOL_SIZE warm info extractors are kept per platform
+COOKIE_REFRESH_INTERVAL = float(os.environ.get('COOKIE_REFRESH_INTERVAL', 1800))
+EXTRACTOR_POOL_SIZE = int(os.environ.get('EXTRACTOR_POOL_SIZE', 4))
+
+# Retries back off exponentially per host from RETRY_BASE_DELAY up to RETRY_MAX_DELAY seconds;
+# CIRCUIT_FAILURE_THRESHOLD blocking errors in a row (bot checks, 403, 429) stop all attempts
+# on that host for CIRCUIT_COOLDOWN seconds
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', 1.0))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', 60))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_COOLDOWN = float(os.environ.get('CIRCUIT_COOLDOWN', 300))
+
+def remove_cached_artifact(entry):
+    """Delete the files of an artifact evicted from the result cache"""
+    paths = [entry.get('file_path'), os.path.join(DOWNLOADS_DIR, os.path.basename(entry.get('static_path') or ''))]
+    for path in paths:
+        try:
+            if path and os.path.isfile(path):
+                os.remove(path)
+        except OSError as e:
+            logger.error(f"Error removing cached file {path}: {str(e)}")
+
+result_cache = ResultCache(
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    on_evict=remove_cached_artifact,
+)
+
+finalize_stats = FinalizeStats()
+
+connection_budget = ConnectionBudget(max_connections=MAX_TOTAL_CONNECTIONS)
+
+# Shared cookie jars, TLS contexts and extractor state for every YoutubeDL the app creates
+extractor_sessions = ExtractorSessions(
+    template_params={'quiet': True, 'no_warnings': True, 'logger': QuietLogger()},
+    refresh_interval=COOKIE_REFRESH_INTERVAL,
+    max_idle=EXTRACTOR_POOL_SIZE,
+    http_pool_size=MAX_TOTAL_CONNECTIONS,
+)
+
+retry_engine = RetryEngine(
+    base_delay=RETRY_BASE_DELAY,
+    max_delay=RETRY_MAX_DELAY,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    cooldown=CIRCUIT_COOLDOWN,
+)
+
+job_journal = JobJournal(JOURNAL_DIR)
+
+download_history = DownloadHistory(HISTORY_DB_PATH)
+
+storage_manager = StorageManager(
+    directories={TEMP_DIR: ('youtube_', 'instagram_'), DOWNLOADS_DIR: None},
+    max_bytes=STORAGE_MAX_BYTES,
+    high_watermark=STORAGE_HIGH_WATERMARK,
+    low_watermark=STORAGE_LOW_WATERMARK,
+    min_free_bytes=STORAGE_MIN_FREE_BYTES,
+    interval=STORAGE_CHECK_INTERVAL,
+    partial_max_age=PARTIAL_FILE_MAX_AGE,
+    # Journaled jobs are exactly the unfinished ones, in every worker process
+    live_job_ids=job_journal.job_ids,
+    job_id_pattern=JOB_ID_IN_FILENAME,
+    on_evict=result_cache.forget_files,
+    # Kept out of the managed directories so the lock file itself is never evicted
+    lock_path=os.path.join(JOURNAL_DIR, '.storage.lock'),
+)
+storage_manager.start()
+
+metadata_cache = MetadataCache(ttl=METADATA_CACHE_TTL, max_entries=METADATA_CACHE_MAX_ENTRIES)
+
+download_scheduler = DownloadScheduler(
+    max_workers=MAX_DOWNLOAD_WORKERS,
+    max_queue=MAX_QUEUED_DOWNLOADS,
+    platform_limits=PLATFORM_CONCURRENCY,
+)
+
+# Second pipeline stage; a full queue holds the download worker back rather than failing the job
+postprocess_scheduler = DownloadScheduler(
+    max_workers=POSTPROCESS_WORKERS,
+    max_queue=MAX_QUEUED_POSTPROCESSING,
+    name='postprocess',
+)
+
+# Per-job timing spans, stored on the job and served at /trace/<id>
+job_tracer = JobTracer(publish=lambda job_id, trace: download_jobs.update(job_id, trace=trace))
+
+sampling_profiler = SamplingProfiler(interval=PROFILE_INTERVAL)
+
+# Exported at /metrics
+metrics = MetricsRegistry(prefix='downloader_')
+stage_seconds = metrics.histogram('stage_seconds', "Time spent in each stage of a job",
+                                  labels=('stage',))
+bytes_total = metrics.counter('bytes_total', "Media bytes downloaded from sources and served to clients",
+                              labels=('direction',))
+jobs_finished = metrics.counter('jobs_finished_total', "Jobs that finished, by platform and outcome",
+                                labels=('platform', 'status'))
+errors_total = metrics.counter('errors_total', "Failed jobs and rejected requests by error class",
+                               labels=('error_class',))
+retries_total = metrics.counter('retries_total', "Download attempts retried, by error class",
+                                labels=('error_class',))
+metrics.gauge_callback('circuit_open', "Hosts currently refused by the circuit breaker", labels=('host',),
+                       collect=lambda: {host: 1 for host, state in retry_engine.stats()['hosts'].items()
+                                        if state['state'] != 'closed'})
+metrics.gauge_callback('queue_depth', "Jobs waiting for a worker", labels=('pool',),
+                       collect=lambda: {'download': download_scheduler.stats()['queued'],
+                                        'postprocess': postprocess_scheduler.stats()['queued']})
+metrics.gauge_callback('active_jobs', "Jobs running on a download worker", labels=('platform',),
+                       collect=lambda: download_scheduler.stats()['active'])
+metrics.gauge_callback('postprocess_active_jobs', "Jobs running on a postprocessing worker",
+                       collect=lambda: sum(postprocess_scheduler.stats()['active'].values()))
+metrics.gauge_callback('sse_subscribers', "Open progress subscriptions",
+                       collect=lambda: download_jobs.stats()['subscribers'])
+metrics.gauge_callback('tracked_jobs', "Jobs in the job store",
+                       collect=lambda: download_jobs.stats()['jobs'])
+metrics.counter_callback('cache_lookups_total', "Cache lookups by cache and result", labels=('cache', 'result'),
+                         collect=lambda: dict(
+                             [(('result', key), result_cache.stats()[key]) for key in ('hits', 'joins', 'misses')] +
+                             [(('metadata', key), metadata_cache.stats()[key]) for key in ('hits', 'misses')]))
+metrics.gauge_callback('connections_in_use', "Download connections in use",
+                       collect=lambda: connection_budget.stats()['in_use'])
+metrics.gauge_callback('storage_bytes', "Bytes used by downloads on disk",
+                       collect=lambda: storage_manager.stats()['usage_bytes'])
+
+
+# A single progressive HTTP format lands on disk in playback order,
+# so it can be streamed to clients while it is still downloading
+def is_passthrough_format(info_dict):
+    return 'requested_formats' not in info_dict and info_dict.get('protocol') in ('http', 'https')
+
+# Build a yt-dlp progress hook bound to a single download job.
+# With passthrough=True (no postprocessing planned) the job also exposes its
+# growing .part file for /stream.
+def make_progress_hook(download_id, passthrough=False):
+    last_write = {'at': 0}
+    
+    def progress_hook(d):
+        try:
+            if d['status'] == 'downloading':
+                # Every update is a store write; clients never see more than one per SSE_MIN_INTERVAL
+                now = time.monotonic()
+                if now - last_write['at'] < SSE_MIN_INTERVAL:
+                    return
+                last_write['at'] = now
+                
+                # Calculate progress percentage
+                percent = 0
+                if d.get('total_bytes'):
+                    percent = int(100 * d['downloaded_bytes'] / d['total_bytes'])
+                elif d.get('total_bytes_estimate'):
+                    percent = int(100 * d['downloaded_bytes'] / d['total_bytes_estimate'])
+                
+                info_dict = d.get('info_dict', {})
+                streamable = passthrough and is_passthrough_format(info_dict)
+                
+                download_jobs.update(download_id,
+                                     percent=percent,
+                                     speed=d.get('speed', 0),
+                                     eta=d.get('eta', 0),
+                                     filename=d.get('filename', ''),
+                                     downloaded_bytes=d.get('downloaded_bytes', 0),
+                                     total_bytes=d.get('total_bytes'),
+                                     streamable=streamable,
+                                     partial_path=d.get('tmpfilename') if streamable else None,
+                                     title=sanitize_filename(info_dict.get('title')),
+                                     status='downloading')
+                
+                # Remember how far we got, so a restart can resume from the partial file
+                job_journal.checkpoint(download_id,
+                                       partial_path=d.get('tmpfilename'),
+                                       downloaded_bytes=d.get('downloaded_bytes', 0),
+                                       total_bytes=d.get('total_bytes') or d.get('total_bytes_estimate'))
             
-            if download_id in download_progress:
-                download_progress[download_id].update({
-                    'percent': 100,
-                    'speed': 0,
-                    'eta': 0,
-                    'filename': d.get('filename', ''),
-                    'status': 'finished'
-                })
-    except Exception as e:
-        # Don't log the error to avoid terminal output
-        pass
+            elif d['status'] == 'finished':
+                bytes_total.inc(d.get('downloaded_bytes') or d.get('total_bytes') or 0, direction='downloaded')
+                download_jobs.update(download_id,
+                                     percent=100,
+                                     speed=0,
+                                     eta=0,
+                                     filename=d.get('filename', ''),
+                                     downloaded_bytes=d.get('downloaded_bytes', d.get('total_bytes', 0)),
+                                     status='finished')
+        except Exception as e:
+            # Don't log the error to avoid terminal output
+            pass
+    
+    return progress_hook
 
 # Format speed in human-readable form
 def format_speed(speed):
@@ -120,33 +373,114 @@ def format_eta(eta):
     else:
         return f"{eta//3600} hr {(eta%3600)//60} min"
 
+# Build the client-facing progress payload for a job snapshot
+def progress_payload(download_id, current):
+    if current is None:
+        return {'id': download_id, 'error': 'Download not found'}
+    if 'error' in current:
+        return {'id': download_id, 'error': current['error']}
+    if current.get('status') == 'complete':
+        return {'id': download_id, 'percent': 100, 'speed': 'Complete', 'eta': '0'}
+    if current.get('kind') == 'batch':
+        done = current.get('completed', 0) + current.get('failed', 0)
+        return {'id': download_id, 'percent': min(current.get('percent', 0), 99),
+                'speed': f"{done}/{current.get('total', 0)} items", 'eta': 'Unknown',
+                'completed': current.get('completed', 0), 'failed': current.get('failed', 0)}
+    if current.get('status') == 'queued':
+        position = current.get('queue_position', 0)
+        return {'id': download_id, 'percent': 0, 'speed': 'Queued', 'eta': f'Position {position} in queue', 'queue_position': position}
+    if current.get('status') == 'finished':
+        # Bytes are on disk but merging/copying is still running
+        return {'id': download_id, 'percent': 99, 'speed': 'Processing...', 'eta': 'Almost done'}
+    return {'id': download_id, 'percent': min(current.get('percent', 0), 99), 'speed': format_speed(current.get('speed')), 'eta': format_eta(current.get('eta'))}
+
+def is_final_payload(payload):
+    return 'error' in payload or payload.get('percent') == 100
+
 # Server-Sent Events endpoint for progress updates
 @app.route('/progress/<download_id>')
 def progress_stream(download_id):
     def generate():
-        last_percent = -1
-        yield f"data: {json.dumps({'id': download_id, 'percent': 0, 'speed': 'Starting...', 'eta': 'Calculating...'})}\n\n"
-        
-        while True:
-            # Check if download is complete
-            if download_id in download_progress:
-                if 'error' in download_progress[download_id]:
-                    # If there's an error, send it to the client
-                    yield f"data: {json.dumps({'id': download_id, 'error': download_progress[download_id]['error']})}\n\n"
+        with download_jobs.subscribe(download_id) as subscription:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            last_payload = None
+            last_sent = 0
+            while True:
+                changed = subscription.wait(timeout=SSE_HEARTBEAT_INTERVAL)
+                if not changed:
+                    # Keep proxies from closing an idle stream
+                    yield ": heartbeat\n\n"
+                    continue
+                
+                # Throttle per subscriber; updates arriving meanwhile are coalesced
+                delay = SSE_MIN_INTERVAL - (time.monotonic() - last_sent)
+                if delay > 0:
+                    time.sleep(delay)
+                
+                payload = progress_payload(download_id, download_jobs.get(download_id))
+                if payload != last_payload:
+                    yield f"data: {json.dumps(payload)}\n\n"
+                    last_payload = payload
+                    last_sent = time.monotonic()
+                
+                # Stop on completion, error, or unknown/evicted job
+                if is_final_payload(payload):
                     break
-                elif 'percent' in download_progress[download_id] and download_progress[download_id]['percent'] == 100:
-                    # If download is complete
-                    yield f"data: {json.dumps({'id': download_id, 'percent': 100, 'speed': 'Complete', 'eta': '0'})}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Multiplexed Server-Sent Events endpoint: one stream for many downloads.
+# Watches the jobs listed in ?ids=a,b,c and/or every job started with ?client=<id>,
+# sending only the fields that changed since the last event for each job.
+@app.route('/progress')
+def progress_multiplex():
+    job_ids = [job_id for job_id in request.args.get('ids', '').split(',') if job_id]
+    client_id = request.args.get('client') or None
+    
+    if not job_ids and not client_id:
+        return jsonify({"error": "Provide ids or client"}), 400
+    if client_id and not CLIENT_ID_PATTERN.match(client_id):
+        return jsonify({"error": "Invalid client id"}), 400
+    
+    def generate():
+        with download_jobs.subscribe(job_ids, client_id=client_id) as subscription:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            last_payloads = {}
+            last_sent = 0
+            while True:
+                changed = subscription.wait(timeout=SSE_HEARTBEAT_INTERVAL)
+                if not changed:
+                    yield ": heartbeat\n\n"
+                    continue
+                
+                delay = SSE_MIN_INTERVAL - (time.monotonic() - last_sent)
+                if delay > 0:
+                    time.sleep(delay)
+                    # Pick up anything that changed while we were throttled
+                    changed |= subscription.wait(timeout=0)
+                
+                for download_id in sorted(changed):
+                    payload = progress_payload(download_id, download_jobs.get(download_id))
+                    previous = last_payloads.get(download_id, {})
+                    delta = {key: value for key, value in payload.items() if previous.get(key) != value}
+                    if delta:
+                        delta['id'] = download_id
+                        yield f"data: {json.dumps(delta)}\n\n"
+                        last_payloads[download_id] = payload
+                        last_sent = time.monotonic()
+                    
+                    if is_final_payload(payload):
+                        subscription.discard(download_id)
+                        last_payloads.pop(download_id, None)
+                
+                # A fixed set of jobs is done once all of them are final;
+                # a client session stays open for the jobs it starts next
+                if not client_id and not subscription.job_ids:
                     break
-                elif 'percent' in download_progress[download_id]:
-                    # If we have progress info, always send updates
-                    current = download_progress[download_id]
-                    yield f"data: {json.dumps({'id': download_id, 'percent': current['percent'], 'speed': format_speed(current['speed']), 'eta': format_eta(current['eta'])})}\n\n"
-            
-            # Sleep to avoid high CPU usage, but keep updates frequent
-            time.sleep(0.3)
     
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/')
 def index():
@@ -158,6 +492,18 @@ def download():
     platform = request.form.get('platform', 'auto')
     format_type = request.form.get('format', 'video')
     quality = request.form.get('quality', 'highest')
+    container = request.form.get('container') or None
+    client_id = request.form.get('client_id')
+    profile = is_flag_set(request.form.get('profile'))
+    
+    if client_id and not CLIENT_ID_PATTERN.match(client_id):
+        client_id = None
+    
+    try:
+        connections = int(request.form.get('connections', DOWNLOAD_CONNECTIONS))
+    except ValueError:
+        connections = DOWNLOAD_CONNECTIONS
+    connections = max(1, min(connections, MAX_CONNECTIONS_PER_JOB))
     
     if not url:
         return jsonify({"error": "Please provide a URL"}), 400
@@ -165,305 +511,654 @@ def download():
     try:
         # Auto-detect platform if not specified
         if platform == 'auto':
-            if 'youtube.com' in url or 'youtu.be' in url:
-                platform = 'youtube'
-            elif 'instagram.com' in url or 'instagr.am' in url:
-                platform = 'instagram'
-            elif 'facebook.com' in url or 'fb.com' in url or 'fb.watch' in url:
-                platform = 'facebook'
-            else:
+            platform = detect_platform(url)
+            if platform is None:
                 return jsonify({"error": "Could not detect platform from URL"}), 400
         
-        # YouTube
-        if platform == 'youtube':
-            # Generate a download ID
-            download_id = f"yt_{int(time.time())}"
-            
-            # Initialize progress tracking
-            download_progress[download_id] = {
-                'percent': 0,
-                'speed': 0,
-                'eta': 0,
-                'status': 'starting'
-            }
-            
-            # Return the download ID first
-            response = {
-                "download_id": download_id,
-                "status": "started",
-                "message": "Download started. Please wait..."
-            }
-            
-            # Start download in background
-            threading.Thread(target=download_youtube_with_progress, 
-                            args=(url, format_type, quality, download_id)).start()
-            
-            return jsonify(response)
-        
-        # Instagram
-        elif platform == 'instagram':
-            # Generate a download ID
-            download_id = f"ig_{int(time.time())}"
-            
-            # Initialize progress tracking
-            download_progress[download_id] = {
-                'percent': 0,
-                'speed': 0,
-                'eta': 0,
-                'status': 'starting'
-            }
-            
-            # Return the download ID first
-            response = {
-                "download_id": download_id,
-                "status": "started",
-                "message": "Download started. Please wait..."
-            }
-            
-            # Start download in background
-            threading.Thread(target=download_instagram_with_progress, 
-                            args=(url, download_id)).start()
-            
-            return jsonify(response)
-        
         # Facebook
-        elif platform == 'facebook':
+        if platform == 'facebook':
             return download_facebook_alternative(url)
         
-        else:
+        if platform not in ('youtube', 'instagram'):
             return jsonify({"error": "Unsupported platform"}), 400
+        
+        download_id, cache_key, target, args = build_download_job(url, platform, format_type, quality,
+                                                                  container, connections)
+        return queue_download(download_id, platform, cache_key, target, *args, client_id=client_id,
+                              profile=profile)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def download_youtube_with_progress(url, format_type, quality, download_id):
+# Boolean request parameter: form values like '1'/'true', or a JSON bool
+def is_flag_set(value):
+    return value is True or str(value).lower() in ('1', 'true', 'yes', 'on')
+
+def detect_platform(url):
+    if 'youtube.com' in url or 'youtu.be' in url:
+        return 'youtube'
+    if 'instagram.com' in url or 'instagr.am' in url:
+        return 'instagram'
+    if 'facebook.com' in url or 'fb.com' in url or 'fb.watch' in url:
+        return 'facebook'
+    return None
+
+# New job ID, result cache key, download function and its arguments for a YouTube or Instagram request
+def build_download_job(url, platform, format_type, quality, container=None, connections=DOWNLOAD_CONNECTIONS):
+    if platform == 'youtube':
+        download_id = download_jobs.new_id('yt')
+        
+        # Audio ignores the video quality setting, so share one cache entry
+        cache_key = canonical_media_id(url, 'youtube') + (format_type, None if format_type == 'audio' else quality,
+                                                          container if format_type == 'audio' else None)
+        
+        return download_id, cache_key, download_youtube_with_progress, (url, format_type, quality, download_id,
+                                                                        container, connections)
+    
+    download_id = download_jobs.new_id('ig')
+    cache_key = canonical_media_id(url, 'instagram') + ('video', None, None)
+    return download_id, cache_key, download_instagram_with_progress, (url, download_id, connections)
+
+def queue_download(download_id, platform, cache_key, target, *args, client_id=None, profile=False):
+    """Hand a download to the worker pool, or reject it with 429 when the queue is full"""
+    try:
+        return jsonify(submit_download(download_id, platform, cache_key, target, *args, client_id=client_id,
+                                       profile=profile))
+    except QueueFullError as e:
+        errors_total.inc(error_class='queue_full')
+        response = jsonify({"error": "Too many downloads in progress. Please try again shortly.",
+                            "retry_after": e.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+def submit_download(download_id, platform, cache_key, target, *args, client_id=None, profile=False):
+    """Start a download job and return its status payload; raises QueueFullError when the queue is full.
+    
+    Identical requests are served from the result cache, or attached to the
+    job that is already downloading the same media. With ``profile`` (or by
+    chance, see PROFILE_SAMPLE_RATE) the job runs under the sampling profiler.
+    """
+    outcome, cached = result_cache.lookup_or_claim(cache_key, download_id)
+    
+    if outcome == 'hit':
+        # Finished artifact on disk: the job is complete as soon as it exists
+        download_jobs.create(download_id, client_id=client_id, **cached)
+        download_jobs.complete(download_id, cached=True)
+        return {
+            "download_id": download_id,
+            "status": "complete",
+            "cached": True,
+            "message": "Download ready."
+        }
+    
+    if outcome == 'join':
+        # Same media is already being downloaded; share that job
+        leader_id = cached
+        if client_id:
+            download_jobs.attach_client(leader_id, client_id)
+        leader = download_jobs.get(leader_id) or {}
+        return {
+            "download_id": leader_id,
+            "status": leader.get('status', 'queued'),
+            "queue_position": leader.get('queue_position', 0),
+            "message": "Download already in progress. Please wait..."
+        }
+    
+    # Initialize progress tracking
+    download_jobs.create(download_id,
+                         percent=0,
+                         speed=0,
+                         eta=0,
+                         status='queued',
+                         queue_position=0,
+                         profile=profile or random.random() < PROFILE_SAMPLE_RATE,
+                         client_id=client_id)
+    job_tracer.start(download_id)
+    
+    job_journal.record(download_id,
+                       platform=platform,
+                       target=target.__name__,
+                       args=list(args),
+                       cache_key=list(cache_key),
+                       client_id=client_id,
+                       created_at=time.time())
+    
+    try:
+        position = download_scheduler.submit(download_id, platform, run_download_job,
+                                             download_id, cache_key, target, *args)
+    except QueueFullError:
+        download_jobs.remove(download_id)
+        job_journal.remove(download_id)
+        job_tracer.finish(download_id)
+        result_cache.release(cache_key, download_id)
+        raise
+    
+    download_jobs.update(download_id, queue_position=position)
+    
+    # Return the download ID first
+    return {
+        "download_id": download_id,
+        "status": "queued",
+        "queue_position": position,
+        "message": "Download queued. Please wait..."
+    }
+
+# Download a list of URLs and/or playlists as one batch. Accepts JSON or form data:
+# urls (list, or one URL per line) or url, plus format, quality, container, connections, profile
+# and parallelism (items downloading at once). Progress: /batch/<id> or /progress/<id>.
+@app.route('/batch', methods=['POST'])
+def start_batch():
+    data = request.get_json(silent=True) or request.form
+    urls = data.get('urls') or data.get('url') or []
+    if isinstance(urls, str):
+        urls = urls.split()
+    urls = [url.strip() for url in urls if isinstance(url, str) and url.strip()]
+    format_type = data.get('format', 'video')
+    quality = data.get('quality', 'highest')
+    container = data.get('container') or None
+    client_id = data.get('client_id')
+    profile = is_flag_set(data.get('profile'))
+    
+    if client_id and not CLIENT_ID_PATTERN.match(client_id):
+        client_id = None
+    
+    try:
+        connections = max(1, min(int(data.get('connections', DOWNLOAD_CONNECTIONS)), MAX_CONNECTIONS_PER_JOB))
+        parallelism = max(1, min(int(data.get('parallelism', BATCH_PARALLELISM)), MAX_BATCH_PARALLELISM))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid connections or parallelism"}), 400
+    
+    if not urls:
+        return jsonify({"error": "Please provide a URL or a list of URLs"}), 400
+    if len(urls) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"A batch may contain at most {MAX_BATCH_ITEMS} URLs"}), 400
+    
+    def submit(url):
+        platform = detect_platform(url)
+        if platform not in ('youtube', 'instagram'):
+            raise ValueError("Unsupported platform")
+        download_id, cache_key, target, args = build_download_job(url, platform, format_type, quality,
+                                                                  container, connections)
+        return submit_download(download_id, platform, cache_key, target, *args, client_id=client_id,
+                               profile=profile)
+    
+    batch_id = download_jobs.new_id('bt')
+    download_jobs.create(batch_id,
+                         kind='batch',
+                         status='queued',
+                         percent=0,
+                         items=[],
+                         total=0,
+                         completed=0,
+                         failed=0,
+                         expanding=True,
+                         parallelism=parallelism,
+                         client_id=client_id)
+    BatchRunner(download_jobs, batch_id, iter_batch_entries(urls), submit,
+                parallelism=parallelism, max_items=MAX_BATCH_ITEMS).start()
+    
+    return jsonify({
+        "batch_id": batch_id,
+        "status": "queued",
+        "parallelism": parallelism,
+        "message": "Batch started. Please wait..."
+    })
+
+# Aggregate progress of a batch plus the status of each item
+@app.route('/batch/<batch_id>')
+def batch_status(batch_id):
+    batch = download_jobs.get(batch_id)
+    if batch is None or batch.get('kind') != 'batch':
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(dict(batch, batch_id=batch_id))
+
+# Playlist pages, and watch URLs that carry a list= parameter without a video
+def is_playlist_url(url):
+    return '/playlist' in url or ('list=' in url and 'v=' not in url)
+
+# Entries of a playlist as {'url', 'title'} dicts. yt-dlp only fetches the next
+# page of the playlist when the generator is advanced, so a batch expands it as it goes.
+def iter_playlist_entries(url):
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'logger': QuietLogger(),
+        'extract_flat': 'in_playlist',
+        'cookiesfrombrowser': ('chrome',),
+        'extractor_retries': 3,
+        'socket_timeout': 30,
+    }
+    with extractor_sessions.open(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        # Follow redirects to the playlist itself (e.g. channel URLs)
+        for _ in range(3):
+            if info.get('_type') not in ('url', 'url_transparent') or not info.get('url'):
+                break
+            info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+        
+        if 'entries' not in info:
+            yield {'url': info.get('webpage_url') or url, 'title': info.get('title')}
+            return
+        
+        for entry in info['entries']:
+            if not entry:
+                yield {'url': None, 'error': 'Playlist entry is unavailable'}
+                continue
+            entry_url = entry.get('url') or entry.get('webpage_url')
+            if entry_url and not entry_url.startswith('http') and entry.get('ie_key') == 'Youtube':
+                entry_url = f"https://www.youtube.com/watch?v={entry_url}"
+            elif not entry_url and entry.get('id') and entry.get('ie_key') == 'Youtube':
+                entry_url = f"https://www.youtube.com/watch?v={entry['id']}"
+            yield {'url': entry_url, 'title': entry.get('title')}
+
+# Batch entries in order, expanding playlist URLs in place
+def iter_batch_entries(urls):
+    for url in urls:
+        if is_playlist_url(url):
+            try:
+                yield from iter_playlist_entries(url)
+            except Exception as e:
+                # A broken playlist is one failed entry, not the end of the batch
+                yield {'url': url, 'error': str(e)}
+        else:
+            yield {'url': url}
+
+def run_download_job(download_id, cache_key, target, *args):
+    """Worker-side wrapper that tracks job start and publishes the result to the cache.
+    
+    A target that returns a callable still has CPU-bound work to do; that is
+    queued on the postprocessing pool and this download worker moves on.
+    """
+    download_jobs.update(download_id, status='starting', queue_position=0)
+    job_tracer.add(download_id, 'queue_wait', job_tracer.started_at(download_id) or time.time(), time.time())
+    
+    # Everything behind this job moved up one place
+    for position, queued_id in enumerate(download_scheduler.pending_ids(), start=1):
+        download_jobs.update(queued_id, queue_position=position)
+    
+    handed_off = False
+    try:
+        with profiled(download_id):
+            next_stage = target(*args)
+        if callable(next_stage):
+            download_jobs.update(download_id, stage='postprocess-queued')
+            postprocess_scheduler.submit(download_id, 'postprocess', run_postprocess_job,
+                                         download_id, cache_key, next_stage, time.time(), block=True)
+            handed_off = True
+    finally:
+        if not handed_off:
+            finish_download_job(download_id, cache_key)
+
+def run_postprocess_job(download_id, cache_key, next_stage, queued_at):
+    download_jobs.update(download_id, stage='postprocessing')
+    job_tracer.add(download_id, 'postprocess_queue_wait', queued_at, time.time())
+    try:
+        with profiled(download_id):
+            next_stage()
+    finally:
+        finish_download_job(download_id, cache_key)
+
+# Run the block under the sampling profiler if the job was picked for profiling
+def profiled(download_id):
+    job = download_jobs.get(download_id) or {}
+    if not job.get('profile'):
+        return contextlib.nullcontext()
+    return sampling_profiler.sample(download_id)
+
+def finish_download_job(download_id, cache_key):
+    result = None
+    job = download_jobs.get(download_id)
+    job_tracer.finish(download_id)
+    # Failed jobs are profiled too; either way the samples must not outlive the job
+    if job is not None and job.get('profile'):
+        write_profile(download_id)
+    else:
+        sampling_profiler.discard(download_id)
+    if job is not None and job.get('status') == 'complete' and 'error' not in job:
+        result = {key: job[key] for key in CACHED_JOB_FIELDS if key in job}
+    
+    platform = {'yt': 'youtube', 'ig': 'instagram'}.get(download_id.split('_', 1)[0], 'other')
+    if result is not None:
+        jobs_finished.inc(platform=platform, status='complete')
+    else:
+        jobs_finished.inc(platform=platform, status='error')
+        errors_total.inc(error_class=classify_error((job or {}).get('error', 'Download not found')))
+    
+    # Finished or failed for good: nothing left to resume
+    job_journal.remove(download_id)
+    result_cache.release(cache_key, download_id, result)
+
+def write_profile(download_id):
+    path = os.path.join(PROFILE_DIR, f"{download_id}.folded")
+    try:
+        samples = sampling_profiler.write(download_id, path)
+    except OSError as e:
+        logger.error(f"Error writing profile for {download_id}: {str(e)}")
+        return
+    if samples:
+        download_jobs.update(download_id, profile_path=path, profile_samples=samples)
+        logger.info(f"Wrote profile of {download_id} ({samples} samples) to {path}")
+
+# A pooled YoutubeDL for extracting info (never for downloading), lent to one thread at a time.
+# Pooled per cookie session, so planning, /api/info and re-extraction after an expired URL
+# all extract with the cookies the platform's downloads use. Pooled instances are tagged with the
+# session's generation, so once it refreshes (new cookies) the old ones are retired.
+def info_session(platform):
+    ydl_opts = extraction_options(platform)
+    session = extractor_sessions.session(ydl_opts.get('cookiesfrombrowser'))
+    return extractor_sessions.borrow(f"info:{session.label()}", lambda: extractor_sessions.open(ydl_opts),
+                                     generation=session.state().generation)
+
+# YoutubeDL options for extracting a platform's media, with the same cookies its downloads use
+def extraction_options(platform):
+    ydl_opts = {'quiet': True, 'no_warnings': True, 'logger': QuietLogger()}
+    if EXTRACTION_COOKIES.get(platform):
+        ydl_opts['cookiesfrombrowser'] = EXTRACTION_COOKIES[platform]
+    return ydl_opts
+
+# Metadata cache key: the media plus the credentials it was extracted with
+def metadata_key(url, platform):
+    return canonical_media_id(url, platform, auth=EXTRACTION_COOKIES.get(platform))
+
+# Raw extractor result for a URL, extracted once and shared by /api/info and /download.
+# Callers run it through ydl.process_ie_result() so their own format options apply.
+def get_media_info(ydl, url, platform):
+    def extract():
+        with stage_seconds.time(stage='extract'):
+            return ydl.extract_info(url, download=False, process=False)
+    
+    info = metadata_cache.get_or_load(metadata_key(url, platform), extract)
+    if info is None:
+        raise yt_dlp.utils.DownloadError(f"Could not extract media information from {url}")
+    return info
+
+# Fresh info for a media URL, bypassing the metadata cache (e.g. after its media URLs expired)
+def reextract_media_info(url, platform):
+    metadata_cache.invalidate(metadata_key(url, platform))
+    with info_session(platform) as ydl:
+        return get_media_info(ydl, url, platform)
+
+# Record a retry the retry engine is about to wait for on the job, its trace and /metrics
+def note_retry(download_id, attempt, error_class, delay, error):
+    logger.info(f"Retrying {download_id} (attempt {attempt + 1}) in {delay:.1f}s after {error_class}: {str(error)}")
+    retries_total.inc(error_class=error_class)
+    now = time.time()
+    job_tracer.add(download_id, 'retry_wait', now, now + delay, attempt=attempt, error_class=error_class)
+    download_jobs.update(download_id, retries=attempt, retry_error_class=error_class)
+
+# Publish a finished temp file into DOWNLOADS_DIR, sharing its bytes when the
+# filesystem allows (hardlink/reflink) and copying only as a fallback
+def finalize_download(download_id, temp_file_path, static_file_path):
+    started = time.monotonic()
+    with job_tracer.span(download_id, 'finalize') as span:
+        method = publish_file(temp_file_path, static_file_path)
+        size = os.path.getsize(static_file_path)
+        span.update(method=method, bytes=size)
+    elapsed = time.monotonic() - started
+    
+    finalize_stats.record(method, size, elapsed)
+    stage_seconds.observe(elapsed, stage='finalize')
+    download_jobs.update(download_id,
+                         size_bytes=size,
+                         finalize_method=method,
+                         finalize_seconds=round(elapsed, 4),
+                         bytes_saved=0 if method == 'copy' else size)
+    logger.debug(f"Finalized {download_id} by {method}: {size} bytes in {elapsed:.3f}s")
+    storage_manager.request_check()
+
+# Extract (or reuse) the media info and plan the cheapest download for the request.
+# Without ffmpeg only plans that need no merge or conversion are possible.
+def plan_media_download(url, platform, format_type, quality, container=None):
+    with info_session(platform) as ydl:
+        info = get_media_info(ydl, url, platform)
+    ffmpeg = toolchain.capabilities()['ffmpeg']
+    plan = plan_download(info, format_type, quality, container, ffmpeg_available=ffmpeg['available'],
+                         encoders=ffmpeg['encoders'] or None)
+    return info, plan
+
+# The part of a plan worth keeping on the job and showing to clients
+def plan_summary(plan):
+    return {key: plan.get(key) for key in ('strategy', 'format', 'ext', 'height', 'vcodec', 'acodec',
+                                           'estimated_bytes', 'estimated_cpu_seconds', 'reason')}
+
+# Where yt-dlp left the finished file (after any merge or postprocessing)
+def downloaded_file_path(info, temp_prefix):
+    for requested in reversed((info or {}).get('requested_downloads') or []):
+        if requested.get('filepath') and os.path.exists(requested['filepath']):
+            return requested['filepath']
+    
+    # Fall back to whatever landed under our prefix
+    dir_name = os.path.dirname(temp_prefix)
+    base_name = os.path.basename(temp_prefix)
+    for f in sorted(os.listdir(dir_name)):
+        if f.startswith(base_name + '.') and not f.endswith(('.part', '.ytdl', '.temp')):
+            return os.path.join(dir_name, f)
+    raise FileNotFoundError(f"Downloaded file not found for {temp_prefix}")
+
+# Remove the partial and unmerged files yt-dlp left under a job's temp prefix
+def discard_partial_files(temp_prefix):
+    dir_name = os.path.dirname(temp_prefix)
+    base_name = os.path.basename(temp_prefix)
+    for f in os.listdir(dir_name):
+        if f.startswith(base_name + '.') and PARTIAL_FILE_PATTERN.search(f):
+            try:
+                os.remove(os.path.join(dir_name, f))
+            except OSError as e:
+                logger.error(f"Error removing partial file {f}: {str(e)}")
+
+# Publish a finished YouTube download and record its details on the job
+def finish_youtube_download(download_id, url, info, temp_prefix, format_type):
+    title = sanitize_filename(info.get('title', 'audio' if format_type == 'audio' else 'video'))
+    temp_file_path = downloaded_file_path(info, temp_prefix)
+    file_ext = os.path.splitext(temp_file_path)[1].lstrip('.') or 'mp4'
+    
+    logger.debug(f"{format_type.capitalize()} download complete. Path: {temp_file_path}")
+    
+    # Publish to static downloads directory with the video title. The job ID keeps the name
+    # unique, so cached artifacts of the same title (other qualities, other videos) never share
+    # a file that evicting one of them would delete.
+    static_filename = f"{title}_{download_id}.{file_ext}"
+    static_file_path = os.path.join(DOWNLOADS_DIR, static_filename)
+    
+    # Publish without copying the bytes when possible
+    finalize_download(download_id, temp_file_path, static_file_path)
+    logger.debug(f"Published to static path: {static_file_path}")
+    
+    # Store both paths and additional info for logging
+    download_jobs.update(download_id,
+                         file_path=temp_file_path,
+                         static_path=f"/static/downloads/{static_filename}",
+                         title=title,
+                         format=file_ext,
+                         platform='YouTube',
+                         url=url,
+                         duration=info.get('duration_string', str(info.get('duration', 'Unknown'))),
+                         description=info.get('description', 'No description available'))
+
+# Run yt-dlp for a job with up to `connections` parallel connections (globally capped).
+# DASH/HLS fragments are fetched concurrently by yt-dlp; a large single-file
+# format with no postprocessing is split into byte ranges and fetched in
+# parallel, still landing on disk in order.
+# With defer_postprocessing the result is (info, postprocess): postprocess runs the
+# merge/conversion yt-dlp skipped, or is None when there is nothing worth deferring.
+def run_parallel_download(download_id, info, ydl_opts, connections, temp_prefix, postprocessed=False,
+                          defer_postprocessing=False):
+    waited_since = time.time()
+    granted = connection_budget.acquire(connections)
+    download_jobs.update(download_id, connections=granted)
+    started = time.monotonic()
+    try:
+        with job_tracer.span(download_id, 'fetch', method='yt-dlp', connections=granted,
+                             connection_wait=round(time.time() - waited_since, 4)) as span:
+            ydl_opts = dict(ydl_opts, concurrent_fragment_downloads=granted)
+            ydl_class = None
+            if defer_postprocessing:
+                # Subclasses YoutubeDL, so importing it imports yt-dlp
+                from deferred_postprocessing import DeferredPostprocessingYoutubeDL as ydl_class
+            with extractor_sessions.open(ydl_opts, ydl_class) as ydl:
+                result = None
+                if granted > 1 and not postprocessed:
+                    selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+                    if is_passthrough_format(selected) and selected.get('url'):
+                        total_bytes = probe_range_support(selected['url'], selected.get('http_headers'),
+                                                          session=extractor_sessions.http_session())
+                        if total_bytes and total_bytes >= RANGED_MIN_BYTES:
+                            span['method'] = 'ranged'
+                            dest = f"{temp_prefix}.{selected.get('ext', 'mp4')}"
+                            fetch_ranged(selected['url'], dest, total_bytes,
+                                         headers=selected.get('http_headers'),
+                                         connections=granted,
+                                         piece_size=RANGED_PIECE_SIZE,
+                                         progress_hook=ydl_opts['progress_hooks'][0],
+                                         info_dict=selected,
+                                         session=extractor_sessions.http_session())
+                            selected['requested_downloads'] = [{'filepath': dest}]
+                            result = selected
+                if result is None:
+                    result = ydl.process_ie_result(info, download=True)
+    finally:
+        connection_budget.release(granted)
+        stage_seconds.observe(time.monotonic() - started, stage='download')
+    
+    if not defer_postprocessing:
+        return result
+    if ydl.needs_postprocessing():
+        return result, ydl.run_postprocessing
+    # Only moving files into place is left; not worth a trip through the pool
+    ydl.run_postprocessing()
+    return result, None
+
+def download_youtube_with_progress(url, format_type, quality, download_id, container=None,
+                                   connections=DOWNLOAD_CONNECTIONS):
     """Download YouTube video with progress tracking"""
     try:
-        # Create a unique filename
-        timestamp = int(time.time())
+        # Create a unique filename; yt-dlp fills in the extension the plan produces
+        temp_prefix = os.path.join(TEMP_DIR, f"youtube_{format_type}_{download_id}")
+        outtmpl = temp_prefix + '.%(ext)s'
+        host = host_key(url)
+        info = None
+        
+        logger.debug(f"YouTube download path: {outtmpl}")
         
-        if format_type == 'audio':
-            # Download as MP3
-            filename = f"youtube_audio_{timestamp}.mp3"
-            temp_file_path = os.path.join(TEMP_DIR, filename)
+        try:
+            # Choose formats from what the video actually offers instead of a fixed format string
+            def extract(attempt):
+                with job_tracer.span(download_id, 'extract') as span:
+                    result = plan_media_download(url, 'youtube', format_type, quality, container)
+                    span['strategy'] = result[1]['strategy']
+                return result
+            
+            info, plan = retry_engine.run(host, extract, on_retry=lambda *retry: note_retry(download_id, *retry))
+            download_jobs.update(download_id, plan=plan_summary(plan))
+            job_journal.record(download_id, plan=plan_summary(plan))
+            job_journal.record_info(download_id, info)
+            logger.debug(f"Download plan for {download_id}: {plan['reason']}")
             
             ydl_opts = {
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                'outtmpl': temp_file_path,
-                'progress_hooks': [progress_hook],
+                'format': plan['format'],
+                'postprocessors': plan['postprocessors'],
+                'outtmpl': outtmpl,
                 'quiet': True,
                 'no_warnings': True,
                 'no_color': True,
                 'logger': QuietLogger(),
                 'verbose': False,
+                # Bytes on disk are only playable as they arrive when nothing converts them afterwards
+                'progress_hooks': [make_progress_hook(download_id, passthrough=not plan['postprocessors'])],
                 # Add cookies options
-                'cookiesfrombrowser': ('chrome',),
-                'ignoreerrors': True,
-                'skip_download_archive': True,
-                'extractor_retries': 3,
-                'socket_timeout': 30,
+                'cookiesfrombrowser': ('chrome',),  # Use Chrome cookies
+                'ignoreerrors': False,  # Let errors reach the retry engine
+                'skip_download_archive': True,  # Don't use download archive
+                'extractor_retries': 3,  # Retry 3 times
+                'socket_timeout': 30,  # Increase timeout
             }
+            if plan['merge_output_format']:
+                ydl_opts['merge_output_format'] = plan['merge_output_format']
             
-            try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    title = sanitize_filename(info.get('title', 'audio'))
-                
-                # The actual file path with mp3 extension
-                final_temp_path = temp_file_path + '.mp3'
-                
-                # Copy to static downloads directory
-                static_filename = f"{title}_{timestamp}.mp3"
-                static_file_path = os.path.join(DOWNLOADS_DIR, static_filename)
-                
-                # Copy the file
-                import shutil
-                shutil.copy2(final_temp_path, static_file_path)
-                
-                logger.debug(f"Audio download complete. Final path: {final_temp_path}")
-                logger.debug(f"Copied to static path: {static_file_path}")
-                
-                # Store both paths and additional info for logging
-                download_progress[download_id]['file_path'] = final_temp_path
-                download_progress[download_id]['static_path'] = f"/static/downloads/{static_filename}"
-                download_progress[download_id]['title'] = title
-                download_progress[download_id]['format'] = 'mp3'
-                download_progress[download_id]['platform'] = 'YouTube'
-                download_progress[download_id]['url'] = url
-                download_progress[download_id]['duration'] = info.get('duration_string', str(info.get('duration', 'Unknown')))
-                download_progress[download_id]['description'] = info.get('description', 'No description available')
-                
-                # Log the download
-                log_download(download_progress[download_id])
-                
-            except Exception as e:
-                logger.error(f"Error downloading audio: {str(e)}")
+            # Every attempt downloads the same formats to the same paths, so yt-dlp (and the
+            # ranged fetcher) resume the .part files a failed attempt left behind
+            stale = False
+            
+            def fetch(attempt):
+                nonlocal info, stale
+                if stale:
+                    # Signed media URLs expire; fresh ones for the same formats keep the .part files valid
+                    info = reextract_media_info(url, 'youtube')
+                    stale = False
+                return run_parallel_download(download_id, copy.deepcopy(info), ydl_opts, connections, temp_prefix,
+                                             postprocessed=bool(plan['postprocessors']),
+                                             defer_postprocessing=True)
+            
+            def on_retry(attempt, error_class, delay, error):
+                nonlocal stale
+                note_retry(download_id, attempt, error_class, delay, error)
+                stale = stale or error_class == 'forbidden'
+            
+            downloaded, postprocess = retry_engine.run(host, fetch, on_retry=on_retry)
+            
+            if postprocess is not None:
+                # The bytes are on disk; merging/converting happens in the postprocessing pool
+                return lambda: postprocess_youtube_download(download_id, url, downloaded, postprocess,
+                                                            temp_prefix, format_type)
+            
+            finish_youtube_download(download_id, url, downloaded, temp_prefix, format_type)
+            
+            # Log the download
+            log_download(download_jobs.get(download_id), download_id)
+            
+        except Exception as e:
+            logger.error(f"Error downloading {format_type}: {str(e)}")
+            error_class = classify_error(e)
+            
+            if isinstance(e, CircuitOpenError):
+                download_jobs.fail(download_id, f"YouTube is refusing requests from this server right now. "
+                                                f"Please try again in {int(e.retry_after) + 1} seconds.")
+            
+            elif format_type == 'audio':
                 if "ffmpeg is not installed" in str(e):
-                    download_progress[download_id] = {
-                        'error': "FFmpeg is required for audio downloads. Please install FFmpeg or contact the administrator."
-                    }
+                    download_jobs.fail(download_id, "FFmpeg is required for audio downloads. Please install FFmpeg or contact the administrator.")
                 else:
-                    download_progress[download_id] = {
-                        'error': str(e)
-                    }
-        else:
-            # Download as video with specified quality
-            filename = f"youtube_video_{timestamp}.mp4"
-            temp_file_path = os.path.join(TEMP_DIR, filename)
-            
-            logger.debug(f"Video download path: {temp_file_path}")
+                    download_jobs.fail(download_id, str(e))
             
-            # If FFmpeg might not be available, use a simpler format string that doesn't require merging
-            try:
-                # First, try to check if FFmpeg is available
-                import subprocess
+            # Try with a different approach if the error is related to bot detection
+            elif error_class == 'bot_detection':
+                try:
+                    logger.info("Trying alternative download method to bypass bot detection...")
+                    
+                    # Try with a different user agent and referer
+                    ydl_opts = {
+                        'format': 'best[ext=mp4]/best',  # Simpler format
+                        'outtmpl': outtmpl,
+                        'quiet': True,
+                        'no_warnings': True,
+                        'no_color': True,
+                        'logger': QuietLogger(),
+                        'verbose': False,
+                        'http_headers': {
+                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+                            'Referer': 'https://www.youtube.com/'
+                        },
+                        'cookiesfrombrowser': ('chrome',),
+                        'ignoreerrors': True,
+                        'skip_download_archive': True,
+                        'extractor_retries': 5
+                    }
+                    
+                    downloaded = fetch_fallback(download_id, url, host, info, ydl_opts, temp_prefix, 'bot_detection')
+                    finish_youtube_download(download_id, url, downloaded, temp_prefix, format_type)
+                    logger.debug(f"Updated download_jobs for alternative video: {download_jobs.get(download_id)}")
+                    
+                except Exception as alt_error:
+                    logger.error(f"Alternative download method failed: {str(alt_error)}")
+                    download_jobs.fail(download_id, "YouTube has detected automated access. Please try a different video or try again later.")
+            elif error_class == 'ffmpeg_missing':
                 try:
-                    subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
-                    ffmpeg_available = True
-                except (FileNotFoundError, subprocess.SubprocessError):
-                    ffmpeg_available = False
-                    logger.warning("FFmpeg not found, using simpler format string")
-                
-                # Set format based on quality and FFmpeg availability
-                if quality == 'highest':
-                    format_string = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best' if ffmpeg_available else 'best[ext=mp4]/best'
-                elif quality == '720p':
-                    format_string = 'bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[height<=720][ext=mp4]/best[height<=720]' if ffmpeg_available else 'best[height<=720][ext=mp4]/best[height<=720]'
-                elif quality == '480p':
-                    format_string = 'bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[height<=480][ext=mp4]/best[height<=480]' if ffmpeg_available else 'best[height<=480][ext=mp4]/best[height<=480]'
-                elif quality == '360p':
-                    format_string = 'bestvideo[height<=360][ext=mp4]+bestaudio[ext=m4a]/best[height<=360][ext=mp4]/best[height<=360]' if ffmpeg_available else 'best[height<=360][ext=mp4]/best[height<=360]'
-                else:
-                    format_string = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best' if ffmpeg_available else 'best[ext=mp4]/best'
-                
-                ydl_opts = {
-                    'format': format_string,
-                    'outtmpl': temp_file_path,
-                    'quiet': True,
-                    'no_warnings': True,
-                    'no_color': True,
-                    'logger': QuietLogger(),
-                    'verbose': False,
-                    'progress_hooks': [progress_hook],
-                    # Add cookies options
-                    'cookiesfrombrowser': ('chrome',),  # Use Chrome cookies
-                    'ignoreerrors': True,  # Continue on errors
-                    'skip_download_archive': True,  # Don't use download archive
-                    'extractor_retries': 3,  # Retry 3 times
-                    'socket_timeout': 30,  # Increase timeout
-                }
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    title = sanitize_filename(info.get('title', 'video'))
-                
-                logger.debug(f"Video download complete. Path: {temp_file_path}")
-                
-                # Check if file exists
-                if os.path.exists(temp_file_path):
-                    logger.debug(f"File exists at {temp_file_path}")
-                else:
-                    logger.warning(f"File does not exist at {temp_file_path}")
-                    # Try to find the actual file
-                    dir_name = os.path.dirname(temp_file_path)
-                    base_name = os.path.basename(temp_file_path)
-                    for f in os.listdir(dir_name):
-                        if f.startswith(base_name.split('.')[0]):
-                            logger.debug(f"Found potential match: {f}")
-                            temp_file_path = os.path.join(dir_name, f)
-                            break
-                
-                # Copy to static downloads directory with the video title
-                static_filename = f"{title}.mp4"
-                static_file_path = os.path.join(DOWNLOADS_DIR, static_filename)
-                
-                # Copy the file
-                import shutil
-                shutil.copy2(temp_file_path, static_file_path)
-                logger.debug(f"Copied to static path: {static_file_path}")
-                
-                # Store both paths and additional info for logging
-                download_progress[download_id]['file_path'] = temp_file_path
-                download_progress[download_id]['static_path'] = f"/static/downloads/{static_filename}"
-                download_progress[download_id]['title'] = title
-                download_progress[download_id]['format'] = 'mp4'
-                download_progress[download_id]['platform'] = 'YouTube'
-                download_progress[download_id]['url'] = url
-                download_progress[download_id]['duration'] = info.get('duration_string', str(info.get('duration', 'Unknown')))
-                download_progress[download_id]['description'] = info.get('description', 'No description available')
-                
-                # Log the download
-                log_download(download_progress[download_id])
-                
-            except Exception as e:
-                logger.error(f"Error downloading video: {str(e)}")
-                
-                # Try with a different approach if the error is related to bot detection
-                if "Sign in to confirm you're not a bot" in str(e):
-                    try:
-                        logger.info("Trying alternative download method to bypass bot detection...")
-                        
-                        # Try with a different user agent and referer
-                        ydl_opts = {
-                            'format': 'best[ext=mp4]/best',  # Simpler format
-                            'outtmpl': temp_file_path,
-                            'quiet': True,
-                            'no_warnings': True,
-                            'no_color': True,
-                            'logger': QuietLogger(),
-                            'verbose': False,
-                            'http_headers': {
-                                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                                'Referer': 'https://www.youtube.com/'
-                            },
-                            'cookiesfrombrowser': ('chrome',),
-                            'ignoreerrors': True,
-                            'skip_download_archive': True,
-                            'extractor_retries': 5
-                        }
-                        
-                        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                            info = ydl.extract_info(url, download=True)
-                            title = sanitize_filename(info.get('title', 'video'))
-                        
-                        logger.debug(f"Alternative video download complete. Path: {temp_file_path}")
-                        
-                        # Copy to static downloads directory with the video title
-                        static_filename = f"{title}.mp4"
-                        static_file_path = os.path.join(DOWNLOADS_DIR, static_filename)
-                        
-                        # Copy the file
-                        import shutil
-                        shutil.copy2(temp_file_path, static_file_path)
-                        logger.debug(f"Copied to static path: {static_file_path}")
-                        
-                        # Store both paths and additional info for logging
-                        download_progress[download_id]['file_path'] = temp_file_path
-                        download_progress[download_id]['static_path'] = f"/static/downloads/{static_filename}"
-                        download_progress[download_id]['title'] = title
-                        download_progress[download_id]['format'] = 'mp4'
-                        download_progress[download_id]['platform'] = 'YouTube'
-                        download_progress[download_id]['url'] = url
-                        download_progress[download_id]['duration'] = info.get('duration_string', str(info.get('duration', 'Unknown')))
-                        download_progress[download_id]['description'] = info.get('description', 'No description available')
-                        logger.debug(f"Updated download_progress for alternative video: {download_progress[download_id]}")
-                        
-                    except Exception as alt_error:
-                        logger.error(f"Alternative download method failed: {str(alt_error)}")
-                        download_progress[download_id] = {
-                            'error': "YouTube has detected automated access. Please try a different video or try again later."
-                        }
-                elif "ffmpeg is not installed" in str(e) or "ffmpeg not found" in str(e):
                     # If FFmpeg error occurs, try again with a simpler format that doesn't require merging
                     logger.debug("Trying simpler format due to FFmpeg error")
                     ydl_opts = {
                         'format': 'best[ext=mp4]/best',  # Simpler format that doesn't require merging
-                        'outtmpl': temp_file_path,
+                        'outtmpl': outtmpl,
                         'quiet': True,
                         'no_warnings': True,
                         'no_color': True,
@@ -472,62 +1167,74 @@ def download_youtube_with_progress(url, format_type, quality, download_id):
                         'cookiesfrombrowser': ('chrome',)
                     }
                     
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        info = ydl.extract_info(url, download=True)
-                        title = sanitize_filename(info.get('title', 'video'))
-                    
-                    logger.debug(f"Fallback video download complete. Path: {temp_file_path}")
-                    
-                    # Copy to static downloads directory with the video title
-                    static_filename = f"{title}.mp4"
-                    static_file_path = os.path.join(DOWNLOADS_DIR, static_filename)
-                    
-                    # Copy the file
-                    import shutil
-                    shutil.copy2(temp_file_path, static_file_path)
-                    logger.debug(f"Copied to static path: {static_file_path}")
+                    downloaded = fetch_fallback(download_id, url, host, info, ydl_opts, temp_prefix, 'no_ffmpeg')
+                    finish_youtube_download(download_id, url, downloaded, temp_prefix, format_type)
+                    logger.debug(f"Updated download_jobs for fallback video: {download_jobs.get(download_id)}")
                     
-                    # Store both paths and additional info for logging
-                    download_progress[download_id]['file_path'] = temp_file_path
-                    download_progress[download_id]['static_path'] = f"/static/downloads/{static_filename}"
-                    download_progress[download_id]['title'] = title
-                    download_progress[download_id]['format'] = 'mp4'
-                    download_progress[download_id]['platform'] = 'YouTube'
-                    download_progress[download_id]['url'] = url
-                    download_progress[download_id]['duration'] = info.get('duration_string', str(info.get('duration', 'Unknown')))
-                    download_progress[download_id]['description'] = info.get('description', 'No description available')
-                    logger.debug(f"Updated download_progress for fallback video: {download_progress[download_id]}")
-                else:
-                    download_progress[download_id] = {
-                        'error': str(e)
-                    }
-                    logger.error(f"Set error in download_progress: {str(e)}")
+                except Exception as alt_error:
+                    logger.error(f"Download without FFmpeg failed: {str(alt_error)}")
+                    download_jobs.fail(download_id, "FFmpeg is required for this download. Please install FFmpeg or contact the administrator.")
+            else:
+                download_jobs.fail(download_id, str(e))
+                logger.error(f"Set error in download_jobs: {str(e)}")
         
         # At the very end of the function, after all processing is done:
         # Ensure the progress is marked as 100% complete
-        if download_id in download_progress:
-            download_progress[download_id]['percent'] = 100
-            download_progress[download_id]['status'] = 'complete'
+        job = download_jobs.get(download_id)
+        if job is not None and 'error' not in job:
+            download_jobs.complete(download_id)
             logger.debug(f"Final update - marked download as complete: {download_id}")
+        else:
+            # Nothing will resume a failed job's partial files
+            discard_partial_files(temp_prefix)
     
     except Exception as e:
         logger.error(f"General error in download_youtube_with_progress: {str(e)}")
-        download_progress[download_id] = {
-            'error': f"YouTube download error: {str(e)}"
-        }
+        download_jobs.fail(download_id, f"YouTube download error: {str(e)}")
+
+# Download with different options after the planned download failed for good. The info
+# extracted for the plan is reused when there is one; the planned format's partial files
+# are dropped first, since the fallback may pick another format under the same file name.
+def fetch_fallback(download_id, url, host, info, ydl_opts, temp_prefix, reason):
+    discard_partial_files(temp_prefix)
+    
+    def fetch(attempt):
+        with job_tracer.span(download_id, 'fetch', method='yt-dlp', fallback=reason):
+            with extractor_sessions.open(ydl_opts) as ydl:
+                media_info = copy.deepcopy(info) if info is not None else get_media_info(ydl, url, 'youtube')
+                return ydl.process_ie_result(media_info, download=True)
+    
+    return retry_engine.run(host, fetch, retry=False)
+
+# Second pipeline stage for a YouTube job: run its deferred merge/conversion, then publish it
+def postprocess_youtube_download(download_id, url, info, postprocess, temp_prefix, format_type):
+    try:
+        started = time.monotonic()
+        with job_tracer.span(download_id, 'postprocess'):
+            postprocess()
+        elapsed = time.monotonic() - started
+        stage_seconds.observe(elapsed, stage='postprocess')
+        download_jobs.update(download_id, postprocess_seconds=round(elapsed, 3))
+        
+        finish_youtube_download(download_id, url, info, temp_prefix, format_type)
+        log_download(download_jobs.get(download_id), download_id)
+        download_jobs.complete(download_id)
+    
+    except Exception as e:
+        logger.error(f"Error postprocessing {format_type}: {str(e)}")
+        if format_type == 'audio' and "ffmpeg is not installed" in str(e):
+            download_jobs.fail(download_id, "FFmpeg is required for audio downloads. Please install FFmpeg or contact the administrator.")
+        else:
+            download_jobs.fail(download_id, str(e))
+        discard_partial_files(temp_prefix)
 
 # Endpoint to get the download file after progress is complete
 @app.route('/get_file/<download_id>')
 def get_file(download_id):
-    print(f"Getting file for download_id: {download_id}")
-    
-    if download_id not in download_progress:
-        print(f"Download ID {download_id} not found in download_progress")
+    download_info = download_jobs.get(download_id)
+    if download_info is None:
         return jsonify({"error": "Download not found"}), 404
     
-    download_info = download_progress[download_id]
-    print(f"Download info: {download_info}")
-    
     if 'error' in download_info:
         return jsonify({"error": download_info['error']}), 500
     
@@ -535,62 +1242,181 @@ def get_file(download_id):
         return jsonify({"error": "Download not complete"}), 400
     
     file_path = download_info['file_path']
-    title = download_info.get('title', 'download')
-    format_ext = download_info.get('format', 'mp4')
-    
-    print(f"Sending file: {file_path}, title: {title}, format: {format_ext}")
     
     # Check if file exists
     if not os.path.exists(file_path):
-        print(f"File not found at {file_path}")
+        logger.debug(f"File for {download_id} not found at {file_path}")
         return jsonify({"error": f"File not found at {file_path}"}), 404
     
     try:
-        return send_file(
-            file_path, 
-            as_attachment=True, 
-            download_name=f"{title}.{format_ext}",
-            mimetype='video/mp4' if format_ext == 'mp4' else 'audio/mp3'
-        )
+        return send_download_file(download_info, file_path)
     except Exception as e:
-        print(f"Error sending file: {str(e)}")
+        logger.error(f"Error sending file for {download_id}: {str(e)}")
         return jsonify({"error": f"Error sending file: {str(e)}"}), 500
 
-def download_instagram(url):
-    try:
-        # Generate a download ID
-        download_id = f"ig_{int(time.time())}"
-        
-        # Initialize progress tracking
-        download_progress[download_id] = {
-            'percent': 0,
-            'speed': 0,
-            'eta': 0,
-            'status': 'starting'
-        }
+# Stream a finished download with Range/ETag support, or offload it to the front-end server
+def send_download_file(download_info, file_path):
+    title = download_info.get('title', 'download')
+    format_ext = download_info.get('format', 'mp4')
+    
+    StorageManager.mark_served(file_path)
+    
+    accel_uri = None
+    if download_info.get('static_path'):
+        accel_uri = f"{X_ACCEL_PREFIX}/{os.path.basename(download_info['static_path'])}"
+    
+    return observe_served(stream_file_response(
+        request,
+        file_path,
+        download_name=f"{title}.{format_ext}",
+        mimetype=media_mimetype(format_ext),
+        mode=FILE_DELIVERY_MODE,
+        accel_uri=accel_uri,
+        chunk_size=FILE_CHUNK_SIZE,
+    ))
+
+# Record how long a file response took and its size once the client has it (or went away)
+def observe_served(response):
+    started = time.monotonic()
+    
+    recorded = []
+    
+    def record():
+        if not recorded:
+            recorded.append(True)
+            stage_seconds.observe(time.monotonic() - started, stage='serve')
+            bytes_total.inc(response.content_length or 0, direction='served')
+    
+    # Passthrough bodies (file wrappers) skip the response's own close hooks
+    body = response.response
+    if response.direct_passthrough and hasattr(body, 'close'):
+        close = body.close
         
-        # Return the download ID first
-        response = {
-            "download_id": download_id,
-            "status": "started",
-            "message": "Download started. Please wait..."
-        }
+        def close_and_record():
+            close()
+            record()
         
-        # Start download in background
-        threading.Thread(target=download_instagram_with_progress, 
-                        args=(url, download_id)).start()
+        body.close = close_and_record
+    response.call_on_close(record)
+    return response
+
+# One ZIP of several finished downloads, streamed as it is built: /zip?ids=a,b,c.
+# Batch IDs stand for their items; jobs that are unknown, unfinished or failed are left out.
+@app.route('/zip')
+def download_zip():
+    job_ids = [job_id for job_id in request.args.get('ids', '').split(',') if job_id]
+    if not job_ids:
+        return jsonify({"error": "Provide ids"}), 400
+    return zip_response(job_ids, request.args.get('name') or 'downloads')
+
+@app.route('/batch/<batch_id>/zip')
+def download_batch_zip(batch_id):
+    batch = download_jobs.get(batch_id)
+    if batch is None or batch.get('kind') != 'batch':
+        return jsonify({"error": "Batch not found"}), 404
+    return zip_response([batch_id], f"batch_{batch_id}")
+
+def zip_response(job_ids, archive_name):
+    members = []
+    names = set()
+    seen = set()
+    pending = list(job_ids)
+    for job_id in pending:
+        if job_id in seen:
+            continue
+        seen.add(job_id)
+        job = download_jobs.get(job_id)
+        if job is None:
+            continue
+        if job.get('kind') == 'batch':
+            pending.extend(item['download_id'] for item in job.get('items', []) if item.get('download_id'))
+            continue
+        file_path = job.get('file_path')
+        if job.get('status') != 'complete' or not file_path or not os.path.isfile(file_path):
+            continue
         
-        return jsonify(response)
+        # Entries need unique names; repeated titles get a counter
+        base = job.get('title') or 'download'
+        ext = job.get('format', 'mp4')
+        name = f"{base}.{ext}"
+        counter = 2
+        while name in names:
+            name = f"{base} ({counter}).{ext}"
+            counter += 1
+        names.add(name)
+        members.append(ZipMember(file_path, name))
+        StorageManager.mark_served(file_path)
+        if len(members) >= MAX_BATCH_ITEMS:
+            break
     
-    except Exception as e:
-        return jsonify({"error": f"Instagram download error: {str(e)}"}), 500
+    if not members:
+        return jsonify({"error": "No finished downloads to package"}), 404
+    
+    response = Response(stream_with_context(stream_zip(members, FILE_CHUNK_SIZE)), mimetype='application/zip')
+    # Stored entries make the archive size exact before the first byte is sent
+    response.content_length = zip_size(members)
+    response.headers['Content-Disposition'] = content_disposition(f"{sanitize_filename(archive_name)}.zip")
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return observe_served(response)
 
-def download_instagram_with_progress(url, download_id):
+# Stream a download to the client while yt-dlp is still writing it.
+# Only single progressive formats qualify (no merge or transcode); finished
+# downloads are served like /get_file, other formats get 409.
+@app.route('/stream/<download_id>')
+def stream_download(download_id):
+    with download_jobs.subscribe(download_id) as subscription:
+        deadline = time.monotonic() + STREAM_START_TIMEOUT
+        while True:
+            download_info = download_jobs.get(download_id)
+            if download_info is None:
+                return jsonify({"error": "Download not found"}), 404
+            if 'error' in download_info:
+                return jsonify({"error": download_info['error']}), 500
+            if download_info.get('status') == 'complete' and download_info.get('file_path'):
+                if not os.path.exists(download_info['file_path']):
+                    return jsonify({"error": "File not found"}), 404
+                return send_download_file(download_info, download_info['file_path'])
+            if download_info.get('partial_path') and os.path.exists(download_info['partial_path']):
+                break
+            if download_info.get('streamable') is False:
+                return jsonify({"error": "This format cannot be streamed while downloading. Use /get_file when complete."}), 409
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return jsonify({"error": "Download has not started yet. Please try again."}), 409
+            subscription.wait(timeout=remaining)
+    
+    partial_path = download_info['partial_path']
+    title = download_info.get('title', 'download')
+    file_ext = partial_file_ext(partial_path, download_info.get('format', 'mp4'))
+    
+    def download_state():
+        current = download_jobs.get(download_id)
+        if current is None or 'error' in current:
+            return 'failed'
+        if current.get('status') in ('finished', 'complete'):
+            return 'done'
+        return 'growing'
+    
+    def generate():
+        with download_jobs.subscribe(download_id) as progress:
+            yield from tail_growing_file(partial_path, download_state, progress.wait, chunk_size=FILE_CHUNK_SIZE)
+    
+    response = Response(stream_with_context(generate()), mimetype=media_mimetype(file_ext), direct_passthrough=True)
+    if download_info.get('total_bytes'):
+        response.content_length = download_info['total_bytes']
+    response.headers['Content-Disposition'] = content_disposition(f"{title}.{file_ext}")
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def download_instagram_with_progress(url, download_id, connections=DOWNLOAD_CONNECTIONS):
     """Download Instagram video with progress tracking"""
     try:
         # Create a unique filename
-        timestamp = int(time.time())
-        filename = f"instagram_video_{timestamp}.mp4"
+        filename = f"instagram_video_{download_id}.mp4"
         temp_file_path = os.path.join(TEMP_DIR, filename)
         
         logger.debug(f"Instagram download path: {temp_file_path}")
@@ -604,55 +1430,67 @@ def download_instagram_with_progress(url, download_id):
             'no_color': True,
             'logger': QuietLogger(),
             'verbose': False,
-            'progress_hooks': [progress_hook],
+            'progress_hooks': [make_progress_hook(download_id, passthrough=True)],
         }
         
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                title = sanitize_filename(info.get('title', 'Instagram Video'))
-                
+            host = host_key(url)
+            
+            def extract(attempt):
+                with job_tracer.span(download_id, 'extract'):
+                    with info_session('instagram') as ydl:
+                        return get_media_info(ydl, url, 'instagram')
+            
+            extracted = retry_engine.run(host, extract, on_retry=lambda *retry: note_retry(download_id, *retry))
+            
+            # Same output path every attempt, so a retry resumes the .part file
+            temp_prefix = os.path.splitext(temp_file_path)[0]
+            
+            def fetch(attempt):
+                return run_parallel_download(download_id, copy.deepcopy(extracted), ydl_opts, connections, temp_prefix)
+            
+            info = retry_engine.run(host, fetch, on_retry=lambda *retry: note_retry(download_id, *retry))
+            title = sanitize_filename(info.get('title', 'Instagram Video'))
+            temp_file_path = downloaded_file_path(info, temp_prefix)
+            
             logger.debug(f"Instagram download complete. Path: {temp_file_path}")
             
-            # Copy to static downloads directory with the video title
-            static_filename = f"{title}.mp4"
+            # Publish to static downloads directory with the video title (and the job ID, see
+            # finish_youtube_download)
+            static_filename = f"{title}_{download_id}.mp4"
             static_file_path = os.path.join(DOWNLOADS_DIR, static_filename)
             
-            # Copy the file
-            import shutil
-            shutil.copy2(temp_file_path, static_file_path)
-            logger.debug(f"Copied to static path: {static_file_path}")
+            # Publish without copying the bytes when possible
+            finalize_download(download_id, temp_file_path, static_file_path)
+            logger.debug(f"Published to static path: {static_file_path}")
             
             # Store both paths and additional info for logging
-            download_progress[download_id]['file_path'] = temp_file_path
-            download_progress[download_id]['static_path'] = f"/static/downloads/{static_filename}"
-            download_progress[download_id]['title'] = title
-            download_progress[download_id]['format'] = 'mp4'
-            download_progress[download_id]['platform'] = 'Instagram'
-            download_progress[download_id]['url'] = url
-            download_progress[download_id]['duration'] = info.get('duration_string', str(info.get('duration', 'Unknown')))
-            download_progress[download_id]['description'] = info.get('description', 'No description available')
-            download_progress[download_id]['percent'] = 100
+            download_jobs.update(download_id,
+                                 file_path=temp_file_path,
+                                 static_path=f"/static/downloads/{static_filename}",
+                                 title=title,
+                                 format='mp4',
+                                 platform='Instagram',
+                                 url=url,
+                                 duration=info.get('duration_string', str(info.get('duration', 'Unknown'))),
+                                 description=info.get('description', 'No description available'))
             
             # Log the download
-            log_download(download_progress[download_id])
+            log_download(download_jobs.get(download_id), download_id)
+            download_jobs.complete(download_id)
             
         except Exception as e:
             logger.error(f"Error downloading Instagram video: {str(e)}")
-            download_progress[download_id] = {
-                "error": f"Could not download Instagram video: {str(e)}",
-                "alternatives": [
-                    "1. Use a browser extension like 'Video DownloadHelper'",
-                    "2. Try an online service like savefrom.net",
-                    "3. Use the Instagram app to save videos directly"
-                ]
-            }
+            download_jobs.fail(download_id, f"Could not download Instagram video: {str(e)}",
+                               alternatives=[
+                                   "1. Use a browser extension like 'Video DownloadHelper'",
+                                   "2. Try an online service like savefrom.net",
+                                   "3. Use the Instagram app to save videos directly"
+                               ])
     
     except Exception as e:
         logger.error(f"General error in download_instagram_with_progress: {str(e)}")
-        download_progress[download_id] = {
-            'error': f"Instagram download error: {str(e)}"
-        }
+        download_jobs.fail(download_id, f"Instagram download error: {str(e)}")
 
 def download_facebook_alternative(url):
     try:
@@ -682,8 +1520,8 @@ def get_video_info():
         # YouTube
         if platform == 'youtube':
             try:
-                with yt_dlp.YoutubeDL() as ydl:
-                    info = ydl.extract_info(url, download=False)
+                with info_session('youtube') as ydl:
+                    info = ydl.process_ie_result(get_media_info(ydl, url, 'youtube'), download=False)
                     
                     # Format duration
                     duration_seconds = info.get('duration')
@@ -717,8 +1555,8 @@ def get_video_info():
                 
                 # Try to get info using yt-dlp first (more reliable for public content)
                 try:
-                    with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                        info = ydl.extract_info(url, download=False)
+                    with info_session('instagram') as ydl:
+                        info = ydl.process_ie_result(get_media_info(ydl, url, 'instagram'), download=False)
                         
                         # Format duration if available
                         duration_seconds = info.get('duration')
@@ -740,20 +1578,22 @@ def get_video_info():
                         })
                 except Exception as e:
                     # Fallback to Instaloader
-                    L = instaloader.Instaloader()
+                    import instaloader
                     
                     # Get post info
                     try:
-                        post = instaloader.Post.from_shortcode(L.context, shortcode)
-                        
-                        return jsonify({
-                            "title": f"Instagram post by {post.owner_username}",
-                            "thumbnail": post.url,
-                            "author": post.owner_username,
-                            "platform": "Instagram",
-                            "is_video": post.is_video,
-                            "description": post.caption if post.caption else "No description available"
-                        })
+                        with extractor_sessions.borrow('instaloader', instaloader.Instaloader) as L:
+                            # Post attributes may still be fetched through L's session
+                            post = instaloader.Post.from_shortcode(L.context, shortcode)
+                            
+                            return jsonify({
+                                "title": f"Instagram post by {post.owner_username}",
+                                "thumbnail": post.url,
+                                "author": post.owner_username,
+                                "platform": "Instagram",
+                                "is_video": post.is_video,
+                                "description": post.caption if post.caption else "No description available"
+                            })
                     except Exception as insta_error:
                         return jsonify({
                             "title": "Instagram Content",
@@ -783,25 +1623,39 @@ def get_video_info():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-# Check for FFmpeg at startup
-import subprocess
-try:
-    subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
-    print("FFmpeg found - full functionality available")
-except (FileNotFoundError, subprocess.SubprocessError):
-    print("WARNING: FFmpeg not found. Some download features may be limited.")
-    print("Install FFmpeg for full functionality:")
-    print("  - Ubuntu/Debian: sudo apt install ffmpeg")
-    print("  - macOS: brew install ffmpeg")
-    print("  - Windows: Download from https://ffmpeg.org/download.html")
+# Dry run: show which formats /download would fetch and what it would cost, without downloading
+@app.route('/api/plan', methods=['POST'])
+def explain_plan():
+    data = request.get_json(silent=True) or request.form
+    url = data.get('url')
+    platform = data.get('platform', 'youtube')
+    format_type = data.get('format', 'video')
+    quality = data.get('quality', 'highest')
+    container = data.get('container') or None
+    
+    if not url:
+        return jsonify({"error": "Please provide a URL"}), 400
+    if platform not in ('youtube', 'instagram'):
+        return jsonify({"error": "Unsupported platform"}), 400
+    
+    try:
+        info, plan = plan_media_download(url, platform, format_type, quality, container)
+    except Exception as e:
+        return jsonify({"error": f"Could not plan download: {str(e)}"}), 500
+    
+    return jsonify(dict(plan_summary(plan),
+                        format_ids=plan['format_ids'],
+                        postprocessors=[pp['key'] for pp in plan['postprocessors']],
+                        merge=bool(plan['merge_output_format']),
+                        candidates=plan['candidates'],
+                        title=info.get('title')))
 
 @app.route('/direct_download/<download_id>')
 def direct_download(download_id):
-    if download_id not in download_progress:
+    download_info = download_jobs.get(download_id)
+    if download_info is None:
         return jsonify({"error": "Download not found"}), 404
     
-    download_info = download_progress[download_id]
-    
     if 'error' in download_info:
         return jsonify({"error": download_info['error']}), 500
     
@@ -821,11 +1675,10 @@ def direct_download(download_id):
 @app.route('/fallback_download/<download_id>')
 def fallback_download(download_id):
     """Fallback download method that doesn't use send_file"""
-    if download_id not in download_progress:
+    download_info = download_jobs.get(download_id)
+    if download_info is None:
         return jsonify({"error": "Download not found"}), 404
     
-    download_info = download_progress[download_id]
-    
     if 'error' in download_info:
         return jsonify({"error": download_info['error']}), 500
     
@@ -840,19 +1693,39 @@ def fallback_download(download_id):
     if not os.path.exists(file_path):
         return jsonify({"error": f"File not found at {file_path}"}), 404
     
-    # Read the file and return it as a response
+    # Stream the file in chunks rather than reading it into memory
     try:
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
-        
-        response = Response(file_data, 
-                           mimetype='video/mp4' if format_ext == 'mp4' else 'audio/mp3')
-        response.headers['Content-Disposition'] = f'attachment; filename="{title}.{format_ext}"'
-        return response
+        StorageManager.mark_served(file_path)
+        return observe_served(stream_file_response(
+            request,
+            file_path,
+            download_name=f"{title}.{format_ext}",
+            mimetype=media_mimetype(format_ext),
+            chunk_size=FILE_CHUNK_SIZE,
+        ))
     except Exception as e:
         logger.error(f"Error in fallback_download: {str(e)}")
         return jsonify({"error": f"Error sending file: {str(e)}"}), 500
 
+# Serve published downloads (the static_path URLs returned by /direct_download)
+@app.route('/static/downloads/<path:filename>')
+def serve_download(filename):
+    file_path = os.path.join(DOWNLOADS_DIR, filename)
+    if os.path.dirname(os.path.abspath(file_path)) != os.path.abspath(DOWNLOADS_DIR) or not os.path.isfile(file_path):
+        return jsonify({"error": "File not found"}), 404
+    
+    format_ext = os.path.splitext(filename)[1].lstrip('.') or 'mp4'
+    StorageManager.mark_served(file_path)
+    return observe_served(stream_file_response(
+        request,
+        file_path,
+        download_name=filename,
+        mimetype=media_mimetype(format_ext),
+        mode=FILE_DELIVERY_MODE,
+        accel_uri=f"{X_ACCEL_PREFIX}/{filename}",
+        chunk_size=FILE_CHUNK_SIZE,
+    ))
+
 # Serve static files
 @app.route('/static/<path:path>')
 def serve_static(path):
@@ -861,14 +1734,86 @@ def serve_static(path):
 @app.route('/check_download/<download_id>')
 def check_download(download_id):
     """Debug endpoint to check download status"""
-    if download_id not in download_progress:
+    download_info = download_jobs.get(download_id)
+    if download_info is None:
         return jsonify({"error": "Download not found"}), 404
     
     return jsonify({
         "status": "found",
-        "download_info": download_progress[download_id]
+        "download_info": download_info,
+        "queue_position": download_scheduler.queue_position(download_id)
     })
 
+# Where a job's time went: timestamped spans (offsets in seconds from when it was queued)
+# for queue wait, extraction, each fetch attempt, postprocessing, finalize and log write
+@app.route('/trace/<download_id>')
+def download_trace(download_id):
+    job = download_jobs.get(download_id)
+    if job is None:
+        return jsonify({"error": "Download not found"}), 404
+    
+    trace = job.get('trace') or {'spans': []}
+    spans = trace['spans']
+    return jsonify(dict(trace,
+                        download_id=download_id,
+                        status=job.get('status'),
+                        error=job.get('error'),
+                        cached=job.get('cached', False),
+                        total_seconds=max((span['start'] + span['seconds'] for span in spans), default=0),
+                        profile_path=job.get('profile_path')))
+
+# Download history page; rows are fetched from /api/logs
+@app.route('/logs')
+def logs_page():
+    return render_template('logs.html')
+
+# Paginated download history, newest first. Filters: platform, q (title words),
+# url, since/until (unix time); pass next_before from a response as before= for the next page.
+@app.route('/api/logs')
+def query_logs():
+    try:
+        limit = min(int(request.args.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+        before_id = request.args.get('before', type=int)
+        since = request.args.get('since', type=float)
+        until = request.args.get('until', type=float)
+    except ValueError:
+        return jsonify({"error": "Invalid query parameters"}), 400
+    
+    started = time.monotonic()
+    rows, next_before = download_history.query(platform=request.args.get('platform') or None,
+                                               search=request.args.get('q') or None,
+                                               url=request.args.get('url') or None,
+                                               since=since,
+                                               until=until,
+                                               before_id=before_id,
+                                               limit=max(1, limit))
+    return jsonify({
+        "downloads": rows,
+        "next_before": next_before,
+        "query_ms": round((time.monotonic() - started) * 1000, 2),
+    })
+
+# Prometheus scrape endpoint
+@app.route('/metrics')
+def export_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/queue_status')
+def queue_status():
+    """Worker pool, queue and job registry usage"""
+    return jsonify(dict(download_scheduler.stats(),
+                        postprocess=postprocess_scheduler.stats(),
+                        jobs=download_jobs.stats(),
+                        result_cache=result_cache.stats(),
+                        metadata_cache=metadata_cache.stats(),
+                        finalize=finalize_stats.snapshot(),
+                        connections=connection_budget.stats(),
+                        storage=storage_manager.stats(),
+                        history=download_history.stats(),
+                        toolchain=toolchain.stats(),
+                        extractor_sessions=extractor_sessions.stats(),
+                        retries=retry_engine.stats()))
+
 def sanitize_filename(filename):
     """Sanitize a filename to remove invalid characters"""
     if not filename:
@@ -897,54 +1842,98 @@ def sanitize_filename(filename):
     
     return filename.strip()
 
-def log_download(download_info):
-    """Log successful download to a file in a simple format"""
+def log_download(download_info, download_id=None):
+    """Record a successful download in the history (never blocks the download thread)"""
     try:
-        # Get current date and time
-        now = datetime.datetime.now()
-        date_str = now.strftime("%Y-%m-%d")
-        time_str = now.strftime("%H:%M:%S")
-        
-        # Create log file path (one file per day)
-        log_file = os.path.join(LOGS_DIR, f"downloads_{date_str}.log")
-        
-        # Get file size if available
-        file_path = download_info.get('file_path', '')
-        file_size = "Unknown"
-        if file_path and os.path.exists(file_path):
-            size_bytes = os.path.getsize(file_path)
-            if size_bytes < 1024:
-                file_size = f"{size_bytes} B"
-            elif size_bytes < 1024 * 1024:
-                file_size = f"{size_bytes/1024:.2f} KB"
-            elif size_bytes < 1024 * 1024 * 1024:
-                file_size = f"{size_bytes/(1024*1024):.2f} MB"
-            else:
-                file_size = f"{size_bytes/(1024*1024*1024):.2f} GB"
-        
-        # Format log entry in a simple format
-        title = download_info.get('title', 'Unknown')
-        duration = download_info.get('duration', 'Unknown')
+        url = download_info.get('url', '')
         platform = download_info.get('platform', 'Unknown')
-        datetime_str = f"{date_str} {time_str}"
-        
-        # Format the log entry as a simple text
-        log_entry = f"""Download at {datetime_str}
-Title: {title}
-Duration: {duration}
-Platform: {platform}
-Size: {file_size}
------------------------------------------
-"""
+        media_id = None
+        if url and platform.lower() in ('youtube', 'instagram'):
+            extractor, media_id = canonical_media_id(url, platform.lower())
+            if extractor == 'url':
+                media_id = None
         
-        # Write to log file
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(log_entry)
-            
-        return True
+        started = time.time()
+        recorded = download_history.record({
+            'job_id': download_id,
+            'platform': platform,
+            'title': download_info.get('title', 'Unknown'),
+            'url': url,
+            'media_id': media_id,
+            'format': download_info.get('format'),
+            'duration': download_info.get('duration', 'Unknown'),
+            'size_bytes': download_info.get('size_bytes'),
+        })
+        if download_id:
+            job_tracer.add(download_id, 'log_write', started, time.time())
+        return recorded
     except Exception as e:
         logger.error(f"Error logging download: {str(e)}")
         return False
 
+# Download functions a journaled job can be resumed with, by name
+DOWNLOAD_TARGETS = {
+    'download_youtube_with_progress': download_youtube_with_progress,
+    'download_instagram_with_progress': download_instagram_with_progress,
+}
+
+def resume_journaled_jobs():
+    """Requeue jobs a previous process left unfinished; yt-dlp picks up their .part files"""
+    for entry in job_journal.claim_orphans():
+        job_id = entry['job_id']
+        target = DOWNLOAD_TARGETS.get(entry.get('target'))
+        if target is None or not entry.get('args'):
+            job_journal.remove(job_id)
+            continue
+        
+        args = entry['args']
+        cache_key = tuple(entry['cache_key'])
+        
+        # Reuse the journaled extraction while its stream URLs are still fresh
+        info = job_journal.load_info(job_id, max_age=JOURNAL_INFO_MAX_AGE)
+        if info is not None:
+            metadata_cache.put(metadata_key(args[0], entry['platform']), info)
+        
+        result_cache.lookup_or_claim(cache_key, job_id)
+        download_jobs.create(job_id,
+                             percent=0,
+                             speed=0,
+                             eta=0,
+                             status='queued',
+                             queue_position=0,
+                             resumed=True,
+                             downloaded_bytes=entry.get('downloaded_bytes', 0),
+                             client_id=entry.get('client_id'))
+        job_tracer.start(job_id)
+        try:
+            position = download_scheduler.submit(job_id, entry['platform'], run_download_job,
+                                                 job_id, cache_key, target, *args)
+        except QueueFullError:
+            logger.error(f"Queue full, could not resume journaled job {job_id}")
+            download_jobs.remove(job_id)
+            job_journal.remove(job_id)
+            job_tracer.finish(job_id)
+            result_cache.release(cache_key, job_id)
+            continue
+        
+        download_jobs.update(job_id, queue_position=position)
+        logger.info(f"Resumed journaled job {job_id} from byte {entry.get('downloaded_bytes', 0)}")
+
+# Under the debug reloader only the child process serves requests
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    resume_journaled_jobs()
+
+# Tell whoever starts the dev server about a missing FFmpeg (workers find out on their first job)
+def warn_if_ffmpeg_missing():
+    if toolchain.ffmpeg_available():
+        print("FFmpeg found - full functionality available")
+        return
+    print("WARNING: FFmpeg not found. Some download features may be limited.")
+    print("Install FFmpeg for full functionality:")
+    print("  - Ubuntu/Debian: sudo apt install ffmpeg")
+    print("  - macOS: brew install ffmpeg")
+    print("  - Windows: Download from https://ffmpeg.org/download.html")
+
 if __name__ == '__main__':
+   warn_if_ffmpeg_missing()
    app.run(debug=True, port=5000)
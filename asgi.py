@@ -0,0 +1,406 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import io
+import json
+import os
+import re
+import sys
+import time
+
+from app import (app as flask_app, download_jobs, progress_payload, is_final_payload, CLIENT_ID_PATTERN,
+                 SSE_HEARTBEAT_INTERVAL, SSE_MIN_INTERVAL, SSE_RETRY_MS, STREAM_START_TIMEOUT, FILE_CHUNK_SIZE)
+from file_delivery import content_disposition, media_mimetype, partial_file_ext, tail_growing_file_async
+
+# Asyncio serving mode: uvicorn asgi:application --host 0.0.0.0 --port 5000
+#
+# Progress streams (/progress, /progress/<id>) and live /stream downloads are
+# coroutines, so an idle subscriber costs a socket and a few objects instead of
+# a thread. Every other URL goes to the Flask app on a thread pool; response
+# bodies (files, ZIPs) are pulled from it one chunk at a time, so a slow client
+# holds a thread only while a chunk is being read, never while it drains.
+# Downloads keep running in the app's worker pools.
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+# Body bytes pulled from the Flask app per thread-pool hop
+ASGI_READ_SIZE = int(os.environ.get('ASGI_READ_SIZE', 1024 * 1024))
+
+wsgi_executor = concurrent.futures.ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi-wsgi')
+
+PROGRESS_ROUTE = re.compile(r'^/progress/([^/]+)$')
+STREAM_ROUTE = re.compile(r'^/stream/([^/]+)$')
+SSE_HEADERS = [('Content-Type', 'text/event-stream; charset=utf-8'),
+               ('Cache-Control', 'no-cache'),
+               ('X-Accel-Buffering', 'no')]
+
+
+class Connection:
+    """One HTTP request and its response over ASGI"""
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self._send = send
+        self.body = b''
+        self.disconnected = asyncio.Event()
+        self._on_disconnect = []
+        self._watcher = None
+
+    async def read_body(self):
+        chunks = []
+        while True:
+            message = await self.receive()
+            if message['type'] == 'http.disconnect':
+                self.disconnected.set()
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        self.body = b''.join(chunks)
+
+    def watch_disconnect(self):
+        """Notice the client going away while the response is still being sent"""
+        self._watcher = asyncio.ensure_future(self._watch())
+
+    async def _watch(self):
+        while not self.disconnected.is_set():
+            message = await self.receive()
+            if message['type'] == 'http.disconnect':
+                self.disconnected.set()
+        for callback in self._on_disconnect:
+            callback()
+
+    def on_disconnect(self, callback):
+        self._on_disconnect.append(callback)
+
+    async def start(self, status, headers):
+        await self._send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers],
+        })
+
+    async def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        await self._send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+    async def end(self):
+        await self._send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        await self.start(status, [('Content-Type', 'application/json'), ('Content-Length', len(body))])
+        await self._send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+
+
+class JobReader:
+    """Reads of one job from a shared (SQLite) store, batched for many subscribers.
+
+    Everyone woken by the same update shares one query. A query that is
+    already running may predate the update, so callers arriving meanwhile
+    wait for the next query instead of joining it: at most two run per burst.
+    """
+
+    def __init__(self, download_id):
+        self.download_id = download_id
+        self.running = None
+        self.queued = None
+
+    def read(self):
+        if self.running is None:
+            self.running = self._start()
+            return self.running
+        if self.queued is None:
+            self.queued = asyncio.get_running_loop().create_future()
+        return self.queued
+
+    def _start(self):
+        future = asyncio.get_running_loop().run_in_executor(wsgi_executor, download_jobs.get, self.download_id)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, _):
+        self.running = None
+        queued, self.queued = self.queued, None
+        if queued is None:
+            job_readers.pop(self.download_id, None)
+            return
+        self.running = self._start()
+        self.running.add_done_callback(lambda done: _resolve(queued, done))
+
+
+def _resolve(future, done):
+    if future.cancelled():
+        return
+    if done.exception() is not None:
+        future.set_exception(done.exception())
+    else:
+        future.set_result(done.result())
+
+
+job_readers = {}
+
+async def get_job(download_id):
+    if not download_jobs.store.shared:
+        return download_jobs.get(download_id)
+
+    # SQLite reads can wait on another process's write lock; keep them off the event loop
+    reader = job_readers.get(download_id)
+    if reader is None:
+        reader = job_readers[download_id] = JobReader(download_id)
+    return await asyncio.shield(reader.read())
+
+def wsgi_environ(connection):
+    scope = connection.scope
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(connection.body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+async def call_wsgi(connection):
+    """Serve the request with the Flask app, one thread-pool hop per ASGI_READ_SIZE of body"""
+    loop = asyncio.get_running_loop()
+    # Flask's request context lives in context variables; every step runs in the same context
+    context = contextvars.copy_context()
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = headers
+
+    def read(iterator):
+        # Up to ASGI_READ_SIZE bytes of body; None once it is exhausted
+        chunks = []
+        size = 0
+        for chunk in iterator:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= ASGI_READ_SIZE:
+                break
+        return b''.join(chunks) if chunks else None
+
+    def first_read():
+        iterable = flask_app(wsgi_environ(connection), start_response)
+        iterator = iter(iterable)
+        return iterable, iterator, read(iterator)
+
+    iterable, iterator, data = await loop.run_in_executor(wsgi_executor, context.run, first_read)
+    try:
+        await connection.start(response_start['status'], response_start['headers'])
+        while data is not None and not connection.disconnected.is_set():
+            if data:
+                await connection.write(data)
+            data = await loop.run_in_executor(wsgi_executor, context.run, read, iterator)
+        await connection.end()
+    finally:
+        if hasattr(iterable, 'close'):
+            await loop.run_in_executor(wsgi_executor, context.run, iterable.close)
+
+# Same events as the Flask /progress/<id> endpoint
+async def progress_stream(connection, download_id):
+    subscription = download_jobs.subscribe_async(download_id)
+    connection.on_disconnect(subscription.interrupt)
+    try:
+        await connection.start(200, SSE_HEADERS)
+        await connection.write(f"retry: {SSE_RETRY_MS}\n\n")
+        last_payload = None
+        last_sent = 0
+        while True:
+            changed = await subscription.wait(timeout=SSE_HEARTBEAT_INTERVAL)
+            if connection.disconnected.is_set():
+                return
+            if not changed:
+                await connection.write(": heartbeat\n\n")
+                continue
+
+            delay = SSE_MIN_INTERVAL - (time.monotonic() - last_sent)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            payload = progress_payload(download_id, await get_job(download_id))
+            if payload != last_payload:
+                await connection.write(f"data: {json.dumps(payload)}\n\n")
+                last_payload = payload
+                last_sent = time.monotonic()
+
+            if is_final_payload(payload):
+                break
+        await connection.end()
+    finally:
+        subscription.close()
+
+# Same events as the Flask multiplexed /progress endpoint
+async def progress_multiplex(connection):
+    query = flask_app.request_class(wsgi_environ(connection)).args
+    job_ids = [job_id for job_id in query.get('ids', '').split(',') if job_id]
+    client_id = query.get('client') or None
+
+    if not job_ids and not client_id:
+        return await connection.send_json(400, {"error": "Provide ids or client"})
+    if client_id and not CLIENT_ID_PATTERN.match(client_id):
+        return await connection.send_json(400, {"error": "Invalid client id"})
+
+    subscription = download_jobs.subscribe_async(job_ids, client_id=client_id)
+    connection.on_disconnect(subscription.interrupt)
+    try:
+        await connection.start(200, SSE_HEADERS)
+        await connection.write(f"retry: {SSE_RETRY_MS}\n\n")
+        last_payloads = {}
+        last_sent = 0
+        while True:
+            changed = await subscription.wait(timeout=SSE_HEARTBEAT_INTERVAL)
+            if connection.disconnected.is_set():
+                return
+            if not changed:
+                await connection.write(": heartbeat\n\n")
+                continue
+
+            delay = SSE_MIN_INTERVAL - (time.monotonic() - last_sent)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                changed |= await subscription.wait(timeout=0)
+
+            for download_id in sorted(changed):
+                payload = progress_payload(download_id, await get_job(download_id))
+                previous = last_payloads.get(download_id, {})
+                delta = {key: value for key, value in payload.items() if previous.get(key) != value}
+                if delta:
+                    delta['id'] = download_id
+                    await connection.write(f"data: {json.dumps(delta)}\n\n")
+                    last_payloads[download_id] = payload
+                    last_sent = time.monotonic()
+
+                if is_final_payload(payload):
+                    subscription.discard(download_id)
+                    last_payloads.pop(download_id, None)
+
+            if not client_id and not subscription.job_ids:
+                break
+        await connection.end()
+    finally:
+        subscription.close()
+
+# Live /stream of a growing download; finished files are handed to the Flask view
+async def stream_download(connection, download_id):
+    subscription = download_jobs.subscribe_async(download_id)
+    connection.on_disconnect(subscription.interrupt)
+    try:
+        deadline = time.monotonic() + STREAM_START_TIMEOUT
+        while True:
+            download_info = await get_job(download_id)
+            if download_info is None:
+                return await connection.send_json(404, {"error": "Download not found"})
+            if 'error' in download_info:
+                return await connection.send_json(500, {"error": download_info['error']})
+            if download_info.get('status') == 'complete' and download_info.get('file_path'):
+                return await call_wsgi(connection)
+            if download_info.get('partial_path') and os.path.exists(download_info['partial_path']):
+                break
+            if download_info.get('streamable') is False:
+                return await connection.send_json(409, {"error": "This format cannot be streamed while downloading. Use /get_file when complete."})
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return await connection.send_json(409, {"error": "Download has not started yet. Please try again."})
+            await subscription.wait(timeout=remaining)
+            if connection.disconnected.is_set():
+                return
+
+        title = download_info.get('title', 'download')
+        file_ext = partial_file_ext(download_info['partial_path'], download_info.get('format', 'mp4'))
+        headers = [('Content-Type', media_mimetype(file_ext)),
+                   ('Content-Disposition', content_disposition(f"{title}.{file_ext}")),
+                   ('Cache-Control', 'no-store'),
+                   ('X-Accel-Buffering', 'no')]
+        if download_info.get('total_bytes'):
+            headers.append(('Content-Length', download_info['total_bytes']))
+
+        async def download_state():
+            current = await get_job(download_id)
+            if current is None or 'error' in current:
+                return 'failed'
+            if current.get('status') in ('finished', 'complete'):
+                return 'done'
+            return 'growing'
+
+        await connection.start(200, headers)
+        async for chunk in tail_growing_file_async(download_info['partial_path'], download_state, subscription.wait,
+                                                   chunk_size=FILE_CHUNK_SIZE):
+            if connection.disconnected.is_set():
+                return
+            await connection.write(chunk)
+        await connection.end()
+    finally:
+        subscription.close()
+
+def route(connection):
+    """Native coroutine handler for a request, or None to serve it with the Flask app"""
+    if connection.scope['method'] != 'GET':
+        return None
+    path = connection.scope['path']
+    if path == '/progress':
+        return progress_multiplex(connection)
+    match = PROGRESS_ROUTE.match(path)
+    if match:
+        return progress_stream(connection, match.group(1))
+    match = STREAM_ROUTE.match(path)
+    if match:
+        return stream_download(connection, match.group(1))
+    return None
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            wsgi_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    connection = Connection(scope, receive, send)
+    await connection.read_body()
+    if connection.disconnected.is_set():
+        return
+    connection.watch_disconnect()
+    try:
+        handler = route(connection)
+        await (handler if handler is not None else call_wsgi(connection))
+    finally:
+        connection.close()
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(application, host=os.environ.get('HOST', '127.0.0.1'), port=int(os.environ.get('PORT', 5000)))
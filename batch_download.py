@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+
+from job_store import TERMINAL_STATUSES
+from scheduler import QueueFullError
+
+logger = logging.getLogger(__name__)
+
+# Longest a batch waits before retrying an entry the download queue turned away
+MAX_QUEUE_RETRY_WAIT = 5.0
+
+
+class BatchRunner:
+    """Feeds the entries of one batch to the download pool, a few at a time.
+
+    ``entries`` is an iterable of dicts with a ``url`` (and optionally a
+    ``title``, or an ``error`` for an entry that cannot be downloaded). It is
+    consumed lazily: the next entry is only pulled when fewer than
+    ``parallelism`` items are in flight, so a long playlist is expanded page
+    by page as the batch progresses. ``submit(url)`` starts (or joins) a
+    download and returns its status payload; QueueFullError makes the entry
+    wait and retry, any other exception fails just that item.
+
+    The batch itself is a job in ``registry`` (``kind='batch'``) holding the
+    per-item status and the aggregate progress, written at most once per
+    ``update_interval``. It completes once every item has finished, and only
+    fails if no item succeeded.
+    """
+
+    def __init__(self, registry, batch_id, entries, submit, parallelism=4, max_items=500, update_interval=0.5):
+        self.registry = registry
+        self.batch_id = batch_id
+        self.entries = entries
+        self.submit = submit
+        self.parallelism = parallelism
+        self.max_items = max_items
+        self.update_interval = update_interval
+        self.items = []
+        self._entry_iter = iter(entries)
+        self._active = {}
+        self._waiting = None
+        self._retry_at = 0
+        self._exhausted = False
+        self._expansion_error = None
+        self._truncated = False
+        self._last_update = 0
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name=f"batch-{self.batch_id}", daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        try:
+            with self.registry.subscribe(()) as subscription:
+                while True:
+                    self._fill(subscription)
+                    if not self._active and self._waiting is None and self._exhausted:
+                        break
+                    timeout = self.update_interval
+                    if self._waiting is not None:
+                        timeout = max(0.0, min(timeout, self._retry_at - time.monotonic()))
+                    for job_id in subscription.wait(timeout=timeout):
+                        if self._refresh(job_id):
+                            subscription.discard(job_id)
+                    self._publish()
+        except Exception as e:
+            logger.error(f"Batch {self.batch_id} stopped: {str(e)}")
+            self._expansion_error = self._expansion_error or str(e)
+        self._finish()
+
+    def _fill(self, subscription):
+        while len(self._active) < self.parallelism:
+            if self._waiting is None:
+                entry = self._next_entry()
+                if entry is None:
+                    return
+                item = {'url': entry.get('url'), 'title': entry.get('title'), 'download_id': None,
+                        'status': 'pending', 'percent': 0}
+                self.items.append(item)
+                if entry.get('error') or not item['url']:
+                    self._fail_item(item, entry.get('error') or 'Entry has no URL')
+                    continue
+                self._waiting = item
+            elif time.monotonic() < self._retry_at:
+                return
+
+            item = self._waiting
+            try:
+                payload = self.submit(item['url'])
+            except QueueFullError as e:
+                self._retry_at = time.monotonic() + min(e.retry_after, MAX_QUEUE_RETRY_WAIT)
+                item['status'] = 'waiting'
+                return
+            except Exception as e:
+                self._waiting = None
+                self._fail_item(item, str(e))
+                continue
+
+            self._waiting = None
+            job_id = payload['download_id']
+            item['download_id'] = job_id
+            item['status'] = payload.get('status', 'queued')
+            # Duplicate entries join the same download
+            self._active.setdefault(job_id, []).append(item)
+            subscription.add(job_id)
+
+    def _next_entry(self):
+        if self._exhausted:
+            return None
+        if len(self.items) >= self.max_items:
+            self._truncated = next(self._entry_iter, None) is not None
+            self._exhausted = True
+            return None
+        try:
+            return next(self._entry_iter)
+        except StopIteration:
+            self._exhausted = True
+        except Exception as e:
+            # Keep whatever was expanded before the playlist broke
+            logger.error(f"Error expanding batch {self.batch_id}: {str(e)}")
+            self._expansion_error = str(e)
+            self._exhausted = True
+        return None
+
+    def _refresh(self, job_id):
+        """Copy a download's state onto its items; True once it has finished"""
+        items = self._active.get(job_id)
+        if items is None:
+            return True
+        job = self.registry.get(job_id)
+        finished = job is None or job.get('status') in TERMINAL_STATUSES
+        for item in items:
+            if job is None:
+                self._fail_item(item, 'Download not found')
+            elif 'error' in job:
+                self._fail_item(item, job['error'])
+            else:
+                item['status'] = job.get('status', item['status'])
+                item['percent'] = 100 if item['status'] == 'complete' else min(job.get('percent', 0), 99)
+                item['title'] = job.get('title') or item['title']
+        if finished:
+            del self._active[job_id]
+        return finished
+
+    @staticmethod
+    def _fail_item(item, error):
+        item['status'] = 'error'
+        item['error'] = error
+        item['percent'] = 100
+
+    def _summary(self):
+        completed = sum(1 for item in self.items if item['status'] == 'complete')
+        failed = sum(1 for item in self.items if item['status'] == 'error')
+        total = len(self.items)
+        return {
+            'kind': 'batch',
+            # Copies, so the store sees each change
+            'items': [dict(item) for item in self.items],
+            'total': total,
+            'completed': completed,
+            'failed': failed,
+            'expanding': not self._exhausted,
+            'truncated': self._truncated,
+            'expansion_error': self._expansion_error,
+            'percent': int(sum(item['percent'] for item in self.items) / total) if total else 0,
+        }
+
+    def _publish(self):
+        if time.monotonic() - self._last_update < self.update_interval:
+            return
+        self._last_update = time.monotonic()
+        summary = self._summary()
+        summary['percent'] = min(summary['percent'], 99)
+        self.registry.update(self.batch_id, status='running', **summary)
+
+    def _finish(self):
+        summary = self._summary()
+        if summary['failed'] == summary['total']:
+            error = self._expansion_error or ('No entries to download' if not summary['total']
+                                              else f"All {summary['total']} items failed")
+            self.registry.fail(self.batch_id, error, **summary)
+        else:
+            del summary['percent']
+            self.registry.complete(self.batch_id, **summary)
+        logger.info(f"Batch {self.batch_id} finished: {summary['completed']} complete, {summary['failed']} failed")
@@ -0,0 +1,57 @@
+"""Run the app offline for benchmarking: fake extractor in, threaded WSGI server out.
+
+    python -m benchmarks.app_server --port 8701 --media-url http://127.0.0.1:8700
+    python -m benchmarks.app_server --port 8701 --media-url http://127.0.0.1:8700 --asgi
+
+--asgi serves asgi.application with uvicorn instead.
+
+State (job store, journal, history, temp files) goes to --state-dir so runs
+do not see each other's jobs; set it before the app is imported.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8701)
+    parser.add_argument('--media-url', required=True)
+    parser.add_argument('--extract-delay', type=float, default=0.05)
+    parser.add_argument('--state-dir', default=None)
+    parser.add_argument('--asgi', action='store_true', help="serve the ASGI app with uvicorn")
+    args = parser.parse_args()
+
+    if args.state_dir:
+        os.makedirs(args.state_dir, exist_ok=True)
+        os.environ.setdefault('JOB_STORE_PATH', os.path.join(args.state_dir, 'jobs.sqlite3'))
+        os.environ.setdefault('JOURNAL_DIR', os.path.join(args.state_dir, 'journal'))
+        os.environ.setdefault('DOWNLOADS_DIR', os.path.join(args.state_dir, 'downloads'))
+        os.environ.setdefault('HISTORY_DB_PATH', os.path.join(args.state_dir, 'history.sqlite3'))
+        # Temp downloads land here too (the app reads tempfile.gettempdir())
+        tempfile.tempdir = args.state_dir
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from benchmarks import fake_extractor
+    fake_extractor.install(args.media_url, extract_delay=args.extract_delay)
+
+    if args.asgi:
+        import uvicorn
+        import asgi
+
+        print(f"App listening on http://{args.host}:{args.port} (ASGI)", flush=True)
+        uvicorn.run(asgi.application, host=args.host, port=args.port, log_level='warning', access_log=False)
+        return
+
+    from werkzeug.serving import make_server
+    import app
+
+    server = make_server(args.host, args.port, app.app, threaded=True)
+    print(f"App listening on http://{args.host}:{args.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
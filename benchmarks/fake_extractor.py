@@ -0,0 +1,77 @@
+"""Stand-in for yt-dlp's YouTube extractor, pointing at the local media server.
+
+After install(), any youtube.com/watch?v=<id> URL extracts offline into a
+single-format video served by benchmarks.media_server. The video ID says
+what to serve: a kind ('P' progressive, 'H' HLS), the size in units of
+256 KiB (4 digits) and a serial number (6 digits), e.g. P0040000001 is a
+10 MiB progressive file. Distinct serials keep the app's caches honest.
+"""
+import time
+
+import yt_dlp.cookies
+from yt_dlp.extractor.youtube import YoutubeIE
+
+SIZE_UNIT = 256 * 1024
+KINDS = {'P': 'progressive', 'H': 'hls'}
+
+
+def media_id(kind, size, serial):
+    """Video ID for a synthetic video of kind 'P' or 'H' and about size bytes"""
+    units = max(1, min(9999, round(size / SIZE_UNIT)))
+    return f"{kind}{units:04d}{serial % 1000000:06d}"
+
+
+def media_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def fake_info(video_id, base_url):
+    kind = video_id[0] if video_id[0] in KINDS else 'P'
+    try:
+        size = int(video_id[1:5]) * SIZE_UNIT
+    except ValueError:
+        size = SIZE_UNIT
+
+    if kind == 'H':
+        fmt = {
+            'format_id': 'hls-360p',
+            'url': f"{base_url}/hls/{size}/{video_id}/index.m3u8",
+            'protocol': 'm3u8_native',
+            'filesize_approx': size,
+        }
+    else:
+        fmt = {
+            'format_id': '18',
+            'url': f"{base_url}/media/{size}/{video_id}.mp4",
+            'filesize': size,
+        }
+    fmt.update({'ext': 'mp4', 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2', 'height': 360, 'width': 640,
+                'tbr': 1000})
+
+    return {
+        'id': video_id,
+        'title': f"Bench {KINDS[kind]} {video_id}",
+        'description': 'Synthetic benchmark media',
+        'uploader': 'benchmarks',
+        'duration': 60,
+        'thumbnail': f"{base_url}/media/1024/{video_id}.jpg",
+        'webpage_url': media_url(video_id),
+        'formats': [fmt],
+    }
+
+
+def install(base_url, extract_delay=0.0):
+    """Route YouTube extraction to fake_info() and skip browser cookies.
+
+    ``extract_delay`` seconds are spent in every extraction, standing in for
+    the page and player requests of a real one.
+    """
+    def real_extract(self, url):
+        if extract_delay:
+            time.sleep(extract_delay)
+        return fake_info(self._match_id(url), base_url)
+
+    YoutubeIE._real_extract = real_extract
+    YoutubeIE._real_initialize = lambda self: None
+    # The app asks for Chrome's cookies; there is no browser profile offline
+    yt_dlp.cookies.extract_cookies_from_browser = lambda *args, **kwargs: yt_dlp.cookies.YoutubeDLCookieJar()
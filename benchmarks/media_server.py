@@ -0,0 +1,194 @@
+"""Local HTTP server for synthetic media, used by the offline benchmarks.
+
+Serves deterministic bytes, so no media files are needed on disk:
+
+    /media/<size>/<name>.mp4          progressive file of <size> bytes (Range supported)
+    /hls/<size>/<name>/index.m3u8     HLS playlist splitting <size> bytes into segments
+    /hls/<size>/<name>/<n>.ts         one segment
+
+Every response waits ``latency`` seconds before its headers, and each
+connection is throttled to ``bandwidth`` bytes per second (0 = unlimited).
+
+    python -m benchmarks.media_server --port 8700 --bandwidth 8M --latency 0.02
+"""
+import argparse
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BLOCK_SIZE = 1024 * 1024
+SEGMENT_SIZE = 1024 * 1024
+WRITE_SIZE = 64 * 1024
+
+# One random block repeated; cheap to serve and never compressible by accident
+_BLOCK = os.urandom(BLOCK_SIZE)
+
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+def media_bytes(start, end):
+    """Bytes start..end (exclusive) of every synthetic file"""
+    chunks = []
+    while start < end:
+        offset = start % BLOCK_SIZE
+        take = min(BLOCK_SIZE - offset, end - start)
+        chunks.append(_BLOCK[offset:offset + take])
+        start += take
+    return b''.join(chunks)
+
+
+def parse_size(value):
+    """'512K', '8M', '1G' or a plain number of bytes"""
+    value = str(value).strip().upper()
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value))
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self, send_body):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        server.count_request()
+
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        try:
+            if parts[0] == 'media' and len(parts) == 3:
+                return self._send_range(int(parts[1]), 'video/mp4', send_body)
+            if parts[0] == 'hls' and len(parts) == 4:
+                size = int(parts[1])
+                if parts[3] == 'index.m3u8':
+                    return self._send_playlist(size, send_body)
+                index = int(parts[3].split('.', 1)[0])
+                start = index * SEGMENT_SIZE
+                if 0 <= start < size:
+                    return self._send_range(min(SEGMENT_SIZE, size - start), 'video/mp2t', send_body, base=start)
+        except ValueError:
+            pass
+        self._send_status(404)
+
+    def _send_playlist(self, size, send_body):
+        count = (size + SEGMENT_SIZE - 1) // SEGMENT_SIZE
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4', '#EXT-X-MEDIA-SEQUENCE:0']
+        for index in range(count):
+            lines += ['#EXTINF:4.0,', f'{index}.ts']
+        lines.append('#EXT-X-ENDLIST')
+        body = ('\n'.join(lines) + '\n').encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _send_range(self, size, content_type, send_body, base=0):
+        start, end = 0, size
+        status = 200
+        match = RANGE_PATTERN.match(self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)) + 1, size) if match.group(2) else size
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start >= end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+        self.end_headers()
+        if send_body:
+            self._write_throttled(base + start, base + end)
+
+    def _write_throttled(self, start, end):
+        bandwidth = self.server.bandwidth
+        began = time.monotonic()
+        sent = 0
+        try:
+            while start < end:
+                chunk = media_bytes(start, min(start + WRITE_SIZE, end))
+                self.wfile.write(chunk)
+                start += len(chunk)
+                sent += len(chunk)
+                if bandwidth:
+                    ahead = sent / bandwidth - (time.monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.server.count_bytes(sent)
+
+    def _send_status(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class MediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, bandwidth=0, latency=0.0):
+        super().__init__((host, port), MediaRequestHandler)
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_bytes(self, sent):
+        with self._lock:
+            self.bytes_sent += sent
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="media-server", daemon=True)
+        thread.start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--bandwidth', default='0', help="bytes/s per connection, e.g. 8M (0 = unlimited)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before each response")
+    args = parser.parse_args()
+    server = MediaServer(args.host, args.port, parse_size(args.bandwidth), args.latency)
+    print(f"Serving synthetic media on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
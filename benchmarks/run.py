@@ -0,0 +1,449 @@
+"""Offline benchmarks: the app against a local media server and a fake extractor.
+
+    python -m benchmarks.run                       # every scenario
+    python -m benchmarks.run downloads api_info    # some of them
+    python -m benchmarks.run --quick               # smaller runs, for a smoke test
+    python -m benchmarks.run --save-baseline       # store results as the new baseline
+    python -m benchmarks.run --asgi                # serve the app with uvicorn (asgi.py)
+
+Each scenario starts a fresh app process (benchmarks.app_server) so peak
+RSS is per scenario, drives it over HTTP and reports throughput, p50/p99
+latency and peak RSS (import_time instead times a cold `import app`
+in fresh interpreters and counts heavy libraries loaded eagerly). Results are compared with benchmarks/baseline.json
+(if present) and anything worse than --tolerance is flagged as a
+regression; the exit status is 1 when there is one. Baselines are only
+comparable on the same machine.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.fake_extractor import media_id, media_url
+from benchmarks.media_server import MediaServer, parse_size
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+MiB = 1024 * 1024
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_threads(count, target):
+    """Run target(index) in count threads at once; returns the results in order"""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = target(index)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class AppProcess:
+    """The app under test, in its own process with its own state directory"""
+
+    def __init__(self, media_url, extract_delay, env=None, asgi=False):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.state_dir = tempfile.mkdtemp(prefix='bench_state_')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.app_server', '--port', str(self.port), '--media-url', media_url,
+             '--extract-delay', str(extract_delay), '--state-dir', self.state_dir] + (['--asgi'] if asgi else []),
+            cwd=REPO_DIR, env=dict(os.environ, **(env or {})),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def __enter__(self):
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("App server exited during startup")
+            try:
+                requests.get(f"{self.url}/queue_status", timeout=1)
+                return self
+            except requests.RequestException:
+                time.sleep(0.1)
+        raise RuntimeError("App server did not start")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def peak_rss_mb(self):
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return round(int(line.split()[1]) / 1024, 1)
+        except OSError:
+            pass
+        return None
+
+
+def submit_download(app_url, url, timeout=60):
+    """POST /download, waiting out 429s; returns (download_id, seconds, rejections)"""
+    rejections = 0
+    started = time.monotonic()
+    while True:
+        response = requests.post(f"{app_url}/download", data={'url': url, 'format': 'video', 'quality': '360p'},
+                                 timeout=timeout)
+        if response.status_code != 429:
+            response.raise_for_status()
+            return response.json()['download_id'], time.monotonic() - started, rejections
+        rejections += 1
+        time.sleep(float(response.headers.get('Retry-After', 1)))
+
+
+def follow_progress(app_url, download_id, timeout=600):
+    """Read /progress/<id> until the final event; returns (first event at, final event at, events, error)"""
+    first = None
+    events = 0
+    with requests.get(f"{app_url}/progress/{download_id}", stream=True, timeout=timeout) as response:
+        for line in response.iter_lines():
+            if not line.startswith(b'data:'):
+                continue
+            now = time.monotonic()
+            first = first or now
+            events += 1
+            payload = json.loads(line[5:])
+            if 'error' in payload:
+                return first, now, events, payload['error']
+            if payload.get('percent') == 100:
+                return first, now, events, None
+    return first, time.monotonic(), events, 'stream ended early'
+
+
+def wait_complete(app_url, download_id, timeout=600):
+    _, _, _, error = follow_progress(app_url, download_id, timeout)
+    if error:
+        raise RuntimeError(f"Download {download_id} failed: {error}")
+
+
+def scenario_downloads(app_url, options):
+    """N concurrent /download jobs (progressive and HLS alternating), followed over SSE"""
+    count = options.jobs
+    size = options.job_size
+    serial = int(time.time())
+
+    def job(index):
+        url = media_url(media_id('H' if index % 2 else 'P', size, serial + index))
+        started = time.monotonic()
+        download_id, submit_seconds, rejections = submit_download(app_url, url)
+        _, finished, _, error = follow_progress(app_url, download_id)
+        return submit_seconds, finished - started, rejections, error
+
+    started = time.monotonic()
+    results = run_threads(count, job)
+    wall = time.monotonic() - started
+    done = [r for r in results if isinstance(r, tuple) and r[3] is None]
+    return {
+        'jobs_per_second': round(len(done) / wall, 3),
+        'mb_per_second': round(len(done) * size / MiB / wall, 2),
+        'submit_p50_ms': _ms(percentile([r[0] for r in done], 50)),
+        'submit_p99_ms': _ms(percentile([r[0] for r in done], 99)),
+        'complete_p50_s': _s(percentile([r[1] for r in done], 50)),
+        'complete_p99_s': _s(percentile([r[1] for r in done], 99)),
+        'rejections': sum(r[2] for r in done),
+        'failures': count - len(done),
+    }
+
+
+def scenario_sse_fanout(app_url, options):
+    """Many /progress subscribers on one throttled download"""
+    count = options.subscribers
+    url = media_url(media_id('P', options.fanout_size, int(time.time())))
+    download_id, _, _ = submit_download(app_url, url)
+
+    def subscriber(index):
+        started = time.monotonic()
+        first, final, events, error = follow_progress(app_url, download_id)
+        return (first - started) if first else None, final, events, error
+
+    started = time.monotonic()
+    results = run_threads(count, subscriber)
+    wall = time.monotonic() - started
+    ok = [r for r in results if isinstance(r, tuple) and r[3] is None and r[0] is not None]
+    earliest_final = min((r[1] for r in ok), default=0)
+    return {
+        'events_per_second': round(sum(r[2] for r in ok) / wall, 1),
+        'first_event_p50_ms': _ms(percentile([r[0] for r in ok], 50)),
+        'first_event_p99_ms': _ms(percentile([r[0] for r in ok], 99)),
+        # How far behind the first subscriber the others learn the job is done
+        'final_lag_p99_ms': _ms(percentile([r[1] - earliest_final for r in ok], 99)),
+        'failures': count - len(ok),
+    }
+
+
+def scenario_get_file(app_url, options):
+    """Concurrent /get_file downloads of one large finished file"""
+    count = options.file_clients
+    url = media_url(media_id('P', options.file_size, int(time.time())))
+    download_id, _, _ = submit_download(app_url, url)
+    wait_complete(app_url, download_id)
+
+    def client(index):
+        started = time.monotonic()
+        received = 0
+        first = None
+        with requests.get(f"{app_url}/get_file/{download_id}", stream=True, timeout=600) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(MiB):
+                first = first or time.monotonic()
+                received += len(chunk)
+        return first - started, time.monotonic() - started, received
+
+    started = time.monotonic()
+    results = run_threads(count, client)
+    wall = time.monotonic() - started
+    ok = [r for r in results if isinstance(r, tuple)]
+    return {
+        'mb_per_second': round(sum(r[2] for r in ok) / MiB / wall, 1),
+        'ttfb_p50_ms': _ms(percentile([r[0] for r in ok], 50)),
+        'ttfb_p99_ms': _ms(percentile([r[0] for r in ok], 99)),
+        'duration_p50_s': _s(percentile([r[1] for r in ok], 50)),
+        'duration_p99_s': _s(percentile([r[1] for r in ok], 99)),
+        'failures': count - len(ok),
+    }
+
+
+def scenario_api_info(app_url, options):
+    """A burst of /api/info requests over a few distinct videos"""
+    count = options.info_requests
+    distinct = options.info_distinct
+    serial = int(time.time())
+    session_local = threading.local()
+
+    def request_info(index):
+        session = getattr(session_local, 'session', None) or requests.Session()
+        session_local.session = session
+        url = media_url(media_id('P', MiB, serial + index % distinct))
+        started = time.monotonic()
+        response = session.post(f"{app_url}/api/info", json={'url': url, 'platform': 'youtube'}, timeout=120)
+        return time.monotonic() - started, response.status_code == 200 and 'error' not in response.json()
+
+    def burst(worker):
+        return [request_info(index) for index in range(worker, count, options.info_concurrency)]
+
+    started = time.monotonic()
+    results = [r for batch in run_threads(options.info_concurrency, burst) if isinstance(batch, list) for r in batch]
+    wall = time.monotonic() - started
+    ok = [r[0] for r in results if r[1]]
+    return {
+        'requests_per_second': round(len(ok) / wall, 1),
+        'latency_p50_ms': _ms(percentile(ok, 50)),
+        'latency_p99_ms': _ms(percentile(ok, 99)),
+        'failures': count - len(ok),
+    }
+
+
+# Libraries the app should only import when a job or info request needs them
+LAZY_MODULES = ('yt_dlp', 'instaloader', 'pytube', 'requests')
+
+IMPORT_PROBE = f"""
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+print(json.dumps({{'seconds': time.perf_counter() - started,
+                  'eager': [m for m in {LAZY_MODULES!r} if m in sys.modules],
+                  'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+
+def scenario_import_time(options):
+    """Cold `import app` in fresh interpreters: how long a new worker takes to be ready"""
+    times, eager, rss = [], 0, []
+    for _ in range(options.imports):
+        state_dir = tempfile.mkdtemp(prefix='bench_state_')
+        env = dict(os.environ,
+                   JOB_STORE_PATH=os.path.join(state_dir, 'jobs.sqlite3'),
+                   JOURNAL_DIR=os.path.join(state_dir, 'journal'),
+                   DOWNLOADS_DIR=os.path.join(state_dir, 'downloads'),
+                   HISTORY_DB_PATH=os.path.join(state_dir, 'history.sqlite3'))
+        try:
+            output = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=REPO_DIR, env=env, check=True,
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=120).stdout
+        finally:
+            shutil.rmtree(state_dir, ignore_errors=True)
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        times.append(result['seconds'])
+        eager = max(eager, len(result['eager']))
+        rss.append(result['max_rss_kb'] / 1024)
+    return {
+        'import_p50_ms': _ms(percentile(times, 50)),
+        'import_max_ms': _ms(max(times)),
+        'eager_imports': eager,
+        'peak_rss_mb': round(max(rss), 1),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def _s(seconds):
+    return None if seconds is None else round(seconds, 3)
+
+
+SCENARIOS = {
+    'downloads': scenario_downloads,
+    'sse_fanout': scenario_sse_fanout,
+    'get_file': scenario_get_file,
+    'api_info': scenario_api_info,
+    'import_time': scenario_import_time,
+}
+
+# Per-connection bandwidth of the media server for each scenario (bytes/s, 0 = unlimited);
+# fan-out wants a download slow enough to have many progress events; None = no servers at all,
+# the scenario is called with just the options
+SCENARIO_BANDWIDTH = {
+    'downloads': 16 * MiB,
+    'sse_fanout': 4 * MiB,
+    'get_file': 0,
+    'api_info': 0,
+    'import_time': None,
+}
+
+
+def is_regression(metric, current, baseline, tolerance):
+    if not isinstance(current, (int, float)) or not isinstance(baseline, (int, float)):
+        return False
+    if metric in ('failures', 'rejections', 'eager_imports'):
+        return current > baseline
+    if metric.endswith('_per_second'):
+        return current < baseline * (1 - tolerance)
+    # Latencies and memory: ignore sub-millisecond jitter on tiny values
+    return current > baseline * (1 + tolerance) and current - baseline > 1
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for scenario, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(scenario, {}).get(metric)
+            if is_regression(metric, value, base, tolerance):
+                regressions.append((scenario, metric, base, value))
+    return regressions
+
+
+def print_report(results, baseline):
+    for scenario, metrics in results.items():
+        print(f"\n{scenario}")
+        for metric, value in metrics.items():
+            base = baseline.get(scenario, {}).get(metric)
+            change = ''
+            if isinstance(value, (int, float)) and isinstance(base, (int, float)) and base:
+                change = f"  ({(value - base) / base:+.0%} vs baseline {base})"
+            print(f"  {metric:<22} {value}{change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('scenarios', nargs='*', help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--quick', action='store_true', help="smaller runs")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown (default 0.25)")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--bandwidth', help="override the media server's per-connection bandwidth, e.g. 8M")
+    parser.add_argument('--latency', type=float, default=0.01, help="media server latency per request (s)")
+    parser.add_argument('--asgi', action='store_true', help="serve the app through asgi.py and uvicorn")
+    parser.add_argument('--extract-delay', type=float, default=0.05, help="simulated extraction time (s)")
+    options = parser.parse_args()
+    unknown = set(options.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    scale = 4 if options.quick else 1
+    options.jobs = 16 // scale
+    options.job_size = 8 * MiB
+    options.subscribers = 200 // scale
+    options.fanout_size = 16 * MiB // scale
+    options.file_clients = 8 // (scale // 2 or 1)
+    options.file_size = 256 * MiB // scale
+    options.info_requests = 400 // scale
+    options.info_concurrency = 32 // scale
+    options.info_distinct = 20
+    options.imports = 10 // (scale // 2 or 1)
+
+    # Quick and full runs are sized differently, so each has its own baseline (per server)
+    profile = ('quick' if options.quick else 'full') + ('-asgi' if options.asgi else '')
+    baselines = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as f:
+            baselines = json.load(f)
+    baseline = baselines.get(profile, {})
+
+    results = {}
+    for name in options.scenarios or list(SCENARIOS):
+        if SCENARIO_BANDWIDTH[name] is None:
+            print(f"Running {name}...", flush=True)
+            results[name] = SCENARIOS[name](options)
+            continue
+        bandwidth = parse_size(options.bandwidth) if options.bandwidth else SCENARIO_BANDWIDTH[name]
+        media_server = MediaServer(bandwidth=bandwidth, latency=options.latency).start()
+        try:
+            with AppProcess(media_server.base_url, options.extract_delay, asgi=options.asgi) as app_process:
+                print(f"Running {name}...", flush=True)
+                metrics = SCENARIOS[name](app_process.url, options)
+                metrics['peak_rss_mb'] = app_process.peak_rss_mb()
+                results[name] = metrics
+        finally:
+            media_server.shutdown()
+            media_server.server_close()
+
+    print_report(results, baseline)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if options.save_baseline:
+        with open(options.baseline, 'w') as f:
+            baselines[profile] = dict(baseline, **results)
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nSaved {profile} baseline to {options.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, options.tolerance)
+    for scenario, metric, base, value in regressions:
+        print(f"REGRESSION {scenario}.{metric}: {base} -> {value}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
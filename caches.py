@@ -0,0 +1,242 @@
+import collections
+import copy
+import os
+import re
+import threading
+import time
+
+YOUTUBE_ID_PATTERN = re.compile(r'(?:v=|youtu\.be/|shorts/|embed/|live/)([A-Za-z0-9_-]{11})')
+INSTAGRAM_ID_PATTERN = re.compile(r'instagram\.com/(?:p|reel|reels|tv)/([^/?#&]+)')
+
+
+def canonical_media_id(url, platform, auth=None):
+    """(extractor, id) for a media URL, falling back to the normalized URL.
+
+    With ``auth`` (e.g. the cookiesfrombrowser spec used to extract) the key
+    becomes (extractor, id, auth), so results extracted with and without
+    credentials are never mixed up.
+    """
+    if platform == 'youtube':
+        match = YOUTUBE_ID_PATTERN.search(url)
+        key = ('Youtube', match.group(1)) if match else None
+    elif platform == 'instagram':
+        match = INSTAGRAM_ID_PATTERN.search(url)
+        key = ('Instagram', match.group(1)) if match else None
+    else:
+        key = None
+    if key is None:
+        key = ('url', url.strip().split('#', 1)[0])
+    if auth is not None:
+        key += (':'.join(filter(None, auth)) if isinstance(auth, (tuple, list)) else str(auth),)
+    return key
+
+
+class ResultCache:
+    """Size-bounded LRU cache of finished download artifacts with request coalescing.
+
+    ``lookup_or_claim`` answers in one atomic step whether a request can be
+    served from a finished artifact, should attach to an identical in-flight
+    job, or must start a new job (and become the leader for that key).
+    """
+
+    def __init__(self, max_bytes=5 * 1024 ** 3, max_entries=500, on_evict=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self._entries = collections.OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.joins = 0
+        self.evictions = 0
+
+    def lookup_or_claim(self, key, job_id):
+        """Returns ('hit', entry), ('join', leader_job_id) or ('lead', None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if os.path.exists(entry['file_path']):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return 'hit', dict(entry)
+                # Artifact vanished from disk; forget it
+                self._drop(key)
+
+            leader = self._in_flight.get(key)
+            if leader is not None:
+                self.joins += 1
+                return 'join', leader
+
+            self._in_flight[key] = job_id
+            self.misses += 1
+            return 'lead', None
+
+    def release(self, key, job_id, result=None):
+        """Finish a claimed key, caching ``result`` (a job dict) when given"""
+        evicted = []
+        with self._lock:
+            if self._in_flight.get(key) == job_id:
+                del self._in_flight[key]
+            if result is None or not result.get('file_path'):
+                return
+            try:
+                size = os.path.getsize(result['file_path'])
+            except OSError:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = dict(result, size=size)
+            self.total_bytes += size
+            while self._entries and (self.total_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                oldest_key = next(iter(self._entries))
+                evicted.append(self._drop(oldest_key))
+                self.evictions += 1
+
+        # Run callbacks (file deletion) outside the lock
+        if self.on_evict:
+            for entry in evicted:
+                self.on_evict(entry)
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def forget_files(self, paths):
+        """Drop entries whose artifact was deleted from disk by someone else"""
+        paths = set(paths)
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry['file_path'] in paths]:
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.joins
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'in_flight': len(self._in_flight),
+                'hits': self.hits,
+                'joins': self.joins,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.joins) / lookups, 3) if lookups else 0.0,
+            }
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry['size']
+        return entry
+
+
+class MetadataCache:
+    """TTL-bounded LRU cache of extracted media info dicts.
+
+    Concurrent loads of the same key are coalesced so one extraction serves
+    every waiting request. Callers always receive a deep copy, because
+    yt-dlp mutates info dicts while processing them.
+    """
+
+    def __init__(self, ttl=600, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def put(self, key, info):
+        with self._lock:
+            self._put(key, copy.deepcopy(info))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_or_load(self, key, loader):
+        """Cached info for ``key``, calling ``loader()`` once on a miss.
+
+        Each call counts once: a waiter served by another call's load is a
+        hit, a call that ends up running the loader is a miss.
+        """
+        with self._lock:
+            info = self._lookup(key)
+            if info is not None:
+                self.hits += 1
+                return info
+            pending = self._loading.get(key)
+            if pending is None:
+                pending = self._loading[key] = threading.Event()
+                self.misses += 1
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            pending.wait()
+            with self._lock:
+                info = self._lookup(key)
+                if info is not None:
+                    self.hits += 1
+                    return info
+                # The leading load failed; try on our own
+                self.misses += 1
+            return self._load(key, loader, None)
+
+        return self._load(key, loader, pending)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def _load(self, key, loader, pending):
+        try:
+            info = loader()
+            if info is not None:
+                with self._lock:
+                    self._put(key, info)
+            return copy.deepcopy(info)
+        finally:
+            if pending is not None:
+                with self._lock:
+                    self._loading.pop(key, None)
+                pending.set()
+
+    def _get(self, key):
+        info = self._lookup(key)
+        if info is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return info
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, info = entry
+            if time.monotonic() - stored_at < self.ttl:
+                self._entries.move_to_end(key)
+                return copy.deepcopy(info)
+            del self._entries[key]
+        return None
+
+    def _put(self, key, info):
+        # Stored objects are never handed out directly, only copies of them
+        self._entries[key] = (time.monotonic(), info)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
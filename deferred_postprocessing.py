@@ -0,0 +1,35 @@
+import yt_dlp
+
+
+class DeferredPostprocessingYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL that stops as soon as the downloaded bytes are on disk.
+
+    Everything yt-dlp would do to a file after downloading it (fixups,
+    merging video and audio, FFmpegExtractAudio, moving it into place) is
+    recorded instead of run, so it can be handed to another pool and run
+    there with run_postprocessing().
+    """
+
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init)
+        self.pending = []
+
+    def post_process(self, filename, info, files_to_move=None):
+        self.pending.append((filename, info, files_to_move))
+        info['filepath'] = filename
+        return info
+
+    def needs_postprocessing(self):
+        """True if any recorded step runs more than the trivial file move"""
+        if self._pps['post_process'] or self._pps['after_move']:
+            return bool(self.pending)
+        return any(info.get('__postprocessors') for _, info, _ in self.pending)
+
+    def run_postprocessing(self):
+        """Run the recorded steps, updating each info dict in place like yt-dlp does"""
+        pending, self.pending = self.pending, []
+        for filename, info, files_to_move in pending:
+            result = super().post_process(filename, info, files_to_move)
+            if result is not info:
+                info.clear()
+                info.update(result)
@@ -0,0 +1,215 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FIELDS = ('ts', 'job_id', 'platform', 'title', 'url', 'media_id', 'format', 'duration', 'size_bytes')
+
+
+def _fts5_available(db):
+    try:
+        db.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        db.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+class DownloadHistory:
+    """Append-only history of finished downloads in SQLite.
+
+    ``record()`` only puts the entry on a bounded in-memory queue, so it
+    never blocks a download thread; a background writer inserts queued
+    entries in batches (one transaction per ``batch_size`` entries or
+    ``flush_interval`` seconds). If the queue is full the entry is dropped
+    and counted rather than waited for.
+
+    Rows are indexed by time, platform and URL, and titles are searchable
+    through an FTS5 index (a prefix match on an indexed column when FTS5 is
+    not compiled in). ``query()`` pages by row ID, so the cost of a page
+    does not grow with the size of the table.
+    """
+
+    def __init__(self, path, flush_interval=1.0, batch_size=500, max_queue=10000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writer = None
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = self._connection()
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                job_id TEXT,
+                platform TEXT,
+                title TEXT,
+                url TEXT,
+                media_id TEXT,
+                format TEXT,
+                duration TEXT,
+                size_bytes INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS downloads_ts ON downloads (ts);
+            CREATE INDEX IF NOT EXISTS downloads_platform ON downloads (platform, id);
+            CREATE INDEX IF NOT EXISTS downloads_url ON downloads (url);
+            CREATE INDEX IF NOT EXISTS downloads_title ON downloads (title COLLATE NOCASE);
+        """)
+        self.full_text = _fts5_available(db)
+        if self.full_text:
+            db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS downloads_fts USING fts5("
+                       "title, content='downloads', content_rowid='id')")
+
+    def start(self):
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def record(self, entry):
+        """Queue a history entry; returns False if it had to be dropped"""
+        self.start()
+        row = tuple(entry.get(field) for field in HISTORY_FIELDS)
+        if row[0] is None:
+            row = (time.time(),) + row[1:]
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far is on disk (tests, shutdown)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def query(self, platform=None, search=None, url=None, since=None, until=None, before_id=None, limit=50):
+        """Newest-first page of history rows matching the filters.
+
+        Returns ``(rows, next_before_id)``; pass ``next_before_id`` back as
+        ``before_id`` for the next page (None when there are no more rows).
+        """
+        clauses = []
+        params = []
+        if platform:
+            clauses.append("d.platform = ?")
+            params.append(platform)
+        if url:
+            clauses.append("d.url = ?")
+            params.append(url)
+        if since is not None:
+            clauses.append("d.ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("d.ts < ?")
+            params.append(until)
+
+        source = "downloads d"
+        order = "d.id"
+        if search and self.full_text:
+            search = self._match_expression(search)
+        if search:
+            if self.full_text:
+                # Walk the full-text index newest first and stop at the page size,
+                # instead of collecting and sorting every match
+                source = "downloads_fts f CROSS JOIN downloads d ON d.id = f.rowid"
+                order = "f.rowid"
+                clauses.append("downloads_fts MATCH ?")
+                params.append(search)
+            else:
+                clauses.append("d.title LIKE ? COLLATE NOCASE")
+                params.append(search.replace('%', '').replace('_', '') + '%')
+        if before_id is not None:
+            clauses.append(f"{order} < ?")
+            params.append(before_id)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        columns = ', '.join(f"d.{field}" for field in ('id',) + HISTORY_FIELDS)
+        rows = self._connection().execute(
+            f"SELECT {columns} FROM {source} {where} ORDER BY {order} DESC LIMIT ?", params + [limit + 1]).fetchall()
+
+        results = [dict(zip(('id',) + HISTORY_FIELDS, row)) for row in rows[:limit]]
+        next_before_id = results[-1]['id'] if len(rows) > limit else None
+        return results, next_before_id
+
+    def stats(self):
+        with self._lock:
+            return {
+                'written': self.written,
+                'queued': self._queue.qsize(),
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'full_text': self.full_text,
+            }
+
+    @staticmethod
+    def _match_expression(search):
+        # Each word must appear; quoting keeps user input out of FTS syntax
+        words = [word.replace('"', '') for word in search.split()]
+        return ' '.join(f'"{word}"*' for word in words if word)
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._insert(batch)
+                with self._lock:
+                    self.written += len(batch)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                logger.error(f"Error writing download history: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _insert(self, batch):
+        db = self._connection()
+        placeholders = ', '.join('?' for _ in HISTORY_FIELDS)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for row in batch:
+                cursor = db.execute(f"INSERT INTO downloads ({', '.join(HISTORY_FIELDS)}) VALUES ({placeholders})", row)
+                if self.full_text:
+                    db.execute("INSERT INTO downloads_fts (rowid, title) VALUES (?, ?)",
+                               (cursor.lastrowid, row[HISTORY_FIELDS.index('title')]))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
@@ -0,0 +1,231 @@
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SessionState = collections.namedtuple('SessionState', 'opener cookiejar extractors generation loaded_at')
+
+
+class SharedSessionMixin:
+    """Makes a YoutubeDL class run on an ExtractorSession.
+
+    Instead of building its own HTTP opener (TLS context, cookie jar loaded
+    from the browser) and registering every extractor class, the instance
+    takes the session's, which turns construction from ~100 ms of work into
+    a few dict copies.
+    """
+
+    def __init__(self, params=None, auto_init=True, session=None):
+        self._session_state = session.state() if session is not None else None
+        super().__init__(params, auto_init)
+
+    def add_default_info_extractors(self):
+        if self._session_state is None:
+            return super().add_default_info_extractors()
+        self._ies.update(self._session_state.extractors)
+
+    def _setup_opener(self):
+        if self._session_state is None:
+            return super()._setup_opener()
+        timeout = self.params.get('socket_timeout')
+        self._socket_timeout = 20 if timeout is None else float(timeout)
+        self.cookiejar = self._session_state.cookiejar
+        self._opener = self._session_state.opener
+
+
+class ExtractorSession:
+    """An HTTP opener, cookie jar and extractor list shared by many YoutubeDL instances.
+
+    Loaded on first use. Once older than ``refresh_interval`` it is reloaded
+    in the background (re-reading the browser's cookies) while callers keep
+    using the current one; a failed reload keeps the old state and is tried
+    again an interval later.
+    """
+
+    def __init__(self, cookies_from_browser=None, template_params=None, refresh_interval=1800):
+        self.cookies_from_browser = cookies_from_browser
+        self.template_params = dict(template_params or {})
+        self.refresh_interval = refresh_interval
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._state = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def state(self):
+        state = self._state
+        if state is None:
+            with self._lock:
+                if self._state is None:
+                    self._state = self._load(generation=1)
+                state = self._state
+        elif time.time() - state.loaded_at > self.refresh_interval:
+            self._refresh_in_background()
+        return state
+
+    def refresh(self):
+        """Reload now; returns False (keeping the current state) if loading fails"""
+        generation = self._state.generation + 1 if self._state else 1
+        try:
+            state = self._load(generation)
+        except Exception as e:
+            logger.error(f"Error refreshing extractor session {self.label()}: {str(e)}")
+            with self._lock:
+                self.refresh_failures += 1
+                if self._state is not None:
+                    self._state = self._state._replace(loaded_at=time.time())
+                self._refreshing = False
+            return False
+        with self._lock:
+            self._state = state
+            self.refreshes += 1
+            self._refreshing = False
+        return True
+
+    def label(self):
+        return ':'.join(filter(None, self.cookies_from_browser)) if self.cookies_from_browser else 'anonymous'
+
+    def stats(self):
+        state = self._state
+        return {
+            'loaded': state is not None,
+            'age_seconds': round(time.time() - state.loaded_at, 1) if state else None,
+            'generation': state.generation if state else 0,
+            'cookies': len(state.cookiejar) if state else 0,
+            'refreshes': self.refreshes,
+            'refresh_failures': self.refresh_failures,
+        }
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="extractor-session-refresh", daemon=True).start()
+
+    def _load(self, generation):
+        import yt_dlp
+
+        params = dict(self.template_params)
+        if self.cookies_from_browser:
+            params['cookiesfrombrowser'] = self.cookies_from_browser
+        started = time.monotonic()
+        template = yt_dlp.YoutubeDL(params)
+        logger.debug(f"Loaded extractor session {self.label()} in {time.monotonic() - started:.2f}s")
+        return SessionState(template._opener, template.cookiejar, dict(template._ies), generation, time.time())
+
+
+class ExtractorSessions:
+    """Long-lived extractor state shared by every job in the process.
+
+    open() builds a YoutubeDL on the shared session for its
+    ``cookiesfrombrowser`` setting, so browser cookies are decrypted once
+    per refresh interval instead of once per job. borrow() lends out pooled,
+    already-warm objects (info-extraction YoutubeDLs whose extractors keep
+    their player caches, Instaloader instances) to one thread at a time.
+    http_session() is a keep-alive requests session for direct fetches.
+    """
+
+    def __init__(self, template_params=None, refresh_interval=1800, max_idle=4, max_age=3600, http_pool_size=16):
+        self.template_params = dict(template_params or {})
+        self.refresh_interval = refresh_interval
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self.http_pool_size = http_pool_size
+        self.created = 0
+        self.reused = 0
+        self._sessions = {}
+        self._classes = {}
+        self._idle = collections.defaultdict(list)
+        self._http = None
+        self._lock = threading.Lock()
+
+    def session(self, cookies_from_browser=None):
+        key = tuple(cookies_from_browser) if cookies_from_browser else None
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = ExtractorSession(key, self.template_params, self.refresh_interval)
+            return session
+
+    def open(self, params, ydl_class=None):
+        """A new ydl_class (default YoutubeDL) instance for params, on the matching shared session"""
+        session = self.session(params.get('cookiesfrombrowser'))
+        return self._session_class(ydl_class)(params, session=session)
+
+    @contextlib.contextmanager
+    def borrow(self, key, factory, generation=None):
+        """Lend an idle object pooled under key, making one with factory() if none is idle.
+
+        Objects built on a session should pass its ``state().generation``:
+        pooled ones from an older generation (before a refresh) are dropped.
+        """
+        now = time.time()
+        item = None
+        with self._lock:
+            idle = self._idle[key]
+            while idle:
+                candidate = idle.pop()
+                if now - candidate[1] < self.max_age and candidate[2] == generation:
+                    item = candidate
+                    self.reused += 1
+                    break
+        if item is None:
+            item = (factory(), now, generation)
+            with self._lock:
+                self.created += 1
+
+        try:
+            yield item[0]
+        finally:
+            with self._lock:
+                idle = self._idle[key]
+                if len(idle) < self.max_idle:
+                    idle.append(item)
+
+    def http_session(self):
+        if self._http is None:
+            import requests
+
+            with self._lock:
+                if self._http is None:
+                    http = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=self.http_pool_size,
+                                                            pool_maxsize=self.http_pool_size)
+                    http.mount('http://', adapter)
+                    http.mount('https://', adapter)
+                    self._http = http
+        return self._http
+
+    def refresh(self):
+        """Reload every session now and drop pooled objects built on the old ones"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._idle.clear()
+        return all([session.refresh() for session in sessions])
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            idle = {key: len(items) for key, items in self._idle.items()}
+            created, reused = self.created, self.reused
+        return {
+            'sessions': {session.label(): session.stats() for session in sessions},
+            'idle': idle,
+            'created': created,
+            'reused': reused,
+        }
+
+    def _session_class(self, ydl_class):
+        if ydl_class is None:
+            import yt_dlp
+            ydl_class = yt_dlp.YoutubeDL
+        with self._lock:
+            cls = self._classes.get(ydl_class)
+            if cls is None:
+                cls = self._classes[ydl_class] = type(f"Session{ydl_class.__name__}",
+                                                      (SharedSessionMixin, ydl_class), {})
+            return cls
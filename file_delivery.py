@@ -0,0 +1,147 @@
+import asyncio
+import os
+from urllib.parse import quote
+
+from flask import Response
+from werkzeug.wsgi import wrap_file
+
+# Delivery modes: stream from Python, or let the front-end server send the bytes
+DELIVERY_STREAM = 'stream'
+DELIVERY_X_SENDFILE = 'x-sendfile'
+DELIVERY_X_ACCEL = 'x-accel'
+
+MEDIA_MIMETYPES = {
+    'mp4': 'video/mp4',
+    'webm': 'video/webm',
+    'mkv': 'video/x-matroska',
+    'mp3': 'audio/mp3',
+    'm4a': 'audio/mp4',
+    'opus': 'audio/ogg',
+    'ogg': 'audio/ogg',
+}
+
+
+def media_mimetype(ext):
+    return MEDIA_MIMETYPES.get((ext or '').lower(), 'application/octet-stream')
+
+
+def partial_file_ext(partial_path, default='mp4'):
+    """Media extension of the file being written to partial_path (name.webm.part -> webm)"""
+    name = os.path.basename(partial_path or '')
+    if name.endswith('.part'):
+        name = name[:-len('.part')]
+    return os.path.splitext(name)[1].lstrip('.').lower() or default
+
+
+def content_disposition(download_name, as_attachment=True):
+    """Content-Disposition value that survives non-ASCII titles"""
+    kind = 'attachment' if as_attachment else 'inline'
+    try:
+        download_name.encode('latin-1')
+        safe_name = download_name.replace('\\', '\\\\').replace('"', '\\"')
+        return f'{kind}; filename="{safe_name}"'
+    except UnicodeEncodeError:
+        ascii_name = download_name.encode('ascii', 'ignore').decode('ascii') or 'download'
+        return f"{kind}; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(download_name)}"
+
+
+def file_etag(stat):
+    return f"{stat.st_ino:x}-{stat.st_size:x}-{int(stat.st_mtime_ns):x}"
+
+
+def stream_file_response(request, file_path, download_name, mimetype,
+                         mode=DELIVERY_STREAM, accel_uri=None, chunk_size=256 * 1024,
+                         as_attachment=True, max_age=3600):
+    """Serve a file with bounded memory.
+
+    Supports Range (206), If-None-Match/If-Modified-Since (304) and If-Range.
+    In ``x-sendfile`` mode the body is left to the front-end server via the
+    X-Sendfile header; in ``x-accel`` mode nginx is redirected to
+    ``accel_uri`` (an internal location). Otherwise the file is streamed in
+    ``chunk_size`` blocks, using the server's wsgi.file_wrapper (sendfile
+    under gunicorn) when one is available.
+    """
+    stat = os.stat(file_path)
+    offloaded = True
+
+    if mode == DELIVERY_X_ACCEL and accel_uri:
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = quote(accel_uri)
+    elif mode == DELIVERY_X_SENDFILE:
+        response = Response(mimetype=mimetype)
+        response.headers['X-Sendfile'] = file_path
+    else:
+        offloaded = False
+        data = wrap_file(request.environ, open(file_path, 'rb'), buffer_size=chunk_size)
+        response = Response(data, mimetype=mimetype, direct_passthrough=True)
+        response.content_length = stat.st_size
+
+    response.headers['Content-Disposition'] = content_disposition(download_name, as_attachment)
+    response.last_modified = int(stat.st_mtime)
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    response.set_etag(file_etag(stat))
+
+    if offloaded:
+        # The front-end server answers Range requests itself
+        return response.make_conditional(request)
+    return response.make_conditional(request, accept_ranges=True, complete_length=stat.st_size)
+
+
+def tail_growing_file(file_path, download_state, wait_for_change, chunk_size=256 * 1024, poll_interval=1.0):
+    """Yield a file's bytes as another thread appends to it.
+
+    ``download_state()`` returns 'growing', 'done' or 'failed';
+    ``wait_for_change(timeout)`` blocks until the writer reports progress.
+    The file is opened once, so the stream survives the writer renaming
+    its ``.part`` file into place. A failed download stops the stream early,
+    which the client sees as a truncated response.
+    """
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                yield chunk
+                continue
+
+            state = download_state()
+            if state == 'failed':
+                return
+            if state == 'done':
+                # Drain whatever was written after our last read
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+            wait_for_change(poll_interval)
+
+
+async def tail_growing_file_async(file_path, download_state, wait_for_change, chunk_size=256 * 1024,
+                                  poll_interval=1.0):
+    """tail_growing_file() for asyncio servers.
+
+    ``download_state()`` and ``wait_for_change(timeout)`` are coroutines, and
+    each read runs in the default executor, so a stream that waits for the
+    writer holds no thread.
+    """
+    loop = asyncio.get_running_loop()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, chunk_size)
+            if chunk:
+                yield chunk
+                continue
+
+            state = await download_state()
+            if state == 'failed':
+                return
+            if state == 'done':
+                while True:
+                    chunk = await loop.run_in_executor(None, f.read, chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+            await wait_for_change(poll_interval)
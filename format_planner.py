@@ -0,0 +1,225 @@
+QUALITY_HEIGHTS = {'highest': None, '1080p': 1080, '720p': 720, '480p': 480, '360p': 360}
+
+# Codecs that can be stream-copied into each container without re-encoding
+CONTAINER_CODECS = {
+    'mp4': {'video': ('avc1', 'h264', 'av01', 'hvc1', 'hev1', 'mp4v'), 'audio': ('mp4a', 'aac', 'mp3')},
+    'm4a': {'audio': ('mp4a', 'aac')},
+    'mp3': {'audio': ('mp3',)},
+    'opus': {'audio': ('opus',)},
+}
+AUDIO_CONTAINERS = ('mp3', 'm4a', 'opus', 'original')
+# ffmpeg encoder FFmpegExtractAudio needs to transcode into each container
+AUDIO_ENCODERS = {'mp3': 'libmp3lame', 'm4a': 'aac', 'opus': 'libopus'}
+
+# Rough throughput figures used to turn work into seconds of CPU
+REMUX_BYTES_PER_SECOND = 150 * 1024 * 1024
+FFMPEG_STARTUP_SECONDS = 0.5  # process spawn and probing, paid by every merge/remux/transcode
+AUDIO_TRANSCODE_SPEED = 60  # seconds of audio encoded per CPU second
+# How many downloaded bytes one CPU second is worth when comparing plans
+CPU_SECOND_COST_BYTES = 4 * 1024 * 1024
+# Minimum source bitrate (kbit/s) considered good enough for a 192k mp3
+MIN_TRANSCODE_SOURCE_ABR = 120
+
+
+def _has_video(fmt):
+    return fmt.get('vcodec') not in (None, 'none') or (fmt.get('vcodec') is None and fmt.get('height'))
+
+
+def _has_audio(fmt):
+    return fmt.get('acodec') not in (None, 'none') or (fmt.get('acodec') is None and not fmt.get('height'))
+
+
+def _codec_fits(codec, container, kind):
+    allowed = CONTAINER_CODECS.get(container, {}).get(kind)
+    return bool(allowed and codec and codec.split('.')[0].lower() in allowed)
+
+
+def estimate_size(fmt, duration):
+    """Best guess of a format's size in bytes, or None"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    bitrate = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if bitrate and duration:
+        return int(bitrate * 1000 / 8 * duration)
+    return None
+
+
+def _plan(strategy, formats, ext, duration, cpu_seconds, postprocessors=None, **extra):
+    # Imported here so importing the planner does not import all of yt-dlp
+    from yt_dlp.utils import determine_protocol
+
+    sizes = [estimate_size(fmt, duration) for fmt in formats]
+    estimated_bytes = sum(sizes) if all(size is not None for size in sizes) else None
+    plan = {
+        'strategy': strategy,
+        'format_ids': [fmt['format_id'] for fmt in formats],
+        'ext': ext,
+        'height': max((fmt.get('height') or 0 for fmt in formats), default=0) or None,
+        'vcodec': next((fmt.get('vcodec') for fmt in formats if _has_video(fmt)), None),
+        'acodec': next((fmt.get('acodec') for fmt in formats if _has_audio(fmt)), None),
+        'protocols': sorted({determine_protocol(fmt) for fmt in formats if fmt.get('url')}),
+        'estimated_bytes': estimated_bytes,
+        'estimated_cpu_seconds': round(cpu_seconds, 2),
+        'postprocessors': postprocessors or [],
+    }
+    plan.update(extra)
+    return plan
+
+
+def _cost(plan):
+    size = plan['estimated_bytes'] if plan['estimated_bytes'] is not None else float('inf')
+    return size + plan['estimated_cpu_seconds'] * CPU_SECOND_COST_BYTES
+
+
+def _video_candidates(formats, container, duration, ffmpeg_available):
+    progressive = [f for f in formats if _has_video(f) and _has_audio(f)]
+    video_only = [f for f in formats if _has_video(f) and not _has_audio(f)]
+    audio_only = [f for f in formats if _has_audio(f) and not _has_video(f)]
+
+    candidates = []
+    for fmt in progressive:
+        compatible = (_codec_fits(fmt.get('vcodec'), container, 'video')
+                      and _codec_fits(fmt.get('acodec'), container, 'audio'))
+        if fmt.get('ext') == container:
+            candidates.append(_plan('progressive', [fmt], container, duration, 0, compatible=compatible))
+        elif ffmpeg_available:
+            size = estimate_size(fmt, duration) or 0
+            candidates.append(_plan('remux', [fmt], container, duration,
+                                    FFMPEG_STARTUP_SECONDS + size / REMUX_BYTES_PER_SECOND,
+                                    postprocessors=[{'key': 'FFmpegVideoRemuxer', 'preferedformat': container}],
+                                    compatible=compatible))
+
+    if ffmpeg_available and video_only and audio_only:
+        # Pair every video stream with the best audio stream that can be copied
+        fitting_audio = [f for f in audio_only if _codec_fits(f.get('acodec'), container, 'audio')] or audio_only
+        audio = max(fitting_audio, key=lambda f: (f.get('abr') or f.get('tbr') or 0))
+        for fmt in video_only:
+            size = (estimate_size(fmt, duration) or 0) + (estimate_size(audio, duration) or 0)
+            compatible = (_codec_fits(fmt.get('vcodec'), container, 'video')
+                          and _codec_fits(audio.get('acodec'), container, 'audio'))
+            candidates.append(_plan('merge', [fmt, audio], container, duration,
+                                    FFMPEG_STARTUP_SECONDS + size / REMUX_BYTES_PER_SECOND,
+                                    compatible=compatible))
+    return candidates
+
+
+def _audio_candidates(formats, container, duration, ffmpeg_available, encoders=None):
+    audio_only = [f for f in formats if _has_audio(f) and not _has_video(f)]
+    sources = audio_only or [f for f in formats if _has_audio(f)]
+
+    candidates = []
+    for fmt in sources:
+        if container == 'original':
+            candidates.append(_plan('audio-copy', [fmt], fmt.get('ext'), duration, 0, compatible=True))
+        elif _codec_fits(fmt.get('acodec'), container, 'audio') and (fmt.get('ext') == container or not _has_video(fmt)):
+            if fmt.get('ext') == container:
+                candidates.append(_plan('audio-copy', [fmt], container, duration, 0, compatible=True))
+            elif ffmpeg_available:
+                size = estimate_size(fmt, duration) or 0
+                candidates.append(_plan('audio-remux', [fmt], container, duration,
+                                        FFMPEG_STARTUP_SECONDS + size / REMUX_BYTES_PER_SECOND,
+                                        postprocessors=[{'key': 'FFmpegExtractAudio', 'preferredcodec': container}],
+                                        compatible=True))
+        elif ffmpeg_available and (encoders is None or AUDIO_ENCODERS.get(container) in encoders):
+            abr = fmt.get('abr') or fmt.get('tbr') or 0
+            candidates.append(_plan('audio-transcode', [fmt], container, duration,
+                                    FFMPEG_STARTUP_SECONDS + (duration or 0) / AUDIO_TRANSCODE_SPEED,
+                                    postprocessors=[{'key': 'FFmpegExtractAudio', 'preferredcodec': container,
+                                                     'preferredquality': '192'}],
+                                    compatible=abr == 0 or abr >= MIN_TRANSCODE_SOURCE_ABR))
+    return candidates
+
+
+def plan_download(info, format_type='video', quality='highest', container=None, ffmpeg_available=True,
+                  encoders=None):
+    """Pick the cheapest way to produce the requested output from the formats on offer.
+
+    Quality comes first (the tallest video within the requested height, the
+    best stream-copyable audio); among plans of equal quality the one with the
+    fewest bytes to fetch plus CPU work (weighted by CPU_SECOND_COST_BYTES)
+    wins, so a progressive file beats a video+audio merge and a stream copy
+    beats a re-encode. Returns a plan dict whose 'format' is a yt-dlp format
+    spec (with a generic fallback), 'postprocessors' and 'merge_output_format'
+    go straight into the YoutubeDL options, and 'candidates' lists every
+    plan that was considered. ``encoders`` (names from ffmpeg, None if
+    unknown) rules out transcodes ffmpeg has no encoder for.
+    """
+    duration = info.get('duration')
+    formats = [f for f in info.get('formats') or [] if f.get('format_id') and f.get('url')
+               and f.get('ext') != 'mhtml']
+
+    if format_type == 'audio':
+        container = container if container in AUDIO_CONTAINERS else 'mp3'
+        candidates = _audio_candidates(formats, container, duration, ffmpeg_available, encoders)
+        fallback = 'bestaudio/best'
+    else:
+        container = 'mp4'
+        max_height = QUALITY_HEIGHTS.get(quality)
+        if max_height:
+            formats = [f for f in formats if not _has_video(f) or (f.get('height') or 0) <= max_height]
+        candidates = _video_candidates(formats, container, duration, ffmpeg_available)
+        if max_height:
+            fallback = f'best[height<={max_height}][ext=mp4]/best[height<={max_height}]/best'
+        else:
+            fallback = 'best[ext=mp4]/best'
+
+    if not candidates:
+        return {
+            'strategy': 'fallback',
+            'format': fallback,
+            'format_ids': [],
+            'ext': container if container != 'original' else None,
+            'estimated_bytes': None,
+            'estimated_cpu_seconds': None,
+            'postprocessors': ([{'key': 'FFmpegExtractAudio', 'preferredcodec': container, 'preferredquality': '192'}]
+                               if format_type == 'audio' and container != 'original' and ffmpeg_available else []),
+            'merge_output_format': container if format_type != 'audio' else None,
+            'candidates': [],
+            'reason': 'No usable formats listed; letting yt-dlp choose',
+        }
+
+    # Prefer plans whose codecs fit the container natively (and, for audio,
+    # sources good enough to transcode from) when any exist
+    pool = [plan for plan in candidates if plan['compatible']] or candidates
+
+    if format_type == 'audio':
+        # Stream copies keep the source bitrate, so take the best one available;
+        # a transcode always ends up at 192k and only needs the cheapest good source
+        copies = [plan for plan in pool if plan['strategy'] != 'audio-transcode']
+        if copies:
+            best_abr = max(_source_abr(plan, formats) for plan in copies)
+            pool = [plan for plan in copies if _source_abr(plan, formats) >= best_abr]
+    else:
+        best_height = max(plan['height'] or 0 for plan in pool)
+        pool = [plan for plan in pool if (plan['height'] or 0) == best_height]
+
+    chosen = dict(min(pool, key=_cost))
+    chosen['format'] = '+'.join(chosen['format_ids']) + '/' + fallback
+    chosen['merge_output_format'] = container if chosen['strategy'] == 'merge' else None
+    chosen['candidates'] = [
+        {key: plan[key] for key in ('strategy', 'format_ids', 'ext', 'height', 'vcodec', 'acodec',
+                                    'estimated_bytes', 'estimated_cpu_seconds', 'compatible')}
+        for plan in sorted(candidates, key=_cost)
+    ]
+    chosen['reason'] = _describe(chosen)
+    return chosen
+
+
+def _source_abr(plan, formats):
+    by_id = {f['format_id']: f for f in formats}
+    fmt = by_id.get(plan['format_ids'][0], {})
+    return fmt.get('abr') or fmt.get('tbr') or 0
+
+
+def _describe(plan):
+    formats = '+'.join(plan['format_ids'])
+    descriptions = {
+        'progressive': f"single progressive format {formats}, no merge or re-encode",
+        'remux': f"progressive format {formats}, stream-copied into {plan['ext']}",
+        'merge': f"video+audio {formats}, stream-copied into {plan['ext']}",
+        'audio-copy': f"audio format {formats} kept as-is",
+        'audio-remux': f"audio format {formats}, stream-copied into {plan['ext']}",
+        'audio-transcode': f"audio format {formats}, re-encoded to {plan['ext']}",
+    }
+    return descriptions.get(plan['strategy'], plan['strategy'])
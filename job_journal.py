@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobJournal:
+    """Crash-safe on-disk record of unfinished download jobs.
+
+    Every job gets a small JSON file (``<job_id>.json``) holding what is
+    needed to run it again: platform, target arguments, cache key, chosen
+    format and the partial file with its byte offset. Extracted media info is
+    kept next to it in ``<job_id>.info.json`` so it is written once rather
+    than on every checkpoint. Files are replaced atomically, so a crash
+    leaves either the old or the new record, never a torn one. Journal errors
+    are logged and never fail a download.
+    """
+
+    def __init__(self, directory, checkpoint_interval=5.0):
+        self.directory = directory
+        self.checkpoint_interval = checkpoint_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._last_write = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, job_id, **fields):
+        """Merge fields into a job's record and write it to disk"""
+        with self._lock:
+            entry = self._entries.setdefault(job_id, {'job_id': job_id})
+            entry.update(fields)
+            entry['owner_pid'] = os.getpid()
+            entry['owner_host'] = socket.gethostname()
+            entry['updated_at'] = time.time()
+            self._last_write[job_id] = time.monotonic()
+            self._write(self._path(job_id), entry)
+
+    def checkpoint(self, job_id, **fields):
+        """Like record(), but writes at most once per checkpoint_interval"""
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry is None:
+                return
+            entry.update(fields)
+            if time.monotonic() - self._last_write.get(job_id, 0) < self.checkpoint_interval:
+                return
+        self.record(job_id)
+
+    def record_info(self, job_id, info):
+        with self._lock:
+            if job_id in self._entries:
+                self._write(self._path(job_id, 'info'), {'extracted_at': time.time(), 'info': info})
+
+    def load_info(self, job_id, max_age=None):
+        """Journaled media info for a job, or None if missing or older than max_age seconds"""
+        try:
+            with open(self._path(job_id, 'info')) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if max_age is not None and time.time() - data.get('extracted_at', 0) > max_age:
+            return None
+        return data.get('info')
+
+    def remove(self, job_id):
+        with self._lock:
+            self._entries.pop(job_id, None)
+            self._last_write.pop(job_id, None)
+            for path in (self._path(job_id), self._path(job_id, 'info')):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"Error removing journal file {path}: {str(e)}")
+
+    def job_ids(self):
+        """IDs of every journaled (unfinished) job, whichever process owns it"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [name[:-len('.json')] for name in names if name.endswith('.json') and not name.endswith('.info.json')]
+
+    def claim_orphans(self):
+        """Take over records left behind by processes that are no longer running.
+
+        Each record is claimed with an atomic rename, so when several workers
+        start at once every orphaned job is resumed by exactly one of them.
+        """
+        claimed = []
+        try:
+            names = sorted(os.listdir(self.directory))
+        except OSError as e:
+            logger.error(f"Error reading journal directory {self.directory}: {str(e)}")
+            return claimed
+
+        hostname = socket.gethostname()
+        for name in names:
+            if not name.endswith('.json') or name.endswith('.info.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            owner = entry.get('owner_pid')
+            if (entry.get('owner_host') == hostname and owner and owner != os.getpid()
+                    and _pid_alive(owner)):
+                continue
+
+            claim_path = f"{path}.{os.getpid()}.claim"
+            try:
+                os.rename(path, claim_path)
+            except OSError:
+                # Another worker got there first
+                continue
+            job_id = entry['job_id']
+            self.record(job_id, **{k: v for k, v in entry.items() if k != 'job_id'})
+            try:
+                os.remove(claim_path)
+            except OSError:
+                pass
+            claimed.append(dict(self._entries[job_id]))
+        return claimed
+
+    def _path(self, job_id, kind=None):
+        suffix = f".{kind}.json" if kind else '.json'
+        return os.path.join(self.directory, f"{job_id}{suffix}")
+
+    def _write(self, path, data):
+        # Called with the lock held
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, default=repr)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Error writing journal file {path}: {str(e)}")
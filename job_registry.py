@@ -0,0 +1,308 @@
+import asyncio
+import collections
+import logging
+import threading
+import time
+import uuid
+
+from job_store import TERMINAL_STATUSES, MemoryJobStore
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Receives change notifications for a set of jobs.
+
+    Notifications are coalesced: a subscriber that falls behind only sees
+    which jobs changed, and reads their latest state when it wakes up.
+    """
+
+    def __init__(self, registry, job_ids, client_id=None):
+        self.registry = registry
+        self.client_id = client_id
+        self.job_ids = set(job_ids)
+        self._changed = set(self.job_ids)
+        self._event = threading.Event()
+        self._event.set()
+        self._lock = threading.Lock()
+
+    def notify(self, job_id):
+        with self._lock:
+            self._changed.add(job_id)
+        self._event.set()
+
+    def wait(self, timeout=None):
+        """Block until a watched job changes; returns the changed IDs (empty on timeout)"""
+        self._event.wait(timeout)
+        with self._lock:
+            self._event.clear()
+            changed, self._changed = self._changed, set()
+        return changed
+
+    def add(self, job_id):
+        """Start watching another job"""
+        self.registry.watch(self, job_id)
+
+    def discard(self, job_id):
+        """Stop watching a job"""
+        self.registry.unwatch(self, job_id)
+
+    def close(self):
+        self.registry.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncSubscription(Subscription):
+    """Subscription for asyncio code: wait() is a coroutine, and notify() may be
+    called from any thread. Create it from the event loop's thread."""
+
+    def __init__(self, registry, job_ids, client_id=None):
+        super().__init__(registry, job_ids, client_id)
+        self._loop = asyncio.get_running_loop()
+        self._async_event = asyncio.Event()
+        self._async_event.set()
+        self._wakeup_pending = False
+
+    def notify(self, job_id):
+        with self._lock:
+            self._changed.add(job_id)
+            if self._wakeup_pending:
+                return
+            self._wakeup_pending = True
+        self.interrupt()
+
+    def interrupt(self):
+        """Wake a pending wait() without reporting a change"""
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # Loop already closed; nobody is waiting any more
+            pass
+
+    def _wake(self):
+        with self._lock:
+            self._wakeup_pending = False
+        self._async_event.set()
+
+    async def wait(self, timeout=None):
+        try:
+            await asyncio.wait_for(self._async_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self._lock:
+            self._async_event.clear()
+            changed, self._changed = self._changed, set()
+        return changed
+
+
+class JobRegistry:
+    """Thread-safe store of download job state.
+
+    Every job gets a collision-free ID. Running jobs are kept until they
+    finish; finished and failed jobs are evicted once they are older than
+    ``ttl`` seconds or when more than ``max_finished`` of them are retained
+    (least recently used first), so memory stays bounded on a long-running
+    server.
+
+    Job state lives in ``store`` (in-memory by default). With a shared store
+    such as SQLiteJobStore every worker process sees the same jobs, and a
+    background thread polls the store so subscribers here also wake up for
+    changes made by other processes.
+    """
+
+    # Bookkeeping that outlives a failure: the job's trace and whether it is being profiled
+    KEPT_ON_FAIL = ('trace', 'profile')
+
+    def __init__(self, ttl=3600, max_finished=1000, store=None, poll_interval=0.2):
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self.store = store if store is not None else MemoryJobStore()
+        self.poll_interval = poll_interval
+        self._subscribers = collections.defaultdict(set)
+        self._client_subscribers = collections.defaultdict(set)
+        self._lock = threading.RLock()
+        self._poller = None
+        self.evicted = 0
+
+    @staticmethod
+    def new_id(prefix):
+        return f"{prefix}_{uuid.uuid4().hex[:16]}"
+
+    def create(self, job_id, client_id=None, **fields):
+        with self._lock:
+            self._evict()
+            self.store.create(job_id, fields)
+            if client_id:
+                self._attach_client(job_id, client_id)
+            self._publish(job_id)
+        return job_id
+
+    def attach_client(self, job_id, client_id):
+        """Make an existing job part of another client session"""
+        with self._lock:
+            return self._attach_client(job_id, client_id) is not None
+
+    def get(self, job_id):
+        """Snapshot of a job's state, or None if unknown or evicted"""
+        return self.store.get(job_id)
+
+    def update(self, job_id, **fields):
+        """Merge fields into a job; returns False if the job no longer exists"""
+        with self._lock:
+            changed = self.store.merge(job_id, fields)
+            if changed is None:
+                return False
+            if changed:
+                if fields.get('status') in TERMINAL_STATUSES:
+                    self._evict()
+                self._publish(job_id)
+            return True
+
+    def complete(self, job_id, **fields):
+        return self.update(job_id, percent=100, status='complete', **fields)
+
+    def fail(self, job_id, error, **fields):
+        """Replace a job's state with an error, keeping only the fields in KEPT_ON_FAIL"""
+        with self._lock:
+            job = self.store.get(job_id) or {}
+            kept = {key: job[key] for key in self.KEPT_ON_FAIL if key in job}
+            if not self.store.replace(job_id, dict(kept, **fields, error=error, status='error')):
+                return False
+            self._evict()
+            self._publish(job_id)
+            return True
+
+    def remove(self, job_id):
+        with self._lock:
+            removed = self.store.delete(job_id)
+            self._publish(job_id)
+            return removed
+
+    def subscribe(self, job_ids=(), client_id=None):
+        """Watch one or more jobs for changes.
+
+        With ``client_id``, the subscription also covers every existing and
+        future job attached to that client session.
+        """
+        return self._subscribe(Subscription, job_ids, client_id)
+
+    def subscribe_async(self, job_ids=(), client_id=None):
+        """Like subscribe(), for a coroutine running on the current event loop"""
+        return self._subscribe(AsyncSubscription, job_ids, client_id)
+
+    def _subscribe(self, subscription_class, job_ids, client_id):
+        if isinstance(job_ids, str):
+            job_ids = [job_ids]
+        job_ids = set(job_ids)
+        with self._lock:
+            if client_id:
+                job_ids.update(self.job_ids_for_client(client_id))
+            subscription = subscription_class(self, job_ids, client_id=client_id)
+            for job_id in subscription.job_ids:
+                self._subscribers[job_id].add(subscription)
+            if client_id:
+                self._client_subscribers[client_id].add(subscription)
+        self._ensure_poller()
+        return subscription
+
+    def watch(self, subscription, job_id):
+        with self._lock:
+            self._watch(subscription, job_id)
+
+    def unwatch(self, subscription, job_id):
+        with self._lock:
+            subscription.job_ids.discard(job_id)
+            self._discard_subscriber(job_id, subscription)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for job_id in subscription.job_ids:
+                self._discard_subscriber(job_id, subscription)
+            if subscription.client_id:
+                subscribers = self._client_subscribers.get(subscription.client_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._client_subscribers[subscription.client_id]
+
+    def job_ids_for_client(self, client_id):
+        return self.store.client_jobs(client_id)
+
+    def __contains__(self, job_id):
+        return job_id in self.store
+
+    def __len__(self):
+        return len(self.store)
+
+    def stats(self):
+        with self._lock:
+            subscribers = sum(len(subs) for subs in self._subscribers.values())
+        return {
+            'store': type(self.store).__name__,
+            'jobs': len(self.store),
+            'finished': self.store.count_finished(),
+            'evicted': self.evicted,
+            'subscribers': subscribers,
+        }
+
+    def _watch(self, subscription, job_id):
+        subscription.job_ids.add(job_id)
+        self._subscribers[job_id].add(subscription)
+        subscription.notify(job_id)
+
+    def _attach_client(self, job_id, client_id):
+        attached = self.store.attach_client(job_id, client_id)
+        if attached:
+            self._client_attached(job_id, client_id)
+        return attached
+
+    def _client_attached(self, job_id, client_id):
+        # Session-wide subscribers pick up new jobs from their client
+        for subscription in list(self._client_subscribers.get(client_id, ())):
+            self._watch(subscription, job_id)
+
+    def _discard_subscriber(self, job_id, subscription):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    def _publish(self, job_id):
+        for subscription in self._subscribers.get(job_id, ()):
+            subscription.notify(job_id)
+
+    def _evict(self):
+        for job_id in self.store.evict(self.ttl, self.max_finished):
+            self.evicted += 1
+            self._publish(job_id)
+
+    def _ensure_poller(self):
+        if not self.store.shared:
+            return
+        with self._lock:
+            if self._poller is not None:
+                return
+            self._poller = threading.Thread(target=self._poll_loop, name="job-store-poller", daemon=True)
+            self._poller.start()
+
+    def _poll_loop(self):
+        # Relay changes made by other processes to subscribers in this one
+        cursor, _ = self.store.changes_since(None)
+        while True:
+            try:
+                cursor, changes = self.store.changes_since(cursor)
+                if changes:
+                    with self._lock:
+                        for job_id, client_id in changes:
+                            if client_id:
+                                self._client_attached(job_id, client_id)
+                            self._publish(job_id)
+            except Exception as e:
+                logger.error(f"Error polling job store: {str(e)}")
+            time.sleep(self.poll_interval)
@@ -0,0 +1,335 @@
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('complete', 'error')
+
+# How long change records are kept for other processes to pick up
+CHANGE_RETENTION = 300
+
+# How often a process deletes change records older than CHANGE_RETENTION
+CHANGE_PRUNE_INTERVAL = 60
+
+
+class MemoryJobStore:
+    """Job state held in this process only (single worker, tests)"""
+
+    # Other processes cannot see these jobs, so there is nothing to poll
+    shared = False
+
+    def __init__(self):
+        self._jobs = {}
+        self._finished = collections.OrderedDict()
+        self._client_jobs = collections.defaultdict(set)
+        self._job_clients = {}
+        self._lock = threading.RLock()
+
+    def create(self, job_id, fields):
+        with self._lock:
+            self._jobs[job_id] = dict(fields)
+            self._finished.pop(job_id, None)
+            if fields.get('status') in TERMINAL_STATUSES:
+                self._mark_finished(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job_id in self._finished:
+                self._mark_finished(job_id)
+            return dict(job)
+
+    def merge(self, job_id, fields):
+        """Merge fields into a job: None if unknown, False if nothing changed, else True"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if all(job.get(key) == value for key, value in fields.items()):
+                return False
+            job.update(fields)
+            if job.get('status') in TERMINAL_STATUSES:
+                self._mark_finished(job_id)
+            return True
+
+    def replace(self, job_id, fields):
+        with self._lock:
+            if job_id not in self._jobs:
+                return False
+            self._jobs[job_id] = dict(fields)
+            if fields.get('status') in TERMINAL_STATUSES:
+                self._mark_finished(job_id)
+            return True
+
+    def delete(self, job_id):
+        with self._lock:
+            self._finished.pop(job_id, None)
+            self._detach_clients(job_id)
+            return self._jobs.pop(job_id, None) is not None
+
+    def attach_client(self, job_id, client_id):
+        """None if the job is unknown, False if already attached, True if newly attached"""
+        with self._lock:
+            if job_id not in self._jobs:
+                return None
+            clients = self._job_clients.setdefault(job_id, set())
+            if client_id in clients:
+                return False
+            clients.add(client_id)
+            self._client_jobs[client_id].add(job_id)
+            return True
+
+    def client_jobs(self, client_id):
+        with self._lock:
+            return list(self._client_jobs.get(client_id, ()))
+
+    def evict(self, ttl, max_finished):
+        """Drop finished jobs idle for over ttl seconds, then the least recently used beyond max_finished"""
+        evicted = []
+        with self._lock:
+            cutoff = time.time() - ttl
+            while self._finished:
+                job_id, touched_at = next(iter(self._finished.items()))
+                if touched_at > cutoff and len(self._finished) <= max_finished:
+                    break
+                del self._finished[job_id]
+                self._jobs.pop(job_id, None)
+                self._detach_clients(job_id)
+                evicted.append(job_id)
+        return evicted
+
+    def changes_since(self, cursor):
+        return cursor, []
+
+    def __contains__(self, job_id):
+        with self._lock:
+            return job_id in self._jobs
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def count_finished(self):
+        with self._lock:
+            return len(self._finished)
+
+    def _mark_finished(self, job_id):
+        self._finished[job_id] = time.time()
+        self._finished.move_to_end(job_id)
+
+    def _detach_clients(self, job_id):
+        for client_id in self._job_clients.pop(job_id, ()):
+            jobs = self._client_jobs.get(client_id)
+            if jobs is not None:
+                jobs.discard(job_id)
+                if not jobs:
+                    del self._client_jobs[client_id]
+
+
+class SQLiteJobStore:
+    """Job state in a SQLite database (WAL mode) shared by every worker process.
+
+    Each write also appends a row to a ``changes`` log tagged with the
+    writing process, which other processes poll through ``changes_since``
+    to wake their own subscribers. Connections are per thread.
+    """
+
+    shared = True
+
+    # Finished jobs only have their LRU timestamp refreshed this often on reads
+    TOUCH_INTERVAL = 5.0
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._next_prune = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                finished_at REAL,
+                touched_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (touched_at) WHERE finished_at IS NOT NULL;
+            CREATE TABLE IF NOT EXISTS job_clients (
+                job_id TEXT NOT NULL,
+                client_id TEXT NOT NULL,
+                PRIMARY KEY (job_id, client_id)
+            );
+            CREATE INDEX IF NOT EXISTS job_clients_client ON job_clients (client_id);
+            CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                client_id TEXT,
+                origin INTEGER NOT NULL,
+                at REAL NOT NULL
+            );
+        """)
+
+    def create(self, job_id, fields):
+        now = time.time()
+        finished_at = now if fields.get('status') in TERMINAL_STATUSES else None
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO jobs (job_id, data, finished_at, touched_at) VALUES (?, ?, ?, ?)",
+                       (job_id, json.dumps(fields), finished_at, now))
+            self._log_change(db, job_id)
+
+    def get(self, job_id):
+        row = self._connection().execute(
+            "SELECT data, finished_at, touched_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        data, finished_at, touched_at = row
+        if finished_at is not None and time.time() - touched_at > self.TOUCH_INTERVAL:
+            with self._transaction() as db:
+                db.execute("UPDATE jobs SET touched_at = ? WHERE job_id = ?", (time.time(), job_id))
+        return json.loads(data)
+
+    def merge(self, job_id, fields):
+        """Merge fields into a job: None if unknown, False if nothing changed, else True"""
+        with self._transaction() as db:
+            row = db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = json.loads(row[0])
+            # Compare as stored, so tuples and lists count as equal
+            fields = json.loads(json.dumps(fields))
+            if all(job.get(key) == value for key, value in fields.items()):
+                return False
+            job.update(fields)
+            self._write(db, job_id, job)
+            return True
+
+    def replace(self, job_id, fields):
+        with self._transaction() as db:
+            if db.execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone() is None:
+                return False
+            self._write(db, job_id, fields)
+            return True
+
+    def delete(self, job_id):
+        with self._transaction() as db:
+            deleted = db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,)).rowcount > 0
+            db.execute("DELETE FROM job_clients WHERE job_id = ?", (job_id,))
+            self._log_change(db, job_id)
+            return deleted
+
+    def attach_client(self, job_id, client_id):
+        """None if the job is unknown, False if already attached, True if newly attached"""
+        with self._transaction() as db:
+            if db.execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone() is None:
+                return None
+            inserted = db.execute("INSERT OR IGNORE INTO job_clients (job_id, client_id) VALUES (?, ?)",
+                                  (job_id, client_id)).rowcount > 0
+            if inserted:
+                self._log_change(db, job_id, client_id)
+            return inserted
+
+    def client_jobs(self, client_id):
+        rows = self._connection().execute("SELECT job_id FROM job_clients WHERE client_id = ?", (client_id,))
+        return [row[0] for row in rows]
+
+    def evict(self, ttl, max_finished):
+        """Drop finished jobs idle for over ttl seconds, then the least recently used beyond max_finished"""
+        now = time.time()
+        with self._transaction() as db:
+            expired = db.execute(
+                "SELECT job_id FROM jobs WHERE finished_at IS NOT NULL AND touched_at < ?", (now - ttl,)).fetchall()
+            overflow = db.execute(
+                "SELECT job_id FROM jobs WHERE finished_at IS NOT NULL AND touched_at >= ? "
+                "ORDER BY touched_at DESC LIMIT -1 OFFSET ?", (now - ttl, max_finished)).fetchall()
+            evicted = [row[0] for row in expired + overflow]
+            for job_id in evicted:
+                db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+                db.execute("DELETE FROM job_clients WHERE job_id = ?", (job_id,))
+                self._log_change(db, job_id)
+        return evicted
+
+    def changes_since(self, cursor):
+        """(new_cursor, [(job_id, client_id), ...]) written by other processes after cursor"""
+        db = self._connection()
+        if cursor is None:
+            return db.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0], []
+        # data_version only moves when another connection commits, so idle polls stay cheap
+        version = db.execute("PRAGMA data_version").fetchone()[0]
+        if version == getattr(self._local, 'data_version', None):
+            return cursor, []
+        self._local.data_version = version
+        rows = db.execute("SELECT seq, job_id, client_id FROM changes WHERE seq > ? AND origin != ? ORDER BY seq",
+                          (cursor, os.getpid())).fetchall()
+        if rows:
+            cursor = rows[-1][0]
+        return cursor, [(job_id, client_id) for _, job_id, client_id in rows]
+
+    def __contains__(self, job_id):
+        return self._connection().execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone() is not None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def count_finished(self):
+        return self._connection().execute("SELECT COUNT(*) FROM jobs WHERE finished_at IS NOT NULL").fetchone()[0]
+
+    def _write(self, db, job_id, job):
+        now = time.time()
+        finished_at = now if job.get('status') in TERMINAL_STATUSES else None
+        db.execute("UPDATE jobs SET data = ?, finished_at = ?, touched_at = ? WHERE job_id = ?",
+                   (json.dumps(job), finished_at, now, job_id))
+        self._log_change(db, job_id)
+
+    def _log_change(self, db, job_id, client_id=None):
+        now = time.time()
+        db.execute("INSERT INTO changes (job_id, client_id, origin, at) VALUES (?, ?, ?, ?)",
+                   (job_id, client_id, os.getpid(), now))
+        # Pruned on a timer rather than on eviction, which only runs when jobs finish
+        if now >= self._next_prune:
+            self._next_prune = now + CHANGE_PRUNE_INTERVAL
+            db.execute("DELETE FROM changes WHERE at < ?", (now - CHANGE_RETENTION,))
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        # A forked worker must not reuse its parent's connection
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                 check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, so read-modify-write is atomic across processes
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def make_job_store(kind='sqlite', path=None):
+    """Job store by name: 'sqlite' (shared between worker processes) or 'memory'"""
+    if kind == 'memory':
+        return MemoryJobStore()
+    if kind == 'sqlite':
+        return SQLiteJobStore(path or os.path.join('/tmp', 'jobs.sqlite3'))
+    raise ValueError(f"Unknown job store: {kind}")
@@ -0,0 +1,66 @@
+import contextlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class JobTracer:
+    """Timestamped spans per job, to see where a slow job spent its time.
+
+    Spans are kept in memory while the job runs and handed to ``publish``
+    (job_id, trace) as each one ends, so the trace can live on the job and
+    be read from any process that shares the job store. Span offsets are
+    seconds since the job was queued.
+    """
+
+    def __init__(self, publish, max_spans=200):
+        self.publish = publish
+        self.max_spans = max_spans
+        self._traces = {}
+        self._lock = threading.Lock()
+
+    def start(self, job_id, started_at=None):
+        with self._lock:
+            self._traces[job_id] = {'started_at': started_at or time.time(), 'spans': []}
+
+    def started_at(self, job_id):
+        with self._lock:
+            trace = self._traces.get(job_id)
+            return trace['started_at'] if trace else None
+
+    @contextlib.contextmanager
+    def span(self, job_id, name, **attrs):
+        """Record the block as a span; yields its attributes so the block can add to them"""
+        started = time.time()
+        try:
+            yield attrs
+        except Exception as e:
+            attrs['error'] = str(e)
+            raise
+        finally:
+            self.add(job_id, name, started, time.time(), **attrs)
+
+    def add(self, job_id, name, start, end, **attrs):
+        with self._lock:
+            trace = self._traces.get(job_id)
+            if trace is None:
+                # Started in another process (or before a restart); trace from here on
+                trace = self._traces[job_id] = {'started_at': start, 'spans': []}
+            if len(trace['spans']) >= self.max_spans:
+                trace['truncated'] = True
+                return
+            span = {'name': name, 'start': round(start - trace['started_at'], 4), 'seconds': round(end - start, 4)}
+            span.update(attrs)
+            trace['spans'].append(span)
+            snapshot = dict(trace, spans=list(trace['spans']))
+
+        try:
+            self.publish(job_id, snapshot)
+        except Exception as e:
+            logger.error(f"Error publishing trace for {job_id}: {str(e)}")
+
+    def finish(self, job_id):
+        with self._lock:
+            self._traces.pop(job_id, None)
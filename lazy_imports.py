@@ -0,0 +1,31 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    ``on_load(module)`` runs once, after the import, for setup that used to
+    happen at the importer's import time.
+    """
+
+    def __init__(self, name, on_load=None):
+        self._name = name
+        self._on_load = on_load
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._load()
+        return getattr(module, attr)
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                module = importlib.import_module(self._name)
+                if self._on_load is not None:
+                    self._on_load(module)
+                self._module = module
+            return self._module
@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RangeDownloadError(Exception):
+    """Raised when a ranged download cannot be completed"""
+
+
+class ConnectionBudget:
+    """Process-wide cap on connections used by parallel downloads.
+
+    Each job asks for the number of connections it wants and gets what is
+    left, but never less than one, so a busy server degrades to
+    single-connection downloads instead of queueing.
+    """
+
+    def __init__(self, max_connections=16):
+        self.max_connections = max_connections
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, wanted):
+        with self._lock:
+            granted = max(1, min(wanted, self.max_connections - self._in_use))
+            self._in_use += granted
+            return granted
+
+    def release(self, granted):
+        with self._lock:
+            self._in_use = max(0, self._in_use - granted)
+
+    def stats(self):
+        with self._lock:
+            return {'in_use': self._in_use, 'max_connections': self.max_connections}
+
+
+def probe_range_support(url, headers=None, timeout=30, session=None):
+    """Total size in bytes if the server honours byte ranges, else None"""
+    # requests is imported on first use to keep it out of app startup
+    import requests
+
+    try:
+        response = (session or requests).get(url, headers=dict(headers or {}, Range='bytes=0-0'), stream=True, timeout=timeout)
+        response.close()
+    except requests.RequestException as e:
+        logger.debug(f"Range probe failed for {url}: {str(e)}")
+        return None
+    content_range = response.headers.get('Content-Range', '')
+    if response.status_code != 206 or '/' not in content_range:
+        return None
+    total = content_range.rsplit('/', 1)[1]
+    return int(total) if total.isdigit() else None
+
+
+def fetch_ranged(url, dest, total_bytes, headers=None, connections=4, piece_size=4 * 1024 * 1024,
+                 progress_hook=None, info_dict=None, timeout=30, retries=3, resume=True, session=None):
+    """Download url to dest over several connections, writing pieces in order.
+
+    The file is split into ``piece_size`` pieces fetched by ``connections``
+    worker threads. Pieces are appended to ``dest + '.part'`` strictly in
+    order, so the partial file always holds a playable prefix (and can be
+    tailed by /stream); at most ``2 * connections`` pieces are held in memory
+    waiting for an earlier piece. ``progress_hook`` receives yt-dlp style
+    dicts. The finished file is renamed to dest, which is returned.
+
+    With ``resume`` an existing ``.part`` file is kept: because it is only
+    ever written in order, every whole piece already in it is valid and the
+    download continues from there. Pass a requests ``session`` to reuse its
+    keep-alive connections.
+    """
+    import requests
+
+    http = session or requests
+    part_path = dest + '.part'
+    piece_count = (total_bytes + piece_size - 1) // piece_size
+    window = 2 * connections
+
+    first_piece = 0
+    if resume and os.path.exists(part_path):
+        first_piece = min(os.path.getsize(part_path) // piece_size, piece_count)
+        if first_piece:
+            logger.debug(f"Resuming {dest} from byte {first_piece * piece_size}")
+
+    cond = threading.Condition()
+    pieces = {}
+    state = {'next_piece': first_piece, 'next_write': first_piece, 'error': None, 'received': 0}
+
+    def fetch_piece(index):
+        start = index * piece_size
+        end = min(start + piece_size, total_bytes) - 1
+        last_error = None
+        for attempt in range(retries):
+            try:
+                response = http.get(url, headers=dict(headers or {}, Range=f'bytes={start}-{end}'), timeout=timeout)
+                if response.status_code != 206 or len(response.content) != end - start + 1:
+                    raise RangeDownloadError(f"Bad response for bytes {start}-{end}: HTTP {response.status_code}")
+                return response.content
+            except (requests.RequestException, RangeDownloadError) as e:
+                last_error = e
+                time.sleep(0.5 * (attempt + 1))
+        raise RangeDownloadError(f"Could not fetch bytes {start}-{end}: {str(last_error)}")
+
+    def worker():
+        while True:
+            with cond:
+                # Don't run too far ahead of the writer
+                while (state['error'] is None and state['next_piece'] < piece_count
+                       and state['next_piece'] >= state['next_write'] + window):
+                    cond.wait()
+                if state['error'] is not None or state['next_piece'] >= piece_count:
+                    return
+                index = state['next_piece']
+                state['next_piece'] += 1
+            try:
+                data = fetch_piece(index)
+            except Exception as e:
+                with cond:
+                    state['error'] = e
+                    cond.notify_all()
+                return
+            with cond:
+                pieces[index] = data
+                state['received'] += len(data)
+                cond.notify_all()
+
+    workers = [threading.Thread(target=worker, name=f"range-fetch-{i}", daemon=True)
+               for i in range(max(1, min(connections, piece_count - first_piece)))]
+    for thread in workers:
+        thread.start()
+
+    started = time.monotonic()
+    written = first_piece * piece_size
+    try:
+        with open(part_path, 'r+b' if first_piece else 'wb') as f:
+            # Drop any partial piece past the last whole one
+            f.truncate(written)
+            f.seek(written)
+            for index in range(first_piece, piece_count):
+                with cond:
+                    while index not in pieces and state['error'] is None:
+                        cond.wait()
+                    if index not in pieces:
+                        raise RangeDownloadError(str(state['error']))
+                    data = pieces.pop(index)
+                    state['next_write'] = index + 1
+                    cond.notify_all()
+
+                f.write(data)
+                f.flush()
+                written += len(data)
+
+                if progress_hook:
+                    elapsed = max(time.monotonic() - started, 1e-6)
+                    speed = state['received'] / elapsed
+                    progress_hook({
+                        'status': 'downloading',
+                        'downloaded_bytes': written,
+                        'total_bytes': total_bytes,
+                        'speed': speed,
+                        'eta': int((total_bytes - written) / speed) if speed else None,
+                        'filename': dest,
+                        'tmpfilename': part_path,
+                        'info_dict': info_dict or {},
+                    })
+    except BaseException:
+        # Stop the workers; the .part file keeps its in-order prefix for a later resume
+        with cond:
+            if state['error'] is None:
+                state['error'] = RangeDownloadError("Download aborted")
+            cond.notify_all()
+        raise
+    finally:
+        for thread in workers:
+            thread.join(timeout)
+
+    os.replace(part_path, dest)
+    if progress_hook:
+        progress_hook({
+            'status': 'finished',
+            'downloaded_bytes': written,
+            'total_bytes': total_bytes,
+            'filename': dest,
+            'info_dict': info_dict or {},
+        })
+    return dest
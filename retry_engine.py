@@ -0,0 +1,176 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Coarse error classes, matched in order against the error message
+ERROR_CLASSES = (
+    ('bot_detection', ("not a bot", "automated access")),
+    ('rate_limited', ("http error 429", "too many requests")),
+    ('forbidden', ("http error 403", "forbidden")),
+    ('ffmpeg_missing', ("ffmpeg is not installed", "ffmpeg not found")),
+    ('unavailable', ("private video", "video unavailable", "not available", "removed")),
+    ('not_found', ("not found", "404")),
+    ('network', ("timed out", "timeout", "connection", "network", "incompleteread", "bytes, expected")),
+    ('server_error', ("http error 5",)),
+)
+
+# Retries allowed per error class (counted separately per class within one run();
+# classes not listed fail at once)
+RETRY_LIMITS = {
+    'network': 3,
+    'server_error': 3,
+    'rate_limited': 3,
+    'forbidden': 2,
+    'bot_detection': 1,
+    'other': 1,
+}
+
+# Errors that mean the host is refusing us, which is what trips the circuit breaker
+BLOCKING_CLASSES = frozenset(('bot_detection', 'rate_limited', 'forbidden'))
+
+HOST_ALIASES = {'youtu.be': 'youtube.com'}
+
+
+def classify_error(message):
+    message = str(message).lower()
+    for error_class, needles in ERROR_CLASSES:
+        if any(needle in message for needle in needles):
+            return error_class
+    return 'other'
+
+
+def host_key(url):
+    """The site a URL belongs to, e.g. 'youtube.com' for www/m/music.youtube.com and youtu.be"""
+    host = (urlparse(url).hostname or '').lower()
+    host = '.'.join(host.split('.')[-2:])
+    return HOST_ALIASES.get(host, host)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of trying a host that is currently blocking us"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"{host} is refusing requests; not retrying for {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class RetryEngine:
+    """Retries with per-host exponential backoff and a per-host circuit breaker.
+
+    run() calls ``fn(attempt)`` until it succeeds, an error class runs out
+    of retries (RETRY_LIMITS) or ``max_retries`` retries were made. The
+    wait before a retry grows with the host's current run of consecutive
+    failures, shared by every job on that host, so concurrent jobs back off
+    together; it is jittered between half and all of
+    ``base_delay * 2 ** (failures - 1)``, capped at ``max_delay``.
+
+    ``failure_threshold`` consecutive blocking errors (BLOCKING_CLASSES) open
+    the host's circuit: for ``cooldown`` seconds run() raises
+    CircuitOpenError without calling fn. After that a single attempt is let
+    through; its success closes the circuit, another blocking error opens it
+    again.
+    """
+
+    def __init__(self, base_delay=1.0, max_delay=60.0, failure_threshold=5, cooldown=300.0, limits=None,
+                 max_retries=5, sleep=time.sleep):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.limits = dict(RETRY_LIMITS, **(limits or {}))
+        self.max_retries = max_retries
+        self.sleep = sleep
+        self._hosts = {}
+        self._retries = {}
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def run(self, host, fn, on_retry=None, retry=True):
+        """fn(attempt)'s result; ``on_retry(attempt, error_class, delay, error)`` is called before each wait"""
+        attempt = 0
+        retried = {}
+        while True:
+            self.check(host)
+            try:
+                result = fn(attempt)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                error_class = classify_error(e)
+                failures = self.record_failure(host, error_class)
+                if (not retry or attempt >= self.max_retries or self.is_open(host)
+                        or retried.get(error_class, 0) >= self.limits.get(error_class, 0)):
+                    raise
+                retried[error_class] = retried.get(error_class, 0) + 1
+                attempt += 1
+                delay = self.delay(failures)
+                with self._lock:
+                    self._retries[error_class] = self._retries.get(error_class, 0) + 1
+                if on_retry is not None:
+                    on_retry(attempt, error_class, delay, e)
+                self.sleep(delay)
+            else:
+                self.record_success(host)
+                return result
+
+    def check(self, host):
+        """Raise CircuitOpenError if host's circuit is open; otherwise claim the trial attempt if due"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state['opened_at'] is None:
+                return
+            retry_after = state['opened_at'] + self.cooldown - time.time()
+            if retry_after > 0 or state['trial']:
+                self._rejected += 1
+                raise CircuitOpenError(host, max(retry_after, 0))
+            state['trial'] = True
+
+    def is_open(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            return state is not None and state['opened_at'] is not None
+
+    def record_success(self, host):
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def record_failure(self, host, error_class):
+        """Count a failure against host; returns its consecutive failures"""
+        with self._lock:
+            state = self._hosts.setdefault(host, {'failures': 0, 'blocking': 0, 'opened_at': None, 'trial': False})
+            state['failures'] += 1
+            if error_class in BLOCKING_CLASSES:
+                state['blocking'] += 1
+                if state['trial'] or state['blocking'] >= self.failure_threshold:
+                    if state['opened_at'] is None or state['trial']:
+                        logger.warning(f"Opening circuit for {host} after {state['blocking']} blocking errors")
+                    state['opened_at'] = time.time()
+            elif state['trial']:
+                # The host answered, just not with the media; it is not blocking us
+                state['opened_at'] = None
+                state['blocking'] = 0
+            state['trial'] = False
+            return state['failures']
+
+    def delay(self, failures):
+        cap = min(self.max_delay, self.base_delay * 2 ** max(failures - 1, 0))
+        return random.uniform(cap / 2, cap)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            hosts = {}
+            for host, state in self._hosts.items():
+                open_for = state['opened_at'] + self.cooldown - now if state['opened_at'] is not None else 0
+                hosts[host] = {
+                    'state': 'closed' if state['opened_at'] is None else 'open' if open_for > 0 else 'half-open',
+                    'failures': state['failures'],
+                    'blocking_failures': state['blocking'],
+                    'retry_after': round(max(open_for, 0), 1),
+                }
+            return {'hosts': hosts, 'retries': dict(self._retries), 'rejected': self._rejected}
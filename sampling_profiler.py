@@ -0,0 +1,90 @@
+import collections
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def fold_stack(frame, max_depth=128):
+    """Collapsed stack of a frame, outermost call first ("a;b;c")"""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Statistical profiler for selected jobs, cheap enough to run under real load.
+
+    A single background thread looks at the stacks of the threads currently
+    working on a profiled job every ``interval`` seconds and counts them per
+    job. Nothing is sampled while no job is profiled. Profiles are written in
+    the collapsed-stack format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self._targets = {}
+        self._samples = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @contextlib.contextmanager
+    def sample(self, key):
+        """Profile the calling thread under ``key`` for the duration of the block"""
+        ident = threading.get_ident()
+        with self._cond:
+            self._targets[ident] = key
+            self._samples.setdefault(key, collections.Counter())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._targets.pop(ident, None)
+
+    def write(self, key, path):
+        """Write and forget the samples taken for key; returns the sample count (0 writes nothing)"""
+        with self._cond:
+            counts = self._samples.pop(key, None)
+        if not counts:
+            return 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        return sum(counts.values())
+
+    def discard(self, key):
+        with self._cond:
+            self._samples.pop(key, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._targets:
+                    self._cond.wait()
+                targets = dict(self._targets)
+
+            frames = sys._current_frames()
+            with self._cond:
+                for ident, key in targets.items():
+                    frame = frames.get(ident)
+                    if frame is not None and key in self._samples:
+                        self._samples[key][fold_stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
@@ -0,0 +1,130 @@
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the download queue cannot accept another job"""
+
+    def __init__(self, retry_after):
+        super().__init__("Download queue is full")
+        self.retry_after = retry_after
+
+
+class DownloadScheduler:
+    """Fixed-size worker pool with a bounded queue and per-platform limits.
+
+    Jobs are started in submission order, except that a job whose platform is
+    already at its concurrency limit is skipped until a slot frees up, so a
+    burst of YouTube jobs cannot starve Instagram jobs (and vice versa).
+    """
+
+    def __init__(self, max_workers=4, max_queue=32, platform_limits=None, name='download'):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.platform_limits = dict(platform_limits or {})
+        self._pending = collections.OrderedDict()
+        self._active = collections.Counter()
+        self._cond = threading.Condition()
+        self._durations = collections.deque(maxlen=50)
+        self._workers = []
+        self._started = False
+
+    def start(self):
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"{self.name}-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, job_id, platform, target, *args, block=False):
+        """Queue a job and return its 1-based queue position.
+
+        A full queue raises QueueFullError, or with ``block`` waits for room.
+        """
+        self.start()
+        with self._cond:
+            while len(self._pending) >= self.max_queue:
+                if not block:
+                    raise QueueFullError(self.estimate_retry_after())
+                self._cond.wait()
+            self._pending[job_id] = (platform, target, args)
+            position = len(self._pending)
+            self._cond.notify()
+        return position
+
+    def queue_position(self, job_id):
+        """1-based position in the queue, or 0 if the job is running or unknown"""
+        with self._cond:
+            for position, pending_id in enumerate(self._pending, start=1):
+                if pending_id == job_id:
+                    return position
+        return 0
+
+    def pending_ids(self):
+        with self._cond:
+            return list(self._pending)
+
+    def cancel(self, job_id):
+        """Drop a job that has not started yet"""
+        with self._cond:
+            cancelled = self._pending.pop(job_id, None) is not None
+            self._cond.notify_all()
+            return cancelled
+
+    def estimate_retry_after(self):
+        """Seconds a rejected client should wait before retrying"""
+        average = sum(self._durations) / len(self._durations) if self._durations else 30
+        return max(1, int(average * max(1, len(self._pending)) / max(1, self.max_workers)))
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.max_workers,
+                'queued': len(self._pending),
+                'queue_limit': self.max_queue,
+                'active': dict(self._active),
+                'platform_limits': dict(self.platform_limits),
+            }
+
+    def _has_capacity(self, platform):
+        limit = self.platform_limits.get(platform)
+        return limit is None or self._active[platform] < limit
+
+    def _next_job(self):
+        # Called with the condition held
+        for job_id, (platform, target, args) in self._pending.items():
+            if self._has_capacity(platform):
+                del self._pending[job_id]
+                self._active[platform] += 1
+                return job_id, platform, target, args
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                # Room in the queue for blocked submitters
+                self._cond.notify_all()
+            job_id, platform, target, args = job
+            started = time.monotonic()
+            try:
+                target(*args)
+            except Exception as e:
+                logger.error(f"Unhandled error in download job {job_id}: {str(e)}")
+            finally:
+                with self._cond:
+                    self._active[platform] -= 1
+                    self._durations.append(time.monotonic() - started)
+                    # A platform slot freed up, so a skipped job may be runnable now
+                    self._cond.notify_all()
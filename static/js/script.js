@@ -22,6 +22,11 @@ document.addEventListener('DOMContentLoaded', function() {
     let selectedFormat = 'video';
     let eventSource = null;
     
+    // One progress stream per page, shared by every download in this session
+    const clientId = getClientId();
+    const progressHandlers = {};
+    const progressState = {};
+    
     // Format button click
     formatBtns.forEach(btn => {
         btn.addEventListener('click', function(e) {
@@ -215,6 +220,7 @@ document.addEventListener('DOMContentLoaded', function() {
         formData.append('url', url);
         formData.append('platform', platform);
         formData.append('format', selectedFormat);
+        formData.append('client_id', clientId);
         
         // Add quality for YouTube videos
         if (platform === 'youtube') {
@@ -237,40 +243,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 
                 const downloadId = data.download_id;
                 
-                // Connect to SSE endpoint for progress updates
-                if (eventSource) {
-                    eventSource.close();
-                }
-                
-                eventSource = new EventSource(`/progress/${downloadId}`);
-                
-                // Set a timeout to check download status if SSE fails
-                const progressCheckInterval = setInterval(() => {
-                    fetch(`/check_download/${downloadId}`)
-                        .then(response => response.json())
-                        .then(data => {
-                            if (data.error) {
-                                clearInterval(progressCheckInterval);
-                                return;
-                            }
-                            
-                            if (data.download_info.percent === 100 || data.download_info.status === 'complete') {
-                                clearInterval(progressCheckInterval);
-                                handleDownloadComplete(downloadId);
-                            }
-                        })
-                        .catch(error => {
-                            console.error('Error checking download status:', error);
-                        });
-                }, 5000); // Check every 5 seconds
-                
-                eventSource.onmessage = function(event) {
-                    const progress = JSON.parse(event.data);
-                    
+                // Receive progress updates over the shared session stream
+                watchDownload(downloadId, function(progress) {
                     // Check for errors
                     if (progress.error) {
-                        eventSource.close();
-                        clearInterval(progressCheckInterval);
                         showError(progress.error);
                         downloadProgress.classList.add('hidden');
                         return;
@@ -280,16 +256,9 @@ document.addEventListener('DOMContentLoaded', function() {
                     
                     // When download is complete
                     if (progress.percent === 100) {
-                        eventSource.close();
-                        clearInterval(progressCheckInterval);
                         handleDownloadComplete(downloadId);
                     }
-                };
-                
-                eventSource.onerror = function() {
-                    // Don't close the event source on error, let it try to reconnect
-                    console.log('SSE connection error, will try to reconnect...');
-                };
+                });
             })
             .catch(error => {
                 showError('Failed to start download. Please try again.');
@@ -335,6 +304,59 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Stable per-tab ID used to group this page's downloads on one progress stream
+    function getClientId() {
+        let id = sessionStorage.getItem('downloadClientId');
+        if (!id) {
+            id = (window.crypto && crypto.randomUUID)
+                ? crypto.randomUUID().replace(/-/g, '')
+                : Date.now().toString(36) + Math.random().toString(36).slice(2);
+            sessionStorage.setItem('downloadClientId', id);
+        }
+        return id;
+    }
+    
+    // Register a handler for a download and make sure the session stream is open
+    function watchDownload(downloadId, handler) {
+        progressHandlers[downloadId] = handler;
+        
+        // Replay anything that arrived before the handler was registered
+        if (progressState[downloadId]) {
+            dispatchProgress(downloadId);
+        }
+        
+        if (!eventSource) {
+            eventSource = new EventSource(`/progress?client=${encodeURIComponent(clientId)}`);
+            
+            eventSource.onmessage = function(event) {
+                // Events carry only the fields that changed; merge them into the job's state
+                const delta = JSON.parse(event.data);
+                progressState[delta.id] = Object.assign(progressState[delta.id] || {}, delta);
+                dispatchProgress(delta.id);
+            };
+            
+            eventSource.onerror = function() {
+                // Don't close the event source on error, let it try to reconnect
+                console.log('SSE connection error, will try to reconnect...');
+            };
+        }
+    }
+    
+    function dispatchProgress(downloadId) {
+        const handler = progressHandlers[downloadId];
+        const progress = progressState[downloadId];
+        if (!handler || !progress) {
+            return;
+        }
+        
+        // Stop tracking finished downloads
+        if (progress.error || progress.percent === 100) {
+            delete progressHandlers[downloadId];
+            delete progressState[downloadId];
+        }
+        handler(progress);
+    }
+    
     // Update progress bar and text
     function updateProgress(percent, speed, eta) {
         // Ensure percent is a number
@@ -0,0 +1,327 @@
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# ioctl request number for cloning a file's extents (Linux btrfs/xfs/bcachefs)
+FICLONE = 0x40049409
+
+
+def _reflink(src, dest):
+    """Copy-on-write clone of src into dest; returns False if unsupported"""
+    if fcntl is None:
+        return False
+    try:
+        with open(src, 'rb') as src_file, open(dest, 'wb') as dest_file:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(dest)
+        except OSError:
+            pass
+        return False
+
+
+def publish_file(src, dest):
+    """Make src available at dest, sharing its bytes whenever the filesystem allows.
+
+    Tries a hardlink, then a reflink, and only copies as a last resort. The
+    file appears at dest atomically (any previous file there is replaced).
+    Returns the method used: 'hardlink', 'reflink' or 'copy'.
+    """
+    staging_path = f"{dest}.{uuid.uuid4().hex[:8]}.partial"
+    try:
+        try:
+            os.link(src, staging_path)
+            method = 'hardlink'
+        except OSError:
+            if _reflink(src, staging_path):
+                method = 'reflink'
+            else:
+                shutil.copy2(src, staging_path)
+                method = 'copy'
+        os.replace(staging_path, dest)
+        return method
+    except Exception:
+        try:
+            os.remove(staging_path)
+        except OSError:
+            pass
+        raise
+
+
+class FinalizeStats:
+    """Running totals of how finished downloads were published"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs = {'hardlink': 0, 'reflink': 0, 'copy': 0}
+        self.bytes_written = 0
+        self.bytes_saved = 0
+        self.seconds = 0.0
+
+    def record(self, method, size, seconds):
+        with self._lock:
+            self.jobs[method] += 1
+            self.seconds += seconds
+            if method == 'copy':
+                self.bytes_written += size
+            else:
+                self.bytes_saved += size
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'jobs': dict(self.jobs),
+                'bytes_written': self.bytes_written,
+                'bytes_saved': self.bytes_saved,
+                'seconds': round(self.seconds, 3),
+            }
+
+
+# Leftovers of interrupted downloads: yt-dlp .part/.ytdl/fragment files,
+# unmerged per-format files (name.f137.mp4) and our own publish staging files
+PARTIAL_FILE_PATTERN = re.compile(r'(\.part|\.ytdl|\.temp|\.partial|\.part-Frag\d+)$|\.f\d+\.\w+$')
+
+
+class StorageManager:
+    """Keeps the download directories within a byte budget.
+
+    Files are grouped by inode, so a temp file and its hardlinked published
+    copy count (and are evicted) once. When usage passes the high watermark
+    of ``max_bytes`` (or free disk space drops below ``min_free_bytes``), the
+    least recently served groups are deleted until usage is back under the
+    low watermark. Files of unfinished jobs (recognised by a job ID in the
+    file name) and files served within the last ``serve_grace`` seconds are
+    never evicted. Partial files older than ``partial_max_age`` that belong
+    to no unfinished job are swept as orphans.
+
+    ``directories`` maps each managed directory to the file name prefixes it
+    manages there (None for every file). Scans run on a background thread
+    every ``interval`` seconds, or sooner after ``request_check()``; with
+    several worker processes only one of them scans at a time.
+    """
+
+    def __init__(self, directories, max_bytes, high_watermark=0.9, low_watermark=0.75, min_free_bytes=0,
+                 interval=60, partial_max_age=3600, serve_grace=600, live_job_ids=None, job_id_pattern=None,
+                 on_evict=None, lock_path=None):
+        self.directories = dict(directories)
+        self.max_bytes = max_bytes
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.min_free_bytes = min_free_bytes
+        self.interval = interval
+        self.partial_max_age = partial_max_age
+        self.serve_grace = serve_grace
+        self.live_job_ids = live_job_ids or (lambda: ())
+        self.job_id_pattern = job_id_pattern
+        self.on_evict = on_evict
+        self.lock_path = lock_path
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.usage_bytes = 0
+        self.files = 0
+        self.protected_bytes = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.orphans_removed = 0
+        self.orphan_bytes = 0
+        self.scans = 0
+        self.last_scan_seconds = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="storage-manager", daemon=True)
+        self._thread.start()
+
+    def request_check(self):
+        """Ask for a scan soon (e.g. after a download finished)"""
+        self._wakeup.set()
+
+    @staticmethod
+    def mark_served(path):
+        """Record that a file was just served: it becomes most recently used"""
+        try:
+            stat = os.stat(path)
+            # Only atime moves; mtime (and so ETag/Last-Modified) stays put
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except OSError:
+            pass
+
+    def check(self):
+        """Scan once: sweep orphans and evict down to the low watermark if needed"""
+        lock_file = self._acquire_scan_lock()
+        if lock_file is False:
+            return
+        started = time.monotonic()
+        try:
+            groups = self._scan()
+            live_ids = set(self.live_job_ids())
+            now = time.time()
+
+            usage = 0
+            protected_bytes = 0
+            files = sum(len(group['paths']) for group in groups.values())
+            candidates = []
+            for group in groups.values():
+                if self._is_live(group['paths'], live_ids):
+                    protected_bytes += group['size']
+                    usage += group['size']
+                    continue
+                if all(PARTIAL_FILE_PATTERN.search(path) for path in group['paths']):
+                    if now - group['mtime'] > self.partial_max_age:
+                        files -= self._remove(group, orphan=True)
+                        continue
+                usage += group['size']
+                if now - group['atime'] < self.serve_grace:
+                    protected_bytes += group['size']
+                else:
+                    candidates.append(group)
+
+            if self._over_budget(usage):
+                target = self.low_watermark * self.max_bytes
+                candidates.sort(key=lambda group: group['atime'])
+                for group in candidates:
+                    if usage <= target and not self._low_on_disk():
+                        break
+                    files -= self._remove(group)
+                    usage -= group['size']
+
+            with self._lock:
+                self.usage_bytes = usage
+                self.files = files
+                self.protected_bytes = protected_bytes
+                self.scans += 1
+                self.last_scan_seconds = time.monotonic() - started
+        finally:
+            if lock_file:
+                lock_file.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'usage_bytes': self.usage_bytes,
+                'max_bytes': self.max_bytes,
+                'high_watermark': self.high_watermark,
+                'low_watermark': self.low_watermark,
+                'files': self.files,
+                'protected_bytes': self.protected_bytes,
+                'evicted_files': self.evicted_files,
+                'evicted_bytes': self.evicted_bytes,
+                'orphans_removed': self.orphans_removed,
+                'orphan_bytes': self.orphan_bytes,
+                'scans': self.scans,
+                'last_scan_seconds': round(self.last_scan_seconds, 4),
+            }
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Storage check failed: {str(e)}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def _scan(self):
+        # inode -> {'paths', 'size', 'atime', 'mtime'}
+        groups = {}
+        for directory, prefixes in self.directories.items():
+            try:
+                entries = list(os.scandir(directory))
+            except OSError as e:
+                logger.error(f"Error scanning {directory}: {str(e)}")
+                continue
+            for entry in entries:
+                if prefixes is not None and not entry.name.startswith(tuple(prefixes)):
+                    continue
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                key = (stat.st_dev, stat.st_ino)
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = {'paths': [entry.path], 'size': stat.st_blocks * 512 or stat.st_size,
+                                   'atime': max(stat.st_atime, stat.st_mtime), 'mtime': stat.st_mtime}
+                else:
+                    group['paths'].append(entry.path)
+        return groups
+
+    def _is_live(self, paths, live_ids):
+        if not self.job_id_pattern or not live_ids:
+            return False
+        for path in paths:
+            match = self.job_id_pattern.search(os.path.basename(path))
+            if match and match.group(0) in live_ids:
+                return True
+        return False
+
+    def _over_budget(self, usage):
+        return usage > self.high_watermark * self.max_bytes or self._low_on_disk()
+
+    def _low_on_disk(self):
+        if not self.min_free_bytes:
+            return False
+        for directory in self.directories:
+            try:
+                if shutil.disk_usage(directory).free < self.min_free_bytes:
+                    return True
+            except OSError:
+                pass
+        return False
+
+    def _remove(self, group, orphan=False):
+        removed = []
+        for path in group['paths']:
+            try:
+                os.remove(path)
+                removed.append(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error removing {path}: {str(e)}")
+        if not removed:
+            return 0
+        with self._lock:
+            if orphan:
+                self.orphans_removed += len(removed)
+                self.orphan_bytes += group['size']
+            else:
+                self.evicted_files += len(removed)
+                self.evicted_bytes += group['size']
+        logger.debug(f"Storage manager removed {removed} ({'orphan' if orphan else 'evicted'})")
+        if self.on_evict:
+            self.on_evict(removed)
+        return len(removed)
+
+    def _acquire_scan_lock(self):
+        # Returns the open lock file, None when locking is unavailable, or False if another process holds it
+        if not self.lock_path or fcntl is None:
+            return None
+        try:
+            lock_file = open(self.lock_path, 'a')
+        except OSError:
+            return None
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        return lock_file
@@ -0,0 +1,107 @@
+import logging
+import re
+import shutil
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+VERSION_PATTERN = re.compile(r'version\s+(\S+)')
+
+
+def _run(args, timeout):
+    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout, check=False)
+    return result.stdout.decode('utf-8', 'replace')
+
+
+def _parse_names(output):
+    """Names from `ffmpeg -encoders` / `-muxers`: "<flags> <name[,name]> <description>" lines after a dashed line"""
+    names = set()
+    listing = False
+    for line in output.splitlines():
+        stripped = line.strip()
+        if not listing:
+            listing = bool(stripped) and set(stripped) == {'-'}
+            continue
+        parts = stripped.split()
+        if len(parts) >= 2:
+            names.update(parts[1].split(','))
+    return names
+
+
+class ToolchainRegistry:
+    """What the external media tools on this machine can do, probed once per process.
+
+    The first question about ffmpeg runs ``ffmpeg -version``, ``-encoders``
+    and ``-muxers`` (and ``ffprobe -version``) and caches the answers, so
+    jobs never spawn a process just to check for ffmpeg and importing the
+    app spawns none at all. Call refresh() after installing or upgrading
+    the tools.
+    """
+
+    def __init__(self, ffmpeg='ffmpeg', ffprobe='ffprobe', timeout=10):
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.timeout = timeout
+        self._capabilities = None
+        self._lock = threading.Lock()
+
+    def capabilities(self):
+        capabilities = self._capabilities
+        if capabilities is None:
+            with self._lock:
+                if self._capabilities is None:
+                    self._capabilities = self._probe()
+                capabilities = self._capabilities
+        return capabilities
+
+    def refresh(self):
+        with self._lock:
+            self._capabilities = None
+        return self.capabilities()
+
+    def ffmpeg_available(self):
+        return self.capabilities()['ffmpeg']['available']
+
+    def has_encoder(self, name):
+        return name in self.capabilities()['ffmpeg']['encoders']
+
+    def has_muxer(self, name):
+        return name in self.capabilities()['ffmpeg']['muxers']
+
+    def stats(self):
+        """Capabilities without the long encoder/muxer lists"""
+        capabilities = self.capabilities()
+        return {tool: {key: (len(value) if isinstance(value, (set, frozenset)) else value)
+                       for key, value in info.items()}
+                for tool, info in capabilities.items()}
+
+    def _probe(self):
+        return {'ffmpeg': self._probe_ffmpeg(), 'ffprobe': self._probe_tool(self.ffprobe)}
+
+    def _probe_tool(self, name):
+        path = shutil.which(name)
+        info = {'available': False, 'path': path, 'version': None}
+        if path is None:
+            return info
+        try:
+            output = _run([path, '-hide_banner', '-version'], self.timeout)
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.error(f"Error probing {name}: {str(e)}")
+            return info
+        match = VERSION_PATTERN.search(output)
+        info.update(available=True, version=match.group(1) if match else None)
+        return info
+
+    def _probe_ffmpeg(self):
+        info = self._probe_tool(self.ffmpeg)
+        info.update(encoders=frozenset(), muxers=frozenset())
+        if not info['available']:
+            return info
+        try:
+            info['encoders'] = frozenset(_parse_names(_run([info['path'], '-hide_banner', '-encoders'], self.timeout)))
+            info['muxers'] = frozenset(_parse_names(_run([info['path'], '-hide_banner', '-muxers'], self.timeout)))
+        except (OSError, subprocess.SubprocessError) as e:
+            # Presence is what matters most; the lists only refine it
+            logger.error(f"Error listing ffmpeg encoders/muxers: {str(e)}")
+        return info
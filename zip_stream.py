@@ -0,0 +1,131 @@
+import os
+import struct
+import time
+import zlib
+
+# Past these limits an archive needs ZIP64 records
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP32_MAX_ENTRIES = 0xFFFF
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_DATA_DESCRIPTOR = struct.Struct('<IIII')
+_DATA_DESCRIPTOR64 = struct.Struct('<IIQQ')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_END_RECORD64 = struct.Struct('<IQHHIIQQQQ')
+_END_LOCATOR64 = struct.Struct('<IIQI')
+
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+
+class ZipMember:
+    """A file to put in a streamed archive, with its size fixed up front"""
+
+    def __init__(self, path, name):
+        stat = os.stat(path)
+        self.path = path
+        self.name = name.encode('utf-8')
+        self.size = stat.st_size
+        self.dos_time, self.dos_date = _dos_datetime(stat.st_mtime)
+        self.crc = 0
+        self.offset = 0
+
+    @property
+    def zip64(self):
+        return self.size >= ZIP32_LIMIT
+
+    def local_header(self):
+        extra = b''
+        size = self.size
+        if self.zip64:
+            extra = struct.pack('<HHQQ', 0x0001, 16, self.size, self.size)
+            size = ZIP32_LIMIT
+        # The CRC is only known after the data, so it follows in a data descriptor
+        return _LOCAL_HEADER.pack(0x04034b50, 45 if self.zip64 else 20, _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8,
+                                  0, self.dos_time, self.dos_date, 0, size, size,
+                                  len(self.name), len(extra)) + self.name + extra
+
+    def data_descriptor(self):
+        if self.zip64:
+            return _DATA_DESCRIPTOR64.pack(0x08074b50, self.crc, self.size, self.size)
+        return _DATA_DESCRIPTOR.pack(0x08074b50, self.crc, self.size, self.size)
+
+    def central_header(self):
+        # Fields too large for 32 bits move to the ZIP64 extra field, in this order
+        values = []
+        size, offset = self.size, self.offset
+        if self.zip64:
+            values += [self.size, self.size]
+            size = ZIP32_LIMIT
+        if self.offset >= ZIP32_LIMIT:
+            values.append(self.offset)
+            offset = ZIP32_LIMIT
+        extra = struct.pack(f'<HH{len(values)}Q', 0x0001, 8 * len(values), *values) if values else b''
+        version = 45 if values else 20
+        return _CENTRAL_HEADER.pack(0x02014b50, version, version, _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8, 0,
+                                    self.dos_time, self.dos_date, self.crc, size, size,
+                                    len(self.name), len(extra), 0, 0, 0, 0, offset) + self.name + extra
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    year = min(max(t.tm_year, 1980), 2107)
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def _layout(members):
+    # Assign each member its offset; returns (central directory offset, central directory size)
+    offset = 0
+    for member in members:
+        member.offset = offset
+        offset += len(member.local_header()) + member.size + len(member.data_descriptor())
+    return offset, sum(len(member.central_header()) for member in members)
+
+
+def _end_records(members, cd_offset, cd_size):
+    records = b''
+    if len(members) >= ZIP32_MAX_ENTRIES or cd_offset >= ZIP32_LIMIT or cd_size >= ZIP32_LIMIT:
+        end64_offset = cd_offset + cd_size
+        records += _END_RECORD64.pack(0x06064b50, 44, 45, 45, 0, 0, len(members), len(members), cd_size, cd_offset)
+        records += _END_LOCATOR64.pack(0x07064b50, 0, end64_offset, 1)
+        count = min(len(members), ZIP32_MAX_ENTRIES)
+        return records + _END_RECORD.pack(0x06054b50, 0, 0, count, count, min(cd_size, ZIP32_LIMIT),
+                                          min(cd_offset, ZIP32_LIMIT), 0)
+    return _END_RECORD.pack(0x06054b50, 0, 0, len(members), len(members), cd_size, cd_offset, 0)
+
+
+def zip_size(members):
+    """Exact byte size of the archive stream_zip() will produce"""
+    cd_offset, cd_size = _layout(members)
+    return cd_offset + cd_size + len(_end_records(members, cd_offset, cd_size))
+
+
+def stream_zip(members, chunk_size=256 * 1024):
+    """Yield an uncompressed (stored) ZIP archive of members, file by file.
+
+    Media is already compressed, so entries are stored rather than deflated,
+    which keeps every size known in advance (see zip_size()) and the CPU cost
+    to a CRC. Only one chunk is held in memory at a time; each entry's CRC
+    goes in a data descriptor after its data, and the central directory is
+    sent last. A file that shrank since its size was taken raises OSError,
+    cutting the response short rather than producing a corrupt archive.
+    """
+    members = list(members)
+    cd_offset, cd_size = _layout(members)
+    for member in members:
+        yield member.local_header()
+        crc = 0
+        remaining = member.size
+        with open(member.path, 'rb') as f:
+            while remaining:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise OSError(f"{member.path} is shorter than when the archive was started")
+                crc = zlib.crc32(chunk, crc)
+                remaining -= len(chunk)
+                yield chunk
+        member.crc = crc
+        yield member.data_descriptor()
+    yield b''.join(member.central_header() for member in members)
+    yield _end_records(members, cd_offset, cd_size)